@@ -745,6 +745,50 @@ def _make_raw_bytes( byte_list ):
 
 import codecs
 
+def _make_utf32_typecodes():
+    """Picks the array typecodes used by the utf32 codec.
+
+    Returns a tuple (word_typecode, char_typecode).  The first is an
+    unsigned integer type exactly 32 bits wide.  The second is a
+    Unicode character type which is also 32 bits wide, so an array of
+    code points can be turned into a string without a Python loop; it
+    is None if this Python has no such type (narrow-Unicode builds).
+
+    """
+    import array
+    word_tc = None
+    for tc in ('I', 'L'):
+        if array.array(tc).itemsize == 4:
+            word_tc = tc
+            break
+    char_tc = None
+    for tc in ('w', 'u'):   # 'w' is newer, and 'u' is deprecated where it exists
+        try:
+            if array.array(tc).itemsize == 4:
+                char_tc = tc
+                break
+        except ValueError:
+            pass
+    return (word_tc, char_tc)
+
+def _make_utf32_plane_bytes():
+    """Returns the byte string of all the values the third byte of a
+    UTF-32 code point may have (the plane number), for the largest
+    code point this Python supports; the high byte is always zero.
+
+    """
+    import sys
+    return _make_raw_bytes( range(0, (sys.maxunicode >> 16) + 1) )
+
+def _make_surrogate_pattern():
+    """Compiles a regular expression which finds a UTF-16 surrogate
+    code point, U+D800 to U+DFFF, which UTF-32 does not allow.
+
+    """
+    import re
+    return re.compile( u'[\ud800-\udfff]' )
+
+
 class utf32(codecs.CodecInfo):
     """Unicode UTF-32 and UCS4 encoding/decoding support.
 
@@ -761,6 +805,14 @@ class utf32(codecs.CodecInfo):
     BOM_UTF32_BE = _make_raw_bytes([ 0, 0, 0xFE, 0xFF ])  #'\x00\x00\xfe\xff'
     BOM_UTF32_LE = _make_raw_bytes([ 0xFF, 0xFE, 0, 0 ])  #'\xff\xfe\x00\x00'
 
+    # The conversions are done a whole string at a time with arrays
+    # of 32-bit words, byte-swapped in bulk when needed.  Only when
+    # a string contains a surrogate or an invalid code point is it
+    # gone through character by character, to handle the error.
+    _word_typecode, _char_typecode = _make_utf32_typecodes()
+    _plane_bytes = _make_utf32_plane_bytes()
+    _surrogate_re = _make_surrogate_pattern()
+
     @staticmethod
     def lookup( name ):
         """A standard Python codec lookup function for UCS4/UTF32.
@@ -797,22 +849,7 @@ class utf32(codecs.CodecInfo):
         the beginning of the string, otherwise it will be omitted.
 
         """
-        import sys, struct
-
-        # Make a container that can store bytes
-        if _py_major >= 3:
-            f = bytearray()
-            write = f.extend
-            def tobytes():
-                return bytes(f)
-        else:
-            try:
-                import cStringIO as sio
-            except ImportError:
-                import StringIO as sio
-            f = sio.StringIO()
-            write = f.write
-            tobytes = f.getvalue
+        import sys, array
 
         if not endianness:
             endianness = sys.byteorder
@@ -824,31 +861,35 @@ class utf32(codecs.CodecInfo):
         else:
             raise ValueError("Invalid endianness %r: expected 'big', 'little', or None" % endianness)
 
-        pack = struct.pack
-        packspec = '>L' if big_endian else '<L'
+        if errors == 'ignore' or not utf32._surrogate_re.search( obj ):
+            words = utf32._code_points( obj )
+        else:
+            words = array.array( utf32._word_typecode )
+            for pos, c in enumerate(obj):
+                n = ord(c)
+                if 0xD800 <= n <= 0xDFFF: # surrogate codepoints are prohibited by UTF-32
+                    if errors == 'replace':
+                        n = 0xFFFD
+                    else:
+                        raise UnicodeEncodeError('utf32',obj,pos,pos+1,"surrogate code points from U+D800 to U+DFFF are not allowed")
+                words.append( n )
 
-        num_chars = 0
+        if big_endian != (sys.byteorder == 'big'):
+            words.byteswap()
+        if _py_major >= 3:
+            data = words.tobytes()
+        else:
+            data = words.tostring()
 
+        num_chars = len(words)
         if include_bom:
             if big_endian:
-                write( utf32.BOM_UTF32_BE )
+                data = utf32.BOM_UTF32_BE + data
             else:
-                write( utf32.BOM_UTF32_LE )
-            num_chars += 1
-
-        for pos, c in enumerate(obj):
-            n = ord(c)
-            if 0xD800 <= n <= 0xDFFF: # surrogate codepoints are prohibited by UTF-32
-                if errors == 'ignore':
-                    pass
-                elif errors == 'replace':
-                    n = 0xFFFD
-                else:
-                    raise UnicodeEncodeError('utf32',obj,pos,pos+1,"surrogate code points from U+D800 to U+DFFF are not allowed")
-            write( pack( packspec, n) )
+                data = utf32.BOM_UTF32_LE + data
             num_chars += 1
 
-        return (tobytes(), num_chars)
+        return (data, num_chars)
         
     @staticmethod
     def utf32le_encode( obj, errors='strict', include_bom=False ):
@@ -879,9 +920,8 @@ class utf32(codecs.CodecInfo):
         endian order is assumed.
 
         """
-        import struct, sys
+        import sys, array
         maxunicode = sys.maxunicode
-        unpack = struct.unpack
 
         # Detect BOM
         if obj.startswith( utf32.BOM_UTF32_BE ):
@@ -894,8 +934,6 @@ class utf32(codecs.CodecInfo):
             bom_endianness = None
             start = 0
 
-        num_bytes = start
-
         if endianness == None:
             if bom_endianness == None:
                 endianness = sys.byteorder.upper()[0]   # Assume platform default
@@ -911,16 +949,36 @@ class utf32(codecs.CodecInfo):
             raise UnicodeDecodeError('utf32',obj,start,len(obj),
                                      'Data length not a multiple of 4 bytes')
 
-        # Start decoding characters
+        # Read all the characters as 32-bit words at once
+        words = array.array( utf32._word_typecode )
+        if _py_major >= 3:
+            words.frombytes( memoryview(obj)[start:] )
+        else:
+            words.fromstring( obj[start:] )
+        if endianness != sys.byteorder.upper()[0]:
+            words.byteswap()
+        num_bytes = len(obj)
+
+        if not words:
+            return (u'', num_bytes)
+
+        # Code points out of range have a non-zero high byte or too
+        # large a plane byte, so look at every word's byte at once.
+        if endianness == 'B':
+            high, plane = obj[start::4], obj[start+1::4]
+        else:
+            high, plane = obj[start+3::4], obj[start+2::4]
+        if not high.translate(None, utf32._plane_bytes[:1]) \
+               and not plane.translate(None, utf32._plane_bytes):
+            s = utf32._string_from_words( words )
+            if not utf32._surrogate_re.search( s ):
+                return (s, num_bytes)
+
+        # Some code point is invalid, decode characters one at a time
         chars = []
-        packspec = '>L' if endianness=='B' else '<L'
-        i = 0
-        for i in range(start, len(obj), 4):
-            seq = obj[i:i+4]
-            n = unpack( packspec, seq )[0]
-            num_bytes += 4
-
+        for k, n in enumerate(words):
             if n > maxunicode or (0xD800 <= n <= 0xDFFF):
+                i = start + 4*k
                 if errors == 'strict':
                     raise UnicodeDecodeError('utf32',obj,i,i+4,'Invalid code point U+%04X' % n)
                 elif errors == 'replace':
@@ -942,6 +1000,40 @@ class utf32(codecs.CodecInfo):
                 chars.append( helpers.safe_unichr(n) )
         return (u''.join( chars ), num_bytes)
 
+    @staticmethod
+    def _code_points( s ):
+        """Returns an array of the code points of the characters in
+        the string s, as 32-bit words in native byte order.
+
+        """
+        import array
+        words = array.array( utf32._word_typecode )
+        if utf32._char_typecode and isinstance(s, unicode):
+            chars = array.array( utf32._char_typecode, s )
+            if _py_major >= 3:
+                words.frombytes( chars.tobytes() )
+            else:
+                words.fromstring( chars.tostring() )
+        else:
+            words.extend( map(ord, s) )
+        return words
+
+    @staticmethod
+    def _string_from_words( words ):
+        """Returns the Unicode string whose characters have the code
+        points in the array words; all must be valid for this Python.
+
+        """
+        import array
+        if utf32._char_typecode:
+            chars = array.array( utf32._char_typecode )
+            if _py_major >= 3:
+                chars.frombytes( words.tobytes() )
+            else:
+                chars.fromstring( words.tostring() )
+            return chars.tounicode()
+        return u''.join( map(unichr, words) )
+
     @staticmethod
     def utf32le_decode( obj, errors='strict' ):
         """Decodes a UTF-32LE (little endian) byte string into a Unicode string."""
@@ -953,6 +1045,31 @@ class utf32(codecs.CodecInfo):
         return utf32.decode( obj, errors=errors, endianness='B' )
 
 
+class _piecewise_encoder(codecs.IncrementalEncoder):
+    """An incremental encoder for codecs which do not have one of
+    their own, such as the UTF-32 ones above.
+
+    Each piece of text is encoded separately; any byte order mark
+    the codec puts in front is kept only for the first piece.
+
+    """
+    def __init__(self, codec_info, errors='strict'):
+        codecs.IncrementalEncoder.__init__(self, errors)
+        self.codec_info = codec_info
+        self.bom = None
+
+    def encode(self, input, final=False):
+        output = self.codec_info.encode( input, self.errors )[0]
+        if self.bom is None:
+            self.bom = self.codec_info.encode( u'', self.errors )[0]
+        elif self.bom and output.startswith( self.bom ):
+            output = output[len(self.bom):]
+        return output
+
+    def reset(self):
+        self.bom = None
+
+
 # ----------------------------------------------------------------------
 # Helper functions
 # ----------------------------------------------------------------------
@@ -1137,6 +1254,16 @@ class helpers(object):
                 cdk = utf32.lookup( encoding )
         return cdk
 
+    @staticmethod
+    def incremental_encoder_for( cdk, errors='strict' ):
+        """Returns an incremental encoder for the codec (a CodecInfo).
+
+        Codecs without one of their own get a _piecewise_encoder.
+        """
+        if getattr( cdk, 'incrementalencoder', None ):
+            return cdk.incrementalencoder( errors )
+        return _piecewise_encoder( cdk, errors )
+
     @staticmethod
     def auto_detect_encoding( s ):
         """Takes a string (or byte array) and tries to determine the Unicode encoding it is in.
@@ -1219,6 +1346,8 @@ class helpers(object):
 
         return encoding
 
+    _decoded_string = _namedtuple('DecodedString',['string','codec','bom'])
+
     @staticmethod
     def unicode_decode( txt, encoding=None ):
         """Takes a string (or byte array) and tries to convert it to a Unicode string.
@@ -1236,7 +1365,7 @@ class helpers(object):
 
         """
         if isinstance(txt, unicode):
-            res = _namedtuple('DecodedString',['string','codec','bom'])( txt, None, None )
+            res = helpers._decoded_string( txt, None, None )
         else:
             if encoding is None or encoding == 'auto':
                 encoding = helpers.auto_detect_encoding( txt )
@@ -1264,7 +1393,7 @@ class helpers(object):
             else:
                 bom = None
 
-            res = _namedtuple('DecodedString',['string','codec','bom'])( unitxt, cdk, bom )
+            res = helpers._decoded_string( unitxt, cdk, bom )
         return res
 
     @staticmethod
@@ -1412,6 +1541,27 @@ class helpers(object):
             n = (n * 2) + d
         return n
 
+    @staticmethod
+    def split_json_pointer( pointer ):
+        """Splits a JSON Pointer (RFC 6901) such as "/items/0/id" into
+        a tuple of its unescaped reference tokens.  The empty string
+        refers to the whole document and gives an empty tuple.
+        """
+        if not pointer:
+            return ()
+        if pointer[0] != '/':
+            raise ValueError('A JSON Pointer must be empty or begin with "/"', pointer)
+        return tuple([ unicode(token).replace(u'~1',u'/').replace(u'~0',u'~')
+                       for token in pointer[1:].split('/') ])
+
+    @staticmethod
+    def make_json_pointer( tokens ):
+        """Joins a sequence of reference tokens (object keys or array
+        indices) into a JSON Pointer string, see split_json_pointer().
+        """
+        return u''.join([ u'/' + unicode(token).replace(u'~',u'~0').replace(u'/',u'~1')
+                          for token in tokens ])
+
     @staticmethod
     def format_timedelta_iso( td ):
         """Encodes a datetime.timedelta into ISO-8601 Time Period format.
@@ -1440,10 +1590,163 @@ class helpers(object):
         return ''.join(a)
 
 
+def _make_run_pattern( chars, extra=u'', flags=0 ):
+    """Compiles a regular expression which matches a run of one or
+    more characters from the given set of characters.  The optional
+    'extra' argument is inserted as-is into the character class and
+    may be used for regular expression escapes like \\w.
+
+    """
+    import re
+    return re.compile( u'[' + u''.join([re.escape(c) for c in chars]) + extra + u']+', flags )
+
+def _make_run_patterns():
+    """Returns a dictionary mapping the well-known character predicate
+    functions from the helpers class into compiled regular expressions
+    that match an entire run of characters satisfying the predicate.
+
+    The regular expressions are not required to match every character
+    the predicate accepts, only a subset of them.  The buffered_stream
+    class always re-checks the first character after the match with
+    the predicate function itself.  This way, for example, the rarely
+    used Unicode space characters need not be enumerated up front.
+
+    """
+    import re
+    return {
+        helpers.is_hex_digit: _make_run_pattern( helpers.hexdigits ),
+        helpers.is_octal_digit: _make_run_pattern( helpers.octaldigits ),
+        helpers.is_binary_digit: _make_run_pattern( '01' ),
+        helpers.char_is_json_ws: _make_run_pattern( ' \t\n\r' ),
+        helpers.char_is_unicode_ws: _make_run_pattern( u' \t\n\r\f\v\u00a0\u2000\u2001\u2002\u2003\u2004'
+                                                       u'\u2005\u2006\u2007\u2008\u2009\u200a\u202f\u205f\u3000' ),
+        helpers.char_is_identifier_tail: _make_run_pattern( u'$\u200c\u200d', extra=u'\\w', flags=re.UNICODE ),
+        }
+
+def _make_rest_of_line_pattern():
+    """Compiles a regular expression which matches everything up to
+    and including the next line terminator (CR+LF being a single
+    terminator), or up to the end of the text.
+
+    """
+    import re
+    return re.compile( u'[^\r\n\u2028\u2029]*(?:\r\n|[\r\n\u2028\u2029])?' )
+
+def _make_string_span_pattern( quote ):
+    """Compiles a regular expression which matches a run of characters
+    inside a string literal, delimited by the given quotation mark,
+    that need no special handling.  It stops at the closing quote, a
+    backslash, a control character, or a high surrogate.
+
+    """
+    import re
+    return re.compile( u'[^' + re.escape(quote) + u'\\\\\x00-\x1f\ud800-\udbff]+' )
+
+def _make_structure_token_pattern( quotes, allow_comments=True ):
+    """Compiles a regular expression which finds each token of a JSON
+    document that matters to its structure: string literals (which
+    may be unterminated), comments, and the characters ":,[]{}".
+
+    Which kind of token was found is told by the match's lastindex.
+    The groups numbered 1 to len(quotes) are the closing quotation
+    mark of a string delimited by the corresponding one of the given
+    quotes; following them are a group for a colon or comma, one for
+    an opening bracket, and one for a closing bracket.  The lastindex
+    is None for an unterminated string or a comment.
+
+    """
+    import re
+    patterns = [ q + u'(?:[^\\\\' + q + u']+|\\\\[\\s\\S])*(?:(' + q + u')|)' for q in quotes ]
+    patterns.extend( [u'([:,])', u'([\\[{])', u'([\\]}])'] )
+    if allow_comments:
+        patterns.append( u'//[^\r\n\u2028\u2029]*|/\\*(?:[\\s\\S]*?\\*/|[\\s\\S]*)' )
+    return re.compile( u'|'.join(patterns) )
+
+def _make_nonbmp_pattern():
+    """Compiles a regular expression which finds a character outside
+    of the Unicode BMP; or returns None if Python only has 16-bit
+    characters, as then there are none.
+
+    """
+    import re
+    if helpers.maxunicode <= 0xffff:
+        return None
+    return re.compile( u'[\U00010000-\U0010ffff]' )
+
+def _make_strict_number_pattern():
+    """Compiles a regular expression which matches a number in the
+    strict JSON syntax.  The groups are the minus sign, the whole
+    number digits, the fraction digits, and the signed exponent.
+
+    """
+    import re
+    return re.compile( u'(-?)(0|[1-9][0-9]*)(?:\\.([0-9]+))?(?:[eE]([-+]?[0-9]+))?' )
+
+
 # ----------------------------------------------------------------------
 # File position indicator
 # ----------------------------------------------------------------------
 
+class line_index(object):
+    """An index of where each line starts within a text document, used
+    to convert a character offset into a line and column number.
+
+    The index is built on first use, so a document whose line numbers
+    are never asked for (the usual case when there are no errors)
+    costs nothing beyond holding a reference to the text.
+
+    Line and column numbers follow the same rules as the
+    position_marker class: lines are separated by any Unicode line
+    separator, with a CR+LF pair counted as a single separator.
+
+    If an origin position_marker is given then the text is a piece of
+    a larger document which begins at that position, and the offsets,
+    lines and columns are all those within the larger document.
+
+    """
+    def __init__(self, text=u'', origin=None):
+        self.__text = text
+        self.__origin = origin
+        self.__starts = None       # offset where each line begins
+        self.__crlf_starts = None  # the subset of those following a CR+LF
+
+    def __build(self):
+        import re
+        starts = [0]
+        crlf_starts = set()
+        for m in re.finditer( u'\r\n|[\r\n\u2028\u2029]', self.__text ):
+            if m.end() - m.start() == 2:
+                # The line begins after the CR, the LF does not add a column
+                starts.append( m.start() + 1 )
+                crlf_starts.add( m.start() + 1 )
+            else:
+                starts.append( m.end() )
+        self.__starts = starts
+        self.__crlf_starts = crlf_starts
+
+    def line_and_column(self, offset):
+        """Returns a tuple (line, column) for the given character
+        offset, where lines start at 1 and columns start at 0.
+
+        """
+        import bisect
+        if self.__starts is None:
+            self.__build()
+        origin = self.__origin
+        if origin is not None:
+            offset -= origin.char_position
+        i = bisect.bisect_right( self.__starts, offset ) - 1
+        start = self.__starts[i]
+        column = offset - start
+        if column > 0 and start in self.__crlf_starts:
+            column -= 1
+        if origin is None:
+            return (i + 1, column)
+        elif i == 0:
+            return (origin.line, origin.column + column)
+        return (origin.line + i, column)
+
+
 class position_marker(object):
     """A position marks a specific place in a text document.
     It consists of the following attributes:
@@ -1470,24 +1773,39 @@ class position_marker(object):
     buffered_stream class, if the document starts with a Unicode Byte
     Order Mark (BOM), the BOM prefix is NOT INCLUDED in the count.
 
+    If a line_index is given, then only the char_position is tracked
+    and the line and column are looked up in the index only when they
+    are asked for.  Otherwise the line and column are kept up to date
+    by every call to advance().
+
     """
-    def __init__(self, offset=0, line=1, column=0, text_after=None):
+    def __init__(self, offset=0, line=1, column=0, text_after=None, line_index=None):
         self.__char_position = offset
+        self.__line_index = line_index
+        if line_index is not None:
+            line = column = None  # Computed on demand
         self.__line = line
         self.__column = column
         self.__text_after = text_after
         self.__at_end = False
         self.__last_was_cr = False
 
+    def __find_line_and_column(self):
+        self.__line, self.__column = self.__line_index.line_and_column( self.__char_position )
+
     @property
     def line(self):
         """The current line within the document, starts at 1."""
+        if self.__line is None:
+            self.__find_line_and_column()
         return self.__line
     @property
     def column(self):
         """The current character column from the beginning of the
         document, starts at 0.
         """
+        if self.__column is None:
+            self.__find_line_and_column()
         return self.__column
     @property
     def char_position(self):
@@ -1533,8 +1851,8 @@ class position_marker(object):
         s = "%s(offset=%r,line=%r,column=%r" \
             % (self.__class__.__name__,
                self.__char_position,
-               self.__line,
-               self.__column)
+               self.line,
+               self.column)
         if self.text_after:
             s += ",text_after=%r" % (self.text_after,)
         s += ")"
@@ -1542,8 +1860,8 @@ class position_marker(object):
 
     def describe(self, show_text=True):
         """Returns a human-readable description of the position, in English."""
-        s = "line %d, column %d, offset %d" % (self.__line,
-                                               self.__column,
+        s = "line %d, column %d, offset %d" % (self.line,
+                                               self.column,
                                                self.__char_position)
         if self.at_start:
             s += " (AT-START)"
@@ -1561,6 +1879,7 @@ class position_marker(object):
         """Create a copy of the position object."""
         p = self.__class__()
         p.__char_position = self.__char_position
+        p.__line_index = self.__line_index
         p.__line = self.__line
         p.__column = self.__column
         p.text_after = self.__text_after
@@ -1568,6 +1887,23 @@ class position_marker(object):
         p.__last_was_cr = self.__last_was_cr
         return p
 
+    def relative_to( self, start ):
+        """Returns a new position for this same place within a larger
+        document, given the position in that larger document at which
+        the text this position refers to began.
+
+        """
+        if self.line == 1:
+            column = start.column + self.column
+        else:
+            column = self.column
+        p = self.__class__( start.char_position + self.char_position,
+                            start.line + self.line - 1,
+                            column )
+        p.text_after = self.__text_after
+        p.at_end = self.at_end
+        return p
+
     def rewind( self ):
         """Set the position to the start of the document."""
         if not self.at_start:
@@ -1582,20 +1918,36 @@ class position_marker(object):
         """Advance the position from its current place according to
         the given string of characters.
 
+        The whole string is accounted for at once, so advancing over
+        a long run of characters costs little more than advancing
+        over a single one.
+
         """
-        if s:
-            self.text_after = None
-        for c in s:
-            self.__char_position += 1
-            if c == '\n' and self.__last_was_cr:
-                self.__last_was_cr = False
-            elif helpers.char_is_unicode_eol(c):
-                self.__line += 1
-                self.__column = 0
-                self.__last_was_cr = (c == '\r')
-            else:
-                self.__column += 1
+        if not s:
+            return
+        self.text_after = None
+        n = len(s)
+        self.__char_position += n
+        if self.__line_index is not None:
+            self.__line = self.__column = None
+            return
+        if self.__last_was_cr and s[0] == '\n':
+            # Second half of a CR+LF pair, already counted as a new line
+            s = s[1:]
+            n -= 1
+            if not n:
                 self.__last_was_cr = False
+                return
+        # Find the last line terminator in the string, if any
+        k = max( s.rfind('\n'), s.rfind('\r'), s.rfind(u'\u2028'), s.rfind(u'\u2029') )
+        if k < 0:
+            self.__column += n
+        else:
+            self.__line += s.count('\n') + s.count('\r') \
+                           + s.count(u'\u2028') + s.count(u'\u2029') \
+                           - s.count('\r\n')
+            self.__column = n - k - 1
+        self.__last_was_cr = (s[-1] == '\r')
 
 # ----------------------------------------------------------------------
 # Buffered Stream Reader
@@ -1608,15 +1960,29 @@ class buffered_stream(object):
     low-level Unicode issues as well as tracking the current position
     in terms of line and column position.
 
+    Only the character offset is tracked as the stream is read; the
+    line and column of a position are computed from a line_index only
+    when they are actually needed, such as when reporting an error.
+
+    Runs of characters (whitespace, digits, identifiers, and so on)
+    are consumed in bulk by regular expression matching whenever the
+    predicate is one of the well-known ones, see the popmatch()
+    method.
+
     """
+    _run_patterns = _make_run_patterns()  # predicate function -> regex
+    _char_set_patterns = {}    # set of chars -> regex, see pop_while_in()
+    _rest_of_line_pattern = _make_rest_of_line_pattern()
+
     def __init__(self, txt='', encoding=None):
         self.reset()
         self.set_text( txt, encoding )
 
     def reset(self):
         """Clears the state to nothing."""
-        self.__pos = position_marker()
+        self.__cpos = 0        # Current character offset
         self.__saved_pos = []  # Stack of saved positions
+        self.__line_index = line_index()
         self.__bom = helpers.make_raw_bytes([])   # contains copy of byte-order mark, if any
         self.__codec = None     # The CodecInfo
         self.__encoding = None  # The name of the codec's encoding
@@ -1624,10 +1990,11 @@ class buffered_stream(object):
         self.__rawbuf = None
         self.__raw_bytes = None
         self.__cmax = 0
+        self.__origin = 0       # Offset of the text's start, if earlier text was discarded
         self.num_ws_skipped = 0
 
     def save_position(self):
-        self.__saved_pos.append( self.__pos.copy() )
+        self.__saved_pos.append( self.__cpos )
         return True
 
     def clear_saved_position(self):
@@ -1643,9 +2010,13 @@ class buffered_stream(object):
         except IndexError, err:
             raise IndexError("Attempt to restore buffer position that was never saved")
         else:
-            self.__pos = old_pos
+            self.__cpos = old_pos
             return True
 
+    def seek(self, offset):
+        """Moves to the given character offset in the text."""
+        self.__cpos = max( 0, min( offset, self.__cmax ) )
+
     def _find_codec(self, encoding):
         if encoding is None:
             self.__codec = None
@@ -1671,6 +2042,7 @@ class buffered_stream(object):
         self.__bom = None
         self.__rawbuf = u''
         self.__cmax = 0  # max number of chars in input
+        self.__origin = 0
         try:
             decoded = helpers.unicode_decode( txt, encoding )
         except JSONError:
@@ -1688,13 +2060,34 @@ class buffered_stream(object):
             self.__bom    = decoded.bom
             self.__rawbuf = decoded.string
             self.__cmax = len(self.__rawbuf)
+            self.__line_index = line_index( self.__rawbuf )
+
+    def extend_text( self, more_text ):
+        """Appends more Unicode text to the end of the document, and
+        discards all of the text before the current position.
+
+        This allows a long document to be read a piece at a time
+        without holding onto all of it.  Afterwards the text property,
+        and character offsets such as cpos, refer only to the text
+        which remains; but any position_marker still gives the line,
+        column and offset from the start of the whole document.
+
+        """
+        p = self.position
+        origin = position_marker( p.char_position, p.line, p.column )
+        self.__rawbuf = self.__rawbuf[self.__cpos:] + more_text
+        self.__cmax = len(self.__rawbuf)
+        self.__cpos = 0
+        self.__saved_pos = []
+        self.__line_index = line_index( self.__rawbuf, origin )
+        self.__origin = origin.char_position
 
     def __repr__(self):
-        return '<%s at %r text %r>' % (self.__class__.__name__, self.__pos, self.text_context)
+        return '<%s at %r text %r>' % (self.__class__.__name__, self.position, self.text_context)
 
     def rewind(self):
         """Resets the position back to the start of the input text."""
-        self.__pos.rewind()
+        self.__cpos = 0
 
     @property
     def codec(self):
@@ -1713,7 +2106,16 @@ class buffered_stream(object):
     @property
     def cpos(self):
         """The current character offset from the start of the document."""
-        return self.__pos.char_position
+        return self.__cpos
+
+    @property
+    def text(self):
+        """The entire document as a Unicode string, after any Unicode
+        decoding has been performed and without any BOM.  (Or just
+        what remains of it, if extend_text() has been used.)
+
+        """
+        return self.__rawbuf
 
     @property
     def position(self):
@@ -1721,9 +2123,18 @@ class buffered_stream(object):
         Returns a copy.
 
         """
-        p = self.__pos.copy()
-        p.text_after = self.text_context
-        p.at_end = self.at_end
+        return self.position_at( self.__cpos )
+
+    def position_at(self, offset):
+        """Returns a position_marker object for the given character
+        offset into the text.  This allows a parser
+        to remember just the offset of something it has passed over,
+        and only make a position_marker of it if one is needed.
+
+        """
+        p = position_marker( self.__origin + offset, line_index=self.__line_index )
+        p.text_after = self.__excerpt( offset )
+        p.at_end = not (0 <= offset < self.__cmax)
         return p
 
     @property
@@ -1732,7 +2143,7 @@ class buffered_stream(object):
         the document, or False otherwise.
 
         """
-        return self.__pos.at_start
+        return self.__cpos == 0
 
     @property
     def at_end(self):
@@ -1776,7 +2187,7 @@ class buffered_stream(object):
         string '' is returned.
 
         """
-        i = self.cpos + offset
+        i = self.__cpos + offset
         if i < 0 or i >= self.__cmax:
             return ''
         return self.__rawbuf[i]
@@ -1790,7 +2201,7 @@ class buffered_stream(object):
         length.
 
         """
-        i = self.cpos + offset
+        i = self.__cpos + offset
         j = i + span
         if i < 0 or i >= self.__cmax:
             return ''
@@ -1802,8 +2213,14 @@ class buffered_stream(object):
         the current position, in English.
 
         """
+        return self.__excerpt( self.__cpos, context_size )
+
+    def __excerpt( self, offset, context_size = 20 ):
+        """The text_context at the given character offset."""
         context_size = max( context_size, 4 )
-        s = self.peekstr(context_size + 1)
+        if offset < 0:
+            return ''
+        s = self.__rawbuf[offset : offset + context_size + 1]
         if not s:
             return ''
         if len(s) > context_size:
@@ -1827,9 +2244,9 @@ class buffered_stream(object):
 
         """
 
-        i = self.cpos
-        self.__pos.advance( self.peekstr(span) )
-        return self.cpos - i
+        i = self.__cpos
+        self.__cpos = max( i, min( i + span, self.__cmax ) )
+        return self.__cpos - i
 
     def skipuntil( self, testfn ):
         """Advances the current position until a given predicate test
@@ -1845,14 +2262,7 @@ class buffered_stream(object):
         See also methods: skipwhile() and popuntil()
 
         """
-        i = self.cpos
-        while True:
-            c = self.peek()
-            if not c or testfn(c):
-                break
-            else:
-                self.__pos.advance(c)
-        return self.cpos - i
+        return len( self.popuntil( testfn ) )
 
     def skipwhile( self, testfn ):
         """Advances the current position until a given predicate test
@@ -1868,7 +2278,18 @@ class buffered_stream(object):
         See also methods: skipuntil() and popwhile()
 
         """
-        return self.skipuntil( lambda c: not testfn(c) )
+        return len( self.popwhile( testfn ) )
+
+    def skipmatch( self, pattern ):
+        """Advances the current position past the characters matched
+        by the given compiled regular expression.
+
+        Returns the actual number of characters skipped.
+
+        See also method: popmatch()
+
+        """
+        return len( self.popmatch( pattern ) )
 
     def skip_to_next_line( self, allow_unicode_eol=True ):
         """Advances the current position to the start of the next
@@ -1877,13 +2298,7 @@ class buffered_stream(object):
         single end-of-line marker.
 
         """
-        ln = self.__pos.line
-        while True:
-            c = self.pop()
-            if not c or self.__pos.line > ln:
-                if c == '\r' and self.peek() == '\n':
-                    self.skip()
-                break
+        self.skipmatch( self._rest_of_line_pattern )
 
     def skipws( self, allow_unicode_whitespace=True ):
         """Advances the current position past all whitespace, or until
@@ -1905,7 +2320,7 @@ class buffered_stream(object):
         """
         c = self.peek()
         if c:
-            self.__pos.advance( c )
+            self.__cpos += 1
         return c
 
     def popstr( self, span=1, offset=0 ):
@@ -1917,8 +2332,7 @@ class buffered_stream(object):
 
         """
         s = self.peekstr(span)
-        if s:
-            self.__pos.advance( s )
+        self.__cpos += len(s)
         return s
 
     def popif( self, testfn ):
@@ -1927,7 +2341,7 @@ class buffered_stream(object):
         """
         c = self.peek()
         if c and testfn(c):
-            self.__pos.advance( c )
+            self.__cpos += 1
             return c
         return ''
 
@@ -1935,14 +2349,18 @@ class buffered_stream(object):
         """Pops a sequence of characters at the current position
         as long as each of them is in the given set of characters.
 
+        Returns None if the character at the current position is
+        not in the set.
+
         """
-        if not isinstance( chars, (set,frozenset)):
-            cset = set( chars )
-        c = self.peek()
-        if c and c in cset:
-            s = self.popwhile( lambda c: c and c in cset )
-            return s
-        return None
+        if isinstance( chars, (set,frozenset) ):
+            chars = u''.join( sorted(chars) )
+        try:
+            pattern = self._char_set_patterns[chars]
+        except KeyError:
+            pattern = _make_run_pattern( chars )
+            self._char_set_patterns[chars] = pattern
+        return self.popmatch( pattern ) or None
 
     def pop_identifier( self, match=None ):
         """Pops the sequence of characters at the current position
@@ -1964,9 +2382,36 @@ class buffered_stream(object):
         s2 = self.peekstr( len(s) )
         if s2 != s:
             return NULL
-        self.__pos.advance( s2 )
+        self.__cpos += len(s2)
         return s2
 
+    def popmatch( self, pattern, maxchars=None ):
+        """Pops all the characters starting at the current position
+        which are matched by the given compiled regular expression.
+        If maxchars is a numeric value instead of None then no more
+        than that number of characters will be popped.
+
+        Returns an empty string if the regular expression does not
+        match at the current position.
+
+        The entire run of characters is consumed, and the position
+        updated, all at once; so this is much faster than testing one
+        character at a time.
+
+        See also methods: skipmatch() and popwhile()
+
+        """
+        i = self.__cpos
+        if maxchars is None:
+            m = pattern.match( self.__rawbuf, i )
+        else:
+            m = pattern.match( self.__rawbuf, i, min(self.__cmax, i + maxchars) )
+        if not m:
+            return ''
+        s = m.group()
+        self.__cpos = m.end()
+        return s
+
     def popwhile( self, testfn, maxchars=None ):
         """Pops all the characters starting at the current position as
         long as each character passes the given predicate function
@@ -1977,15 +2422,27 @@ class buffered_stream(object):
         See also methods: skipwhile() and popuntil()
 
         """
-        s = []
-        i = 0
-        while maxchars is None or i < maxchars:
-            c = self.popif( testfn )
-            if not c:
+        i = j = self.__cpos
+        if maxchars is None:
+            end = self.__cmax
+        else:
+            end = min(self.__cmax, i + maxchars)
+        buf = self.__rawbuf
+        pattern = self._run_patterns.get( testfn )
+        while j < end:
+            if pattern is not None:
+                m = pattern.match( buf, j, end )
+                if m:
+                    j = m.end()
+                    if j >= end:
+                        break
+            # Test the next character with the predicate itself, as
+            # the regular expression may only cover a subset of it.
+            if not testfn( buf[j] ):
                 break
-            s.append( c )
-            i += 1
-        return ''.join(s)
+            j += 1
+        self.__cpos = j
+        return buf[i:j]
 
     def popuntil( self, testfn, maxchars=None ):
         """Just like popwhile() method except the predicate function
@@ -1994,7 +2451,16 @@ class buffered_stream(object):
         See also methods: skipuntil() and popwhile()
 
         """
-        return popwhile( lambda c: not testfn(c), maxchars=maxchars )
+        i = j = self.__cpos
+        if maxchars is None:
+            end = self.__cmax
+        else:
+            end = min(self.__cmax, i + maxchars)
+        buf = self.__rawbuf
+        while j < end and not testfn( buf[j] ):
+            j += 1
+        self.__cpos = j
+        return buf[i:j]
 
     def __getitem__( self, index ):
         """Returns the character at the given index relative to the current position.
@@ -2154,6 +2620,21 @@ class JSONError(JSONException):
                 err += "\n   |    with text: %r" % (self.outer_position.text_after,)
         return err
 
+def _relocate_error( err, start ):
+    """Changes the positions of a JSONError, which was found while
+    decoding a piece of a larger document, to be positions within
+    that larger document.  The 'start' argument is the position in the
+    larger document where the piece began.
+
+    """
+    for attr in ('position', 'outer_position'):
+        pos = getattr( err, attr, None )
+        if pos == 0:
+            setattr( err, attr, start.copy() )
+        elif pos:
+            setattr( err, attr, pos.relative_to( start ) )
+    return err
+
 class JSONDecodeError(JSONError):
     """An exception class raised when a JSON decoding error (syntax error) occurs."""
     pass
@@ -2205,27 +2686,37 @@ class encode_state(object):
     """An internal transient object used during JSON encoding to
     record the current construction state.
 
+    The whole document is written into the one 'chunks' list, in
+    output order; the encoder itself only adjusts 'nest_level' while
+    it descends into arrays and objects.
+
+    When streaming, 'flush_chunks' is the number of chunks after
+    which the output written so far should be taken.  The members
+    of arrays and objects are then not written right away; instead
+    a generator which writes them is left in 'pending', to be run
+    with run_pending() before anything else is written.
+
     """
-    def __init__(self, jsopts=None, parent=None ):
-        import sys
+    def __init__(self, jsopts=None):
         self.chunks = []
-        if not parent:
-            self.parent = None
-            self.nest_level = 0
-            self.options = jsopts
-            self.escape_unicode_test = False  # or a function f(unichar)=>True/False
-        else:
-            self.parent = parent
-            self.nest_level = parent.nest_level + 1
-            self.escape_unicode_test = parent.escape_unicode_test
-            self.options = parent.options
-
-    def make_substate(self):
-        return encode_state( parent=self )
+        self.nest_level = 0
+        self.options = jsopts
+        self.escape_unicode_test = False  # or a function f(unichar)=>True/False
+        self.string_escaper = None  # a _string_escaper, or False, once known
+        self.flush_chunks = None
+        self.pending = None
+
+    def run_pending(self):
+        """Writes the members of the last array or object started, if
+        they are still pending.  A generator, which yields whenever
+        the output should be taken.
 
-    def join_substate(self, other_state):
-        self.chunks.extend( other_state.chunks )
-        other_state.chunks = []
+        """
+        pending = self.pending
+        if pending is not None:
+            self.pending = None
+            for _ in pending:
+                yield
 
     def append(self, s):
         """Adds a string to the end of the current JSON document"""
@@ -2237,14 +2728,122 @@ class encode_state(object):
         self.chunks = []
         return s
 
-    def __eq__(self, other_state):
-        return self.nest_level == other_state.nest_level and \
-            self.chunks == other_state.chunks
 
-    def __lt__(self, other_state):
-        if self.nest_level != other_state.nest_level:
-            return self.nest_level < other_state.nest_level
-        return self.chunks < other_state.chunks
+def _escape_non_ascii( c ):
+    """The escape_unicode_test for output encodings limited to ASCII."""
+    return ord(c) >= 0x80
+
+def _escape_non_latin1( c ):
+    """The escape_unicode_test for ISO-8859-1 output."""
+    return ord(c) >= 0x100
+
+class _escape_unencodable(object):
+    """The escape_unicode_test for any other output codec, which is
+    not a UTF: escapes the characters which the codec can not encode.
+
+    """
+    def __init__(self, cdk):
+        self.codec_name = cdk.name
+        self.encode = cdk.encode
+
+    def __call__(self, c):
+        try:
+            self.encode( c )
+        except UnicodeEncodeError:
+            return True
+        else:
+            return False
+
+
+class _string_escaper(dict):
+    """Escapes whole strings for the JSON encoder at once, using the
+    string translate() method, for one JSON object and one choice of
+    the characters which must always be escaped and of the characters
+    which the output encoding can not hold: either every code point
+    from 'escape_from' up, or those for which the 'escape_test'
+    function (an _escape_unencodable) returns True.
+
+    The dictionary itself is the translation table.  It is filled in
+    as characters are first seen, each with the same escape the
+    character by character encoder would give it.  Only the first
+    'max_table_size' characters are remembered, so that encoding text
+    with very many different characters can not grow it without bound;
+    any others are worked out again each time they are seen.
+
+    Under Python 2 the character by character encoder gives a byte
+    string, rather than a Unicode one, for a string whose characters
+    are all escaped (which is how encode() can return a 'str' when no
+    encoding is given); so this does too.
+
+    """
+    _surrogate_re = _make_surrogate_pattern()
+    max_table_size = 0x4000
+
+    def __init__(self, json, always_escape, escape_from, escape_test=None):
+        import re
+        dict.__init__(self)
+        self.rev_escapes = json._rev_escapes
+        self.optional_rev_escapes = json._optional_rev_escapes
+        self.always_escape = always_escape
+        self.escape_from = escape_from
+        self.escape_test = escape_test
+        self.literal_ascii = [json._asciiencodable[i] and unichr(i) not in always_escape
+                              and not (escape_test and escape_test(unichr(i)))
+                              for i in range(0x80)]
+        safe = [re.escape(unichr(i)) for i in range(0x80) if self.literal_ascii[i]]
+        if safe:
+            self.unsafe_re = re.compile( u'[^%s]' % u''.join(safe) )
+            self.safe_re = re.compile( u'[%s]' % u''.join(safe) )
+        else:
+            self.unsafe_re = re.compile( u'(?s).' )
+            self.safe_re = None
+        # Only printable ASCII characters can be left unescaped?
+        self.bytes_if_escaped = (unicode is not str and escape_test is None
+                                 and escape_from is not None and escape_from <= 0x80)
+
+    def __missing__(self, cord):
+        import unicodedata
+        c = unichr(cord)
+        if cord < 0x80 and self.literal_ascii[cord]:
+            esc = cord
+        elif c in self.rev_escapes:
+            esc = unicode( self.rev_escapes[c] )
+        elif cord <= 0x1F:
+            esc = u'\\u%04x' % cord
+        elif c in self.always_escape \
+                or unicodedata.category( c ) in ['Cc','Cf','Zl','Zp'] \
+                or (self.escape_from is not None and cord >= self.escape_from) \
+                or (self.escape_test is not None and self.escape_test( c )):
+            if c in self.optional_rev_escapes:
+                esc = unicode( self.optional_rev_escapes[c] )
+            elif cord <= 0xFFFF:
+                esc = u'\\u%04x' % cord
+            else:
+                esc = u''.join( [u'\\u%04x' % ord(surrogate)
+                                 for surrogate in helpers.unicode_as_surrogate_pair(c)] )
+        else:
+            esc = cord
+        if len(self) < self.max_table_size:
+            self[cord] = esc
+        return esc
+
+    def escape(self, s):
+        """Returns the Unicode string as a JSON string literal, or None
+        if it has any surrogate code points, which need to be handled
+        by the character by character encoder.
+
+        """
+        m = self.unsafe_re.search( s )
+        if m is None:
+            if not s and self.bytes_if_escaped:
+                return '""'
+            return u'"' + s + u'"'
+        if self._surrogate_re.search( s, m.start() ):
+            return None
+        literal = u'"' + s.translate( self ) + u'"'
+        if self.bytes_if_escaped and not (self.safe_re and self.safe_re.search( s )):
+            literal = str( literal )  # All escaped, and so all ASCII
+        return literal
 
 
 #----------------------------------------------------------------------
@@ -2287,6 +2886,8 @@ class decode_statistics(object):
         self.num_floats_decimal = 0  # overflowed 'float'
         # String stats
         self.num_strings = 0
+        self.num_key_cache_hits = 0    # object keys found in the key cache
+        self.num_key_cache_misses = 0
         self.max_string_length = 0
         self.total_string_length = 0
         self.min_codepoint = None
@@ -2334,6 +2935,8 @@ class decode_statistics(object):
             "   number:         %5d strings" % self.num_strings,
             "   max length:     %5d characters" % self.max_string_length,
             "   total chars:    %5d across all strings" % self.total_string_length,
+            "   key cache hits: %5d of %d object keys" % (self.num_key_cache_hits,
+                                                          self.num_key_cache_hits + self.num_key_cache_misses),
             ]
 
         if self.min_codepoint is not None:
@@ -2384,41 +2987,88 @@ class decode_statistics(object):
 # Decoder state object
 #----------------------------------------------------------------------
 
+# The type of the results of decoding with return_errors or return_stats
+_json_results = _namedtuple('json_results',['object','errors','stats'])
+
 class decode_state(object):
     """An internal transient object used during JSON decoding to
     record the current parsing state and error messages.
 
     """
-    def __init__(self, options=None):
+    _nonbmp_re = _make_nonbmp_pattern()
+
+    def __init__(self, options=None, collect_stats=True, collect_warnings=True):
+        """If 'collect_stats' is False then no decode_statistics are
+        gathered, and the stats attribute is None.  If
+        'collect_warnings' is also False, then any warnings will be
+        discarded; and so values are not examined for the non-portable
+        behavior unless it is forbidden.
+
+        """
+        self.collect_stats = collect_stats
         self.reset()
         self.options = options
+        self.max_errors = options.max_errors if options else None
+        self.max_warnings = options.max_warnings if options else None
+
+        non_portable = options.non_portable if options else WARN
+        self.check_non_portable = (non_portable == FORBID or (non_portable == WARN and collect_warnings))
+        if not collect_stats:
+            # Replace the update_*_stats() methods of this instance
+            if self.check_non_portable:
+                self.update_string_stats = self.check_string
+                self.update_integer_stats = self.check_integer
+                self.update_float_stats = self.check_float
+            else:
+                self.update_string_stats = self.ignore_value
+                self.update_integer_stats = self.ignore_value
+                self.update_float_stats = self.ignore_value
 
     def reset(self):
         """Clears all errors, statistics, and input text."""
         self.buf = None
         self.errors = []
+        self.num_messages = 0   # all errors and warnings pushed, even if suppressed
+        self.num_errors = 0     # errors in the list, including fatal ones
+        self.num_fatal = 0
+        self.num_warnings = 0   # warnings in the list
+        self.num_suppressed_warnings = 0  # warnings left out of the list
+        self._warning_repeats = {}   # message -> times repeated, see max_warnings
         self.obj = None
         self.cur_depth = 0  # how deep in nested structures are we?
-        self.stats = decode_statistics()
+        if self.collect_stats:
+            self.stats = decode_statistics()
+        else:
+            self.stats = None
+        self.key_cache = None  # raw object key literal -> decoded key
+        # Most non-portable behaviors are only warned about once
         self._have_warned_nonbmp = False
         self._have_warned_long_string = False
         self._have_warned_max_depth = False
+        self._have_warned_negzero_int = False
+        self._have_warned_negzero_float = False
+        self._have_warned_long_int = False
+        self._have_warned_decimal = False
+        # When decoding only selected paths, see JSON.decode()
+        self.select = None          # remaining paths, as tuples of tokens
+        self.select_pointer = ()    # tokens leading to the current value
+        self.select_validator = None  # a _fast_decoder to skip values with
+        self.selected = None        # JSON Pointer -> value results
+        self.events = None  # (number of errors, event) list, see JSON.iterparse()
 
     @property
     def should_stop(self):
-        if self.has_fatal:
-            return True
-        return False
+        return self.num_fatal > 0
 
     @property
     def has_errors(self):
         """Have any errors been seen already?"""
-        return len([err for err in self.errors if err.severity in ('fatal','error')]) > 0
+        return self.num_errors > 0
 
     @property
     def has_fatal(self):
         """Have any errors been seen already?"""
-        return len([err for err in self.errors if err.severity in ('fatal',)]) > 0
+        return self.num_fatal > 0
 
     def set_input( self, txt, encoding=None ):
         """Initialize the state by setting the input document text."""
@@ -2445,8 +3095,72 @@ class decode_state(object):
             self.push_fatal( "Aborting, can not read JSON document.", position=0 )
 
     def push_exception(self, exc):
-        """Add an already-built exception to the error list."""
-        self.errors.append(exc)
+        """Add an already-built exception to the error list.
+
+        If the max_warnings option is set, a warning may be left out
+        of the list instead; and if the max_errors option is set, an
+        error over the limit is replaced by a fatal error to stop the
+        decoding.
+
+        """
+        if exc.severity == 'warning' and self.__suppress_warning( exc.message ):
+            return
+        self.__append( exc )
+
+    def __suppress_warning(self, message):
+        """Determines if a warning with the given message should be
+        left out of the error list.  When the max_warnings option is
+        set, warnings repeating the message of an earlier one are only
+        counted, as are any warnings once there are too many.
+
+        """
+        if self.max_warnings is None:
+            return False
+        repeats = self._warning_repeats
+        if message in repeats:
+            repeats[message] += 1
+        elif self.num_warnings < self.max_warnings:
+            repeats[message] = 0
+            return False
+        self.num_messages += 1
+        self.num_suppressed_warnings += 1
+        return True
+
+    def __append(self, err):
+        """Adds an error or warning to the error list, and keeps count."""
+        severity = err.severity
+        if severity == 'error' and self.max_errors is not None \
+               and self.num_errors - self.num_fatal >= self.max_errors:
+            self.push_fatal( "Aborting, there are more than %d errors" % self.max_errors,
+                             position=err.position )
+            return
+        self.num_messages += 1
+        if severity == 'warning':
+            self.num_warnings += 1
+        elif severity == 'error' or severity == 'fatal':
+            self.num_errors += 1
+            if severity == 'fatal':
+                self.num_fatal += 1
+        self.errors.append( err )
+
+    def note_suppressed_warnings(self):
+        """Once decoding is done, notes in the error list how many
+        warnings the max_warnings option kept out of it.  Warnings which
+        were repeated have the number of repeats added to their message.
+
+        """
+        if not self.num_suppressed_warnings:
+            return
+        repeats = self._warning_repeats
+        for err in self.errors:
+            if err.severity == 'warning' and repeats.get( err.message ):
+                n = repeats.pop( err.message )
+                err.message = "%s (repeated %d more time%s)" % (err.message, n, 's' if n > 1 else '')
+        self.errors.append( JSONDecodeError( "%d more warning%s suppressed (the maximum is %d)" \
+                                                 % (self.num_suppressed_warnings,
+                                                    's were' if self.num_suppressed_warnings > 1 else ' was',
+                                                    self.max_warnings),
+                                             severity='info' ) )
 
 
     def push_fatal(self, message, *args, **kwargs):
@@ -2499,19 +3213,25 @@ class decode_state(object):
                 context_description=val
             else:
                 raise TypeError('Unknown keyword argument',kw)
+        if severity == 'warning' and self.__suppress_warning( message ):
+            return   # Without finding its position, which is slow
         if position is None and self.buf:
             position = self.buf.position  # Current position
         err = JSONDecodeError( message, position=position, outer_position=outer_position, context_description=context_description, severity=severity, *args)
-        self.push_exception( err )
+        self.__append( err )
 
     def update_depth_stats(self, **kwargs):
         st = self.stats
-        st.max_depth = max(st.max_depth, self.cur_depth)
+        if st:
+            st.max_depth = max(st.max_depth, self.cur_depth)
         if not self._have_warned_max_depth and self.cur_depth > self.options.warn_max_depth:
             self._have_warned_max_depth = True
             self.push_cond( self.options.non_portable,
                             "Arrays or objects nested deeper than %d levels may not be portable" \
                                 % self.options.warn_max_depth )
+        if self.options.max_depth is not None and self.cur_depth > self.options.max_depth:
+            self.push_fatal( "Arrays or objects are nested deeper than the maximum of %d levels" \
+                                 % self.options.max_depth )
 
     def update_string_stats(self, s, **kwargs):
         st = self.stats
@@ -2540,16 +3260,20 @@ class decode_state(object):
 
     def update_negzero_int_stats(self, **kwargs):
         st = self.stats
-        st.num_negative_zero_ints += 1
-        if st.num_negative_zero_ints == 1:  # Only warn once
+        if st:
+            st.num_negative_zero_ints += 1
+        if not self._have_warned_negzero_int:
+            self._have_warned_negzero_int = True
             self.push_cond( self.options.non_portable,
                             "Negative zero (-0) integers are usually not portable",
                             **kwargs )
 
     def update_negzero_float_stats(self, **kwargs):
         st = self.stats
-        st.num_negative_zero_floats += 1
-        if st.num_negative_zero_floats == 1:  # Only warn once
+        if st:
+            st.num_negative_zero_floats += 1
+        if not self._have_warned_negzero_float:
+            self._have_warned_negzero_float = True
             self.push_cond( self.options.non_portable,
                             "Negative zero (-0.0) numbers may not be portable",
                             **kwargs)
@@ -2567,7 +3291,8 @@ class decode_state(object):
 
         if isinstance(float_value, decimal.Decimal):
             st.num_floats_decimal += 1
-            if st.num_floats_decimal == 1: # Only warn once
+            if not self._have_warned_decimal:
+                self._have_warned_decimal = True
                 self.push_cond( self.options.non_portable,
                                 "Floats larger or more precise than an IEEE \"double\" may not be portable",
                                 **kwargs)
@@ -2601,32 +3326,268 @@ class decode_state(object):
 
         if int_value < st.double_int_min or st.double_int_max < int_value:
             st.num_ints_53bit += 1
-            if st.num_ints_53bit == 1:  # Only warn once
+            if not self._have_warned_long_int:
+                self._have_warned_long_int = True
                 self.push_cond( self.options.non_portable,
                                 "Integers larger than 53-bits are not portable",
                                 **kwargs )
 
+    def check_string(self, s, **kwargs):
+        """Checks a decoded string for the non-portable behavior, in
+        place of update_string_stats() when not collecting statistics.
 
-# ----------------------------------------------------------------------
-# JSON strictness options
-# ----------------------------------------------------------------------
+        """
+        if self.options.warn_string_length and len(s) > self.options.warn_string_length and not self._have_warned_long_string:
+            self._have_warned_long_string = True
+            self.push_cond( self.options.non_portable,
+                            "Strings longer than %d may not be portable" % self.options.warn_string_length,
+                            **kwargs )
+        if not self._have_warned_nonbmp and self._nonbmp_re and self._nonbmp_re.search( s ):
+            self._have_warned_nonbmp = True
+            self.push_cond( self.options.non_portable,
+                            "Strings containing non-BMP characters (U+%04X) may not be portable" % ord(max(s)),
+                            **kwargs )
 
-STRICTNESS_STRICT   = 'strict'
-STRICTNESS_WARN     = 'warn'
-STRICTNESS_TOLERANT = 'tolerant'
+    def check_integer(self, int_value, **kwargs):
+        """Checks a decoded integer for the non-portable behavior, in
+        place of update_integer_stats() when not collecting statistics.
 
-ALLOW = 'allow'
-WARN = 'warn'
-FORBID = 'forbid'
+        """
+        sign = kwargs.pop('sign', 1)
+        if int_value == 0 and sign < 0:
+            self.update_negzero_int_stats( **kwargs )
+        elif (int_value > decode_statistics.double_int_max or int_value < decode_statistics.double_int_min) \
+                and not self._have_warned_long_int:
+            self._have_warned_long_int = True
+            self.push_cond( self.options.non_portable,
+                            "Integers larger than 53-bits are not portable",
+                            **kwargs )
 
-# For float_type option
-NUMBER_AUTO = 'auto'
-NUMBER_FLOAT = 'float'
-NUMBER_DECIMAL = 'decimal'
+    def check_float(self, float_value, **kwargs):
+        """Checks a decoded float for the non-portable behavior, in
+        place of update_float_stats() when not collecting statistics.
 
-# For json_int class
-NUMBER_FORMAT_DECIMAL = 'decimal'
-NUMBER_FORMAT_HEX = 'hex'
+        """
+        kwargs.pop('sign', None)
+        if helpers.is_negzero( float_value ):
+            self.update_negzero_float_stats( **kwargs )
+        if decimal and isinstance(float_value, decimal.Decimal) and not self._have_warned_decimal:
+            self._have_warned_decimal = True
+            self.push_cond( self.options.non_portable,
+                            "Floats larger or more precise than an IEEE \"double\" may not be portable",
+                            **kwargs)
+
+    def ignore_value(self, value, **kwargs):
+        """Does nothing; in place of the update_*_stats() methods when
+        neither statistics nor non-portability messages are wanted.
+
+        """
+        pass
+
+
+class _composite_frame(object):
+    """An array or object which is being decoded, as kept on the stack
+    of open ones by JSON.decode_composite().
+
+    """
+    __slots__ = ['isdict', 'closer', 'obj', 'start_position', 'select',
+                 'num_items', 'saw_value', 'done', 'resume', 'value_position',
+                 'key', 'skip_item', 'selecting', 'streaming', 'scanner']
+
+    def __init__(self, isdict, obj, start_position, select=None):
+        self.isdict = isdict
+        if isdict:
+            self.closer = '}'
+        else:
+            self.closer = ']'
+        self.obj = obj
+        self.start_position = start_position
+        self.select = select  # paths wanted from within, or None for all
+        self.num_items = 0
+        self.saw_value = False  # set to false at beginning and after commas
+        self.done = False
+        self.resume = None  # what a nested array or object is awaited for
+        self.value_position = None
+        self.key = None  # of the object property being decoded
+        self.skip_item = False
+        self.selecting = None  # see JSON.__begin_selected()
+        self.streaming = False  # pauses after each member, see JSON.iterparse()
+        self.scanner = None  # see JSON._scan_composite()
+
+
+class _event_sink(object):
+    """Takes the place of the list or dictionary being decoded by
+    JSON.iterparse(), turning what would be stored in it into parsing
+    events instead.  Each event is added to the state's list of events
+    along with the number of errors which were found before it.
+
+    """
+    __slots__ = ['state', 'path', 'num_errors_at_start', 'count', 'keys']
+
+    def __init__(self, state):
+        self.state = state
+        self.path = None      # set by JSON.iterparse()
+        self.num_errors_at_start = len(state.errors)
+        self.count = 0        # of array elements
+        self.keys = set()     # of object properties
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add_event(self, event, path, value=None):
+        self.state.events.append( (len(self.state.errors), (event, path, value)) )
+
+    def start_property(self, key):
+        self.add_event( 'map_key', self.path, key )
+
+    def append(self, value):
+        if not isinstance(value, _event_sink):
+            self.add_event( 'scalar', self.path + (self.count,), value )
+        self.count += 1
+
+    def __setitem__(self, key, value):
+        if not isinstance(value, _event_sink):
+            self.add_event( 'scalar', self.path + (key,), value )
+        self.keys.add( key )
+
+
+class _lookahead_reader(object):
+    """Reads a file for JSON.iterparse() a piece at a time, into the
+    buffered_stream of a decode_state.
+
+    Each step of the decoder between two events goes no further than
+    the next few structural characters (brackets, colons and commas)
+    of the document.  So before each step the fill() method makes
+    sure that the text holds that many of them, reading more of the
+    file if need be; and the text which has already been decoded is
+    discarded at the same time.
+
+    """
+    lookahead = 4          # structural characters needed ahead
+    read_size = 0x10000    # characters or bytes to read at first
+
+    def __init__(self, state, source, encoding=None):
+        from collections import deque
+        self.state = state
+        self.source = source
+        self.stream = _text_stream_decoder( encoding )
+        options = state.options
+        if options.is_forbid_single_quoted_strings:
+            quotes = u'"'
+        else:
+            quotes = u'"\''
+        self.token_re = _make_structure_token_pattern( quotes, not options.is_forbid_comments )
+        self.punct_group = len(quotes) + 1  # the first of the structural character groups
+        self.ahead = deque()  # offsets of the structural characters found
+        self.scanned = 0      # offset the search for them has got to
+        self.at_eof = False
+        self.seen_bom = False
+
+    def fill(self):
+        """Reads more of the file if the text does not yet hold enough
+        of the structural characters which follow the position.
+        """
+        buf = self.state.buf
+        ahead = self.ahead
+        read_size = self.read_size
+        while True:
+            cpos = buf.cpos
+            while ahead and ahead[0] < cpos:
+                ahead.popleft()
+            if len(ahead) >= self.lookahead or self.at_eof:
+                return
+            for m in self.token_re.finditer( buf.text, max( self.scanned, cpos ) ):
+                if (m.lastindex or 0) >= self.punct_group:
+                    ahead.append( m.start() )
+                    self.scanned = m.end()
+                    if len(ahead) >= self.lookahead:
+                        return
+
+            # Read twice as much each time round, so a long string
+            # is not searched over too many times
+            piece = self.source.read( read_size )
+            read_size *= 2
+            if piece:
+                text = self.stream.decode( piece )
+            else:
+                text = self.stream.finish()
+                self.at_eof = True
+            if self.stream.bom and not self.seen_bom:
+                self.seen_bom = True
+                self.state.push_cond( self.state.options.bom,
+                                      "JSON document was prefixed by a BOM (Byte Order Mark)",
+                                      self.stream.bom )
+            buf.extend_text( text )
+            for i in range( len(ahead) ):
+                ahead[i] -= cpos
+            self.scanned = max( 0, self.scanned - cpos )
+
+
+class _lru_cache(object):
+    """A dictionary-like cache holding at most 'maxsize' entries, which
+    forgets the least recently used ones first.  Only the get() method
+    and item assignment are supported, which is all that the object
+    key cache of the JSON class needs.
+
+    Rather than keeping the entries in exact order of use, which costs
+    more than most cache hits save, the entries are kept in two plain
+    dictionaries: those used recently, and the generation before.  When
+    the recent one fills up the older generation is forgotten in one
+    go, which approximates the least-recently-used order.
+
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.__generation_size = max( 1, maxsize // 2 )
+        self.__recent = {}
+        self.__older = {}
+
+    def __len__(self):
+        return len(self.__recent) + len(self.__older)
+
+    def get(self, key, default=None):
+        try:
+            return self.__recent[key]
+        except KeyError:
+            pass
+        try:
+            value = self.__older.pop(key)
+        except KeyError:
+            return default
+        self[key] = value  # It is now a recently used entry
+        return value
+
+    def __setitem__(self, key, value):
+        recent = self.__recent
+        recent[key] = value
+        if len(recent) >= self.__generation_size:
+            self.__older = recent
+            self.__recent = {}
+
+
+# ----------------------------------------------------------------------
+# JSON strictness options
+# ----------------------------------------------------------------------
+
+STRICTNESS_STRICT   = 'strict'
+STRICTNESS_WARN     = 'warn'
+STRICTNESS_TOLERANT = 'tolerant'
+
+ALLOW = 'allow'
+WARN = 'warn'
+FORBID = 'forbid'
+
+# For float_type option
+NUMBER_AUTO = 'auto'
+NUMBER_FLOAT = 'float'
+NUMBER_DECIMAL = 'decimal'
+
+# For json_int class
+NUMBER_FORMAT_DECIMAL = 'decimal'
+NUMBER_FORMAT_HEX = 'hex'
 NUMBER_FORMAT_LEGACYOCTAL = 'legacyoctal'
 NUMBER_FORMAT_OCTAL = 'octal'
 NUMBER_FORMAT_BINARY = 'binary'
@@ -2808,6 +3769,22 @@ try:
     from collections import OrderedDict as _OrderedDict
 except ImportError:
     _OrderedDict = None
+# Find the type of all old-style class instances (Python 2)
+try:
+    from types import InstanceType as _old_style_instance
+except ImportError:
+    _old_style_instance = None
+
+def _abc_cache_token():
+    """Returns a token which changes whenever a class is registered
+    with any abstract base class.
+
+    """
+    import abc
+    try:
+        return abc.get_cache_token()  # Python 3.4+
+    except AttributeError:
+        return abc.ABCMeta._abc_invalidation_counter
 
 
 class json_options(object):
@@ -2886,6 +3863,10 @@ class json_options(object):
                              'always_escape_chars',
                              'warn_string_length',
                              'warn_max_depth',
+                             'max_depth',
+                             'max_errors',
+                             'max_warnings',
+                             'key_cache_size',
                              'int_as_float',
                              'decimal_context',
                              'float_type',
@@ -2916,6 +3897,11 @@ class json_options(object):
 
         self.warn_string_length = 0xfffd   # with 16-bit length prefix
         self.warn_max_depth = 64
+        self.max_depth = None  # None, or how deeply arrays and objects may be nested
+        self.max_errors = None    # None, or how many errors before decoding is stopped
+        self.max_warnings = None  # None, or how many different warnings are reported
+        self.key_cache_size = None  # Object keys are cached: None=during each decode, 0=never,
+                                    # or N=the most recent N across decodes by one JSON object
 
         self.date_format      = 'iso'  # or strftime format
         self.datetime_format  = 'iso'  # or strftime format
@@ -3034,6 +4020,28 @@ class json_options(object):
             else:
                 raise ValueError("Unknown keyword argument %r to initialize %s" % (kw,self.__class__.__name__))
 
+    def __setattr__(self, name, value):
+        # Any change to the options makes the snapshot from freeze() stale
+        object.__setattr__( self, name, value )
+        if name != '_frozen':
+            object.__setattr__( self, '_frozen', None )
+
+    def freeze(self):
+        """Returns a frozen_json_options snapshot of these options,
+        which the encoder and decoder read instead of the options
+        themselves.  The same snapshot is returned until an option is
+        changed, after which a new one is made.
+
+        Note that changing the contents of an option's value in place,
+        such as adding to the always_escape_chars set, is not noticed.
+
+        """
+        frozen = self.__dict__.get('_frozen')
+        if frozen is None:
+            frozen = frozen_json_options( self )
+            object.__setattr__( self, '_frozen', frozen )
+        return frozen
+
     def copy(self):
         other = self.__class__()
         other.copy_from( self )
@@ -3316,41 +4324,1467 @@ class json_options(object):
         for name in self.warn_behaviors:
             self.set_behavior(name, 'allow')
 
-    @property
-    def allow_or_warn_behaviors(self):
-        """Returns the set of all behaviors that are not forbidden (i.e., are allowed or warned)."""
-        return self.allow_behaviors.union( self.warn_behaviors )
+    @property
+    def allow_or_warn_behaviors(self):
+        """Returns the set of all behaviors that are not forbidden (i.e., are allowed or warned)."""
+        return self.allow_behaviors.union( self.warn_behaviors )
+
+    @property
+    def strictness(self):
+        return self._strictness
+
+    @strictness.setter
+    def strictness(self, strict):
+        """Changes whether the options should be re-configured for strict JSON conformance."""
+        if strict == STRICTNESS_WARN:
+            self._strictness = STRICTNESS_WARN
+            self.set_all_warn()
+        elif strict == STRICTNESS_STRICT or strict is True:
+            self._strictness = STRICTNESS_STRICT
+            self.keep_format = False
+            self.set_all_forbid()
+            self.warn_duplicate_keys()
+            self.warn_zero_byte()
+            self.warn_bom()
+            self.warn_non_portable()
+        elif strict == STRICTNESS_TOLERANT or strict is False:
+            self._strictness = STRICTNESS_TOLERANT
+            self.set_all_allow()
+            self.warn_duplicate_keys()
+            self.warn_zero_byte()
+            self.warn_leading_zeros()
+            self.leading_zero_radix = 8
+            self.warn_bom()
+            self.allow_non_portable()
+        else:
+            raise ValueError("Unknown strictness options %r" % strict)
+        self.allow_any_type_at_start()
+
+
+def _frozen_option_names():
+    """Returns the names of all the values that a frozen_json_options
+    snapshot has: every option, behavior, and behavior test such as
+    'is_forbid_comments' of the json_options class.
+
+    """
+    names = set( json_options()._plain_attrs )
+    names.update( ['strictness', 'leading_zero_radix_as_word',
+                   'zero_float', 'negzero_float', 'nan', 'inf', 'neginf',
+                   'all_behaviors', 'allow_or_warn_behaviors',
+                   '_strictness', '_leading_zero_radix', '_sort_keys', '_encode_enum_as'] )
+    for behavior, doc in json_options._behaviors:
+        names.add( behavior )
+        for value in json_options._behavior_values:
+            names.add( 'is_%s_%s' % (value, behavior) )
+    for value in json_options._behavior_values:
+        names.add( value + '_behaviors' )
+    return tuple(sorted(names))
+
+class frozen_json_options(object):
+    """A read-only snapshot of a json_options object, as returned by
+    its freeze() method.
+
+    Every option, behavior, and behavior test (like
+    'is_forbid_comments') is a plain attribute, so reading one costs
+    no more than any other attribute rather than going through the
+    properties of the json_options class.  Sets of values are frozen.
+
+    """
+    __slots__ = _frozen_option_names()
+
+    def __init__(self, options):
+        for name in self.__slots__:
+            val = getattr( options, name )
+            if isinstance(val, set):
+                val = frozenset(val)
+            object.__setattr__( self, name, val )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is read-only, change the json_options and freeze() them again"
+                             % self.__class__.__name__)
+
+    def get_behavior(self, name):
+        """Returns the value for a given behavior"""
+        if name not in self.all_behaviors:
+            raise ValueError('Unknown behavior',name)
+        return getattr( self, name )
+
+    def copy(self):
+        """Returns a new json_options object with the same options."""
+        other = json_options()
+        other.copy_from( self )
+        return other
+
+    # The methods which only read options are the same as for json_options
+    make_int = json_options.__dict__['make_int']
+    make_decimal = json_options.__dict__['make_decimal']
+    make_float = json_options.__dict__['make_float']
+    spaces_to_next_indent_level = json_options.__dict__['spaces_to_next_indent_level']
+    indentation_for_level = json_options.__dict__['indentation_for_level']
+
+
+# ----------------------------------------------------------------------
+# Fast decoder for strict JSON
+# ----------------------------------------------------------------------
+
+class _fast_decoder_fallback(Exception):
+    """Raised by the _fast_decoder when it comes across anything it
+    does not handle itself, such as a syntax error or something that
+    would cause a warning to be reported.
+    """
+    pass
+
+
+class _fast_decoder(object):
+    """A fast, non-recursive decoder which only accepts strict JSON.
+
+    This is used by the JSON.decode() method whenever the options are
+    such that the full decoder would not accept any non-standard
+    syntax anyway, and there are no decoding hooks.  Rather than
+    checking each of the many behaviors for every token it only
+    recognizes RFC 7159 syntax, dispatching on the first character of
+    each value through a small table.
+
+    It never reports errors.  If it finds anything it does not handle,
+    including anything that the full decoder would report as an error
+    or as a warning (if warnings are being collected), it raises a
+    _fast_decoder_fallback exception.  The caller is then expected to
+    start over with the full decoder, so that the resulting errors and
+    their positions are exactly the same as if this decoder had never
+    been tried.
+
+    """
+    import re
+    _ws_re = re.compile( u'[ \t\n\r]*' )
+    _simple_string_re = re.compile( u'"([^"\\\\\x00-\x1f\ud800-\udfff]*)"' )
+    _string_chunk_re = re.compile( u'[^"\\\\\x00-\x1f\ud800-\udfff]*' )
+    _hex4_re = re.compile( u'[0-9A-Fa-f]{4}' )
+    _nonbmp_re = _make_nonbmp_pattern()
+    _number_re = re.compile( u'(-?)(0|[1-9][0-9]*)(\\.[0-9]+)?(?:[eE]([-+]?[0-9]+))?' )
+    _simple_key_re = re.compile( u'"[^"\\\\\x00-\x1f\ud800-\udfff]+"[ \t\n\r]*:[ \t\n\r]*' )
+
+    # A string literal which decodes the same way whatever the options,
+    # and so may be kept in an object key cache.
+    _clean_string_re = re.compile( u'"(?:[^"\\\\\x00-\x1f\ud800-\udfff]|\\\\["\\\\bfnrt]'
+                                   u'|\\\\u(?!0000|[dD][89a-fA-F])[0-9a-fA-F]{4})*"' )
+
+    # Behaviors which do not extend the accepted syntax; all others
+    # must not be allowed for this decoder to be worth trying.
+    nonsyntax_behaviors = frozenset(['any_type_at_start', 'bom', 'duplicate_keys',
+                                     'non_portable', 'zero_byte'])
+
+    # Table of how a value is decoded based on its first character
+    _dispatch = { u'{': 'object', u'[': 'array', u'"': 'string',
+                  u't': 'true', u'f': 'false', u'n': 'null' }
+    for _c in u'-0123456789':
+        _dispatch[_c] = 'number'
+    del _c
+
+    # The punctuation and keywords, of the same type as the text
+    _quote, _colon, _comma = u'"', u':', u','
+    _object_closer, _array_closer = u'}', u']'
+    _true, _false, _null = u'true', u'false', u'null'
+
+    @classmethod
+    def can_decode_with(cls, options):
+        """Determines whether this decoder may be used for the given
+        json_options, that is whether none of the syntax-extending
+        behaviors are allowed.
+        """
+        return not (options.allow_behaviors - cls.nonsyntax_behaviors)
+
+    def __init__(self, options, collect_warnings=True):
+        """Prepares to decode according to the given json_options.
+
+        If collect_warnings is False, then conditions which would
+        only produce a warning will not cause a fallback.
+
+        """
+        def falls_back( behavior ):
+            value = getattr( options, behavior )
+            return value == FORBID or (value == WARN and collect_warnings)
+
+        self.options = options
+        self.fallback_non_portable = falls_back('non_portable')
+        self.fallback_duplicate_keys = falls_back('duplicate_keys')
+        self.fallback_zero_byte = falls_back('zero_byte')
+        self.fallback_any_type_at_start = falls_back('any_type_at_start')
+        self.warn_string_length = options.warn_string_length
+        # Containers nested deeper than this are left to the full decoder
+        self.fallback_depth = options.max_depth
+        if self.fallback_non_portable and \
+                (self.fallback_depth is None or options.warn_max_depth < self.fallback_depth):
+            self.fallback_depth = options.warn_max_depth
+        self.key_cache = None  # May be set to a JSON object key cache
+        if options.sort_keys == SORT_PRESERVE and _OrderedDict:
+            self.dict_type = _OrderedDict
+        else:
+            self.dict_type = dict
+        self.plain_ints = not (options.int_as_float or options.keep_format)
+        self.plain_floats = (options.float_type != NUMBER_DECIMAL)
+        if options.is_forbid_js_string_escapes:
+            escapes = JSON._escapes_json
+        else:
+            escapes = JSON._escapes_js
+        # Octal escapes, including \0, are left to the full decoder
+        self.escapes = dict([(k,v) for k,v in escapes.items() if k not in helpers.octaldigits])
+
+    def decode(self, text, pos=0):
+        """Decodes the single JSON value at the given offset of the
+        Unicode string.  Returns a tuple (value, end_offset), where any
+        whitespace following the value has been skipped.
+
+        Raises _fast_decoder_fallback if the full decoder is needed.
+
+        """
+        ws_match = self._ws_re.match
+        dispatch = self._dispatch
+        fallback_non_portable = self.fallback_non_portable
+        fallback_duplicate_keys = self.fallback_duplicate_keys
+        fallback_depth = self.fallback_depth
+        dict_type = self.dict_type
+        stack = []  # Open containers, as [container, key] lists
+
+        pos = ws_match( text, pos ).end()
+        if self.fallback_any_type_at_start and dispatch.get( text[pos:pos+1] ) not in ('object', 'array'):
+            raise _fast_decoder_fallback()
+        comma, object_closer, array_closer = self._comma, self._object_closer, self._array_closer
+
+        while True:
+            # ----- Decode one value starting at pos
+            kind = dispatch.get( text[pos:pos+1] )
+            if kind == 'string':
+                value, pos = self.decode_string( text, pos )
+            elif kind == 'number':
+                value, pos = self.decode_number( text, pos )
+            elif kind == 'object' or kind == 'array':
+                if fallback_depth is not None and len(stack) + 1 > fallback_depth:
+                    raise _fast_decoder_fallback()
+                if kind == 'object':
+                    container, closer = dict_type(), object_closer
+                else:
+                    container, closer = [], array_closer
+                pos = ws_match( text, pos+1 ).end()
+                if text[pos:pos+1] == closer:
+                    value = container
+                    pos += 1
+                else:
+                    top = [container, None]
+                    stack.append( top )
+                    if kind == 'object':
+                        top[1], pos = self.decode_key( text, pos )
+                    continue  # ----- Go decode the first member
+            elif kind == 'true' and text[pos:pos+4] == self._true:
+                value, pos = True, pos+4
+            elif kind == 'false' and text[pos:pos+5] == self._false:
+                value, pos = False, pos+5
+            elif kind == 'null' and text[pos:pos+4] == self._null:
+                value, pos = None, pos+4
+            else:
+                raise _fast_decoder_fallback()
+
+            # ----- Add completed values to their containers, closing
+            # those containers which end here.
+            while True:
+                pos = ws_match( text, pos ).end()
+                if not stack:
+                    return value, pos
+                top = stack[-1]
+                container = top[0]
+                key = top[1]
+                if key is None:
+                    container.append( value )
+                    closer = array_closer
+                else:
+                    if fallback_duplicate_keys and key in container:
+                        raise _fast_decoder_fallback()
+                    container[key] = value
+                    closer = object_closer
+                c = text[pos:pos+1]
+                if c == comma:
+                    pos = ws_match( text, pos+1 ).end()
+                    if key is not None:
+                        top[1], pos = self.decode_key( text, pos )
+                    break  # ----- Go decode the next member
+                elif c == closer:
+                    pos += 1
+                    value = container
+                    stack.pop()
+                else:
+                    raise _fast_decoder_fallback()
+
+    def skip(self, text, pos=0, depth=0):
+        """Checks the single JSON value at the given offset exactly as
+        decode() would, but without building any containers.  Returns
+        the offset following the value and any whitespace after it.
+
+        The value must be a member of an array or object, and so be
+        followed by a comma or closing bracket.  The depth is how
+        deeply nested it already is, which is needed to check the
+        warn_max_depth and max_depth options.
+
+        Raises _fast_decoder_fallback if the full decoder is needed.
+
+        """
+        ws_match = self._ws_re.match
+        dispatch = self._dispatch
+        string_match = self._simple_string_re.match
+        number_match = self._number_re.match
+        fallback_non_portable = self.fallback_non_portable
+        fallback_duplicate_keys = self.fallback_duplicate_keys
+        if fallback_non_portable or fallback_duplicate_keys:
+            key_match = None  # Keys must be decoded to be checked
+        else:
+            key_match = self._simple_key_re.match
+        if self.fallback_depth is None:
+            max_depth = None
+        else:
+            max_depth = self.fallback_depth - depth
+        stack = []  # Open containers, as [closer, keys_seen] lists
+
+        pos = ws_match( text, pos ).end()
+        comma, object_closer, array_closer = self._comma, self._object_closer, self._array_closer
+
+        while True:
+            # ----- Check one value starting at pos
+            kind = dispatch.get( text[pos:pos+1] )
+            if kind == 'string':
+                m = string_match( text, pos )
+                if m and not fallback_non_portable:
+                    pos = m.end()
+                else:
+                    pos = self.decode_string( text, pos )[1]
+            elif kind == 'number':
+                if fallback_non_portable:
+                    pos = self.decode_number( text, pos )[1]
+                else:
+                    m = number_match( text, pos )
+                    if not m:
+                        raise _fast_decoder_fallback()
+                    pos = m.end()
+                    c = text[pos:pos+1]
+                    if c and c in u'0123456789.+-eE':
+                        raise _fast_decoder_fallback()
+            elif kind == 'object' or kind == 'array':
+                if max_depth is not None and len(stack) + 1 > max_depth:
+                    raise _fast_decoder_fallback()
+                if kind == 'object':
+                    closer = object_closer
+                else:
+                    closer = array_closer
+                pos = ws_match( text, pos+1 ).end()
+                if text[pos:pos+1] == closer:
+                    pos += 1
+                elif kind == 'object':
+                    m = key_match and key_match( text, pos )
+                    if m:
+                        stack.append( [closer, None] )
+                        pos = m.end()
+                        continue
+                    key, pos = self.decode_key( text, pos )
+                    if fallback_duplicate_keys:
+                        stack.append( [closer, set([key])] )
+                    else:
+                        stack.append( [closer, None] )
+                    continue  # ----- Go check the first member
+                else:
+                    stack.append( [closer, None] )
+                    continue
+            elif kind == 'true' and text[pos:pos+4] == self._true:
+                pos += 4
+            elif kind == 'false' and text[pos:pos+5] == self._false:
+                pos += 5
+            elif kind == 'null' and text[pos:pos+4] == self._null:
+                pos += 4
+            else:
+                raise _fast_decoder_fallback()
+
+            # ----- Close those containers which end here
+            while True:
+                pos = ws_match( text, pos ).end()
+                c = text[pos:pos+1]
+                if not stack:
+                    if c != comma and c != object_closer and c != array_closer:
+                        raise _fast_decoder_fallback()
+                    return pos
+                closer, keys_seen = stack[-1]
+                if c == comma:
+                    pos = ws_match( text, pos+1 ).end()
+                    if closer == object_closer:
+                        m = key_match and key_match( text, pos )
+                        if m:
+                            pos = m.end()
+                            break
+                        key, pos = self.decode_key( text, pos )
+                        if keys_seen is not None:
+                            if key in keys_seen:
+                                raise _fast_decoder_fallback()
+                            keys_seen.add( key )
+                    break  # ----- Go check the next member
+                elif c == closer:
+                    pos += 1
+                    stack.pop()
+                else:
+                    raise _fast_decoder_fallback()
+
+    def decode_key(self, text, pos):
+        """Decodes an object key and the following colon, returning
+        the key and the offset of the member value.
+        """
+        if text[pos:pos+1] != self._quote:
+            raise _fast_decoder_fallback()
+        key_cache = self.key_cache
+        if key_cache is None:
+            key, pos = self.decode_string( text, pos )
+        else:
+            # Simple keys are cached by their value, and so only need
+            # to be looked up; others by their literal, which need not
+            # then be decoded.  These never clash as only the literals
+            # include quotation marks.
+            key = literal = None
+            m = self._simple_string_re.match( text, pos )
+            if m:
+                literal = m.group(1)
+            else:
+                m = self._clean_string_re.match( text, pos )
+                if m:
+                    literal = m.group()
+            if literal is not None:
+                key = key_cache.get( literal )
+            if key is not None:
+                pos = m.end()
+            else:
+                key, pos = self.decode_string( text, pos )
+                # Only keys that never cause a warning are cached
+                if literal is not None and not (self._nonbmp_re and self._nonbmp_re.search( key )) \
+                        and not (self.warn_string_length and len(key) > self.warn_string_length):
+                    key_cache[literal] = key
+        if not key and self.fallback_non_portable:
+            raise _fast_decoder_fallback()  # Empty "" keys cause a warning
+        pos = self._ws_re.match( text, pos ).end()
+        if text[pos:pos+1] != self._colon:
+            raise _fast_decoder_fallback()
+        return key, self._ws_re.match( text, pos+1 ).end()
+
+    def decode_string(self, text, pos):
+        """Decodes the string literal starting at the given offset.
+        Returns a tuple (string, end_offset).
+        """
+        m = self._simple_string_re.match( text, pos )
+        if m:
+            # By far the most common case, a string without any escapes
+            s = m.group(1) or ''
+            pos = m.end()
+        else:
+            chunks = []
+            pos += 1
+            while True:
+                m = self._string_chunk_re.match( text, pos )
+                if m.end() > pos:
+                    chunks.append( m.group() )
+                    pos = m.end()
+                c = text[pos:pos+1]
+                if c == u'"':
+                    pos += 1
+                    break
+                elif c != u'\\':
+                    raise _fast_decoder_fallback()  # Control char, surrogate, or end of input
+                c = text[pos+1:pos+2]
+                if c in self.escapes:
+                    chunks.append( self.escapes[c] )
+                    pos += 2
+                elif c == u'u' and self._hex4_re.match( text, pos+2 ):
+                    codepoint = int( text[pos+2:pos+6], 16 )
+                    pos += 6
+                    if codepoint < 128:
+                        if codepoint == 0 and self.fallback_zero_byte:
+                            raise _fast_decoder_fallback()
+                        chunks.append( chr(codepoint) )
+                    elif 0xd800 <= codepoint <= 0xdbff:
+                        if text[pos:pos+2] != u'\\u' or not self._hex4_re.match( text, pos+2 ):
+                            raise _fast_decoder_fallback()
+                        low = int( text[pos+2:pos+6], 16 )
+                        if not 0xdc00 <= low <= 0xdfff:
+                            raise _fast_decoder_fallback()
+                        chunks.append( helpers.surrogate_pair_as_unicode( unichr(codepoint), unichr(low) ) )
+                        pos += 6
+                    elif 0xdc00 <= codepoint <= 0xdfff:
+                        raise _fast_decoder_fallback()
+                    else:
+                        chunks.append( unichr(codepoint) )
+                else:
+                    raise _fast_decoder_fallback()
+            s = ''.join( chunks )
+
+        if self.fallback_non_portable and s:
+            if (self.warn_string_length and len(s) > self.warn_string_length) \
+                    or (self._nonbmp_re and self._nonbmp_re.search( s )):
+                raise _fast_decoder_fallback()
+        return s, pos
+
+    def decode_number(self, text, pos):
+        """Decodes the number starting at the given offset.
+        Returns a tuple (number, end_offset).
+        """
+        m = self._number_re.match( text, pos )
+        if not m:
+            raise _fast_decoder_fallback()
+        c = text[m.end():m.end()+1]
+        if c and c in u'0123456789.+-eE':
+            raise _fast_decoder_fallback()  # Not a strict JSON number
+        return self.make_number( m.group(), *m.groups() ), m.end()
+
+    def make_number(self, number, minus, units_s, fraction_s, exponent_s):
+        """Converts the matched parts of a strict JSON number into
+        the appropriate Python number type.
+
+        """
+        if minus:
+            sign = -1
+        else:
+            sign = 1
+        exponent = int( exponent_s or 0 )
+
+        if not fraction_s and exponent >= 0:
+            # An integer
+            ival = int( units_s )
+            if exponent:
+                ival *= 10**exponent
+            if self.fallback_non_portable and \
+                    ((sign < 0 and ival == 0) or ival > decode_statistics.double_int_max):
+                raise _fast_decoder_fallback()
+            if not self.plain_ints:
+                n = self.options.make_int( ival, sign )
+            elif sign < 0:
+                if ival == 0:
+                    n = self.options.negzero_float
+                else:
+                    n = - ival
+            else:
+                n = ival
+        else:
+            # A float, determined the same way as the full decoder does
+            number = number[len(minus):]
+            sigdigits = len( (units_s + (fraction_s or '')[1:]).replace('0',' ').strip() )
+            if exponent < float_minexp or exponent > float_maxexp or sigdigits > float_sigdigits:
+                n = self.options.make_decimal( number, sign )
+            elif self.plain_floats:
+                n = float( number )
+                if sign < 0:
+                    n *= -1
+            else:
+                n = self.options.make_float( number, sign )
+            if self.fallback_non_portable and \
+                    (helpers.is_negzero(n) or (decimal and isinstance(n, decimal.Decimal))):
+                raise _fast_decoder_fallback()
+
+        return n
+
+
+class _fast_utf8_decoder(_fast_decoder):
+    """A variant of the _fast_decoder which decodes strict JSON
+    directly from UTF-8 encoded bytes, or from any other object which
+    the regular expression engine can search, such as an mmap.
+
+    Only the string literals are ever converted into Unicode, one at a
+    time, so no Unicode copy of the whole document is made.  Anything
+    else which is not ASCII, including a BOM or a document which is in
+    some other encoding, causes a fallback.
+
+    """
+    import re
+    _ws_re = re.compile( b'[ \t\n\r]*' )
+    _simple_string_re = re.compile( b'"([^"\\\\\x00-\x1f]*)"' )
+    _string_re = re.compile( b'"(?:[^"\\\\\x00-\x1f]+|\\\\[^\x00-\x1f])*"' )
+    _number_re = re.compile( b'(-?)(0|[1-9][0-9]*)(\\.[0-9]+)?(?:[eE]([-+]?[0-9]+))?' )
+    _surrogate_re = re.compile( u'[\ud800-\udfff]' )
+
+    _dispatch = dict([ (c.encode('ascii'), kind) for c, kind in _fast_decoder._dispatch.items() ])
+
+    _quote, _colon, _comma = b'"', b':', b','
+    _object_closer, _array_closer = b'}', b']'
+    _true, _false, _null = b'true', b'false', b'null'
+
+    def __init__(self, options, collect_warnings=True):
+        _fast_decoder.__init__( self, options, collect_warnings )
+        # Decodes the string literals once they are converted to Unicode
+        self.text_decoder = _fast_decoder( options, collect_warnings )
+
+    def decode_string(self, text, pos):
+        """Decodes the string literal starting at the given offset.
+        Returns a tuple (string, end_offset).
+
+        """
+        m = self._simple_string_re.match( text, pos )
+        if m:
+            # A string without any escapes, the most common case
+            raw = m.group(1)
+            if not raw:
+                return '', m.end()
+            try:
+                s = raw.decode('utf-8')
+            except UnicodeDecodeError:
+                raise _fast_decoder_fallback()
+            if len(s) != len(raw) and self._surrogate_re.search( s ):
+                raise _fast_decoder_fallback()  # Encoded surrogates, or a narrow Python
+            if self.fallback_non_portable:
+                if (self.warn_string_length and len(s) > self.warn_string_length) \
+                        or (self._nonbmp_re and self._nonbmp_re.search( s )):
+                    raise _fast_decoder_fallback()
+            return s, m.end()
+
+        m = self._string_re.match( text, pos )
+        if not m:
+            raise _fast_decoder_fallback()
+        try:
+            literal = m.group().decode('utf-8')
+        except UnicodeDecodeError:
+            raise _fast_decoder_fallback()
+        s, end = self.text_decoder.decode_string( literal, 0 )
+        if end != len(literal):
+            raise _fast_decoder_fallback()
+        return s, m.end()
+
+    def decode_number(self, text, pos):
+        """Decodes the number starting at the given offset.
+        Returns a tuple (number, end_offset).
+
+        """
+        m = self._number_re.match( text, pos )
+        if not m:
+            raise _fast_decoder_fallback()
+        c = text[m.end():m.end()+1]
+        if c and c in b'0123456789.+-eE':
+            raise _fast_decoder_fallback()  # Not a strict JSON number
+        minus, units_s, fraction_s, exponent_s = m.groups()
+        if fraction_s is None and exponent_s is None:
+            # Integers can be converted straight from the bytes
+            return self.make_number( None, minus, units_s, None, None ), m.end()
+        minus, units_s, fraction_s, exponent_s = [g and g.decode('ascii') for g in m.groups()]
+        return self.make_number( m.group().decode('ascii'), minus, units_s, fraction_s, exponent_s ), m.end()
+
+
+# ----------------------------------------------------------------------
+# Incremental decoding
+# ----------------------------------------------------------------------
+
+class _text_stream_decoder(object):
+    """Turns a stream which arrives a piece at a time into Unicode
+    text, as the incremental_decoder, iterparse() and decode_lines()
+    all need to.
+
+    The pieces may be Unicode strings or byte strings.  If they are
+    bytes and no encoding was given, then the Unicode encoding is
+    detected from the first few bytes of the stream.  Any Byte Order
+    Mark at the start of the stream is removed; if the stream is
+    bytes the BOM is kept, still encoded, in the 'bom' attribute.
+
+    """
+    def __init__(self, encoding=None):
+        self.encoding = encoding
+        self.bom = None
+        self.__codec = None
+        self.__decoder = None  # An incremental codec decoder
+        self.__pending = None  # Bytes waiting for encoding detection
+        self.__at_start = True
+
+    def decode(self, piece, final=False):
+        """Returns the Unicode text of the next piece of the stream.
+        The 'final' argument is true for the last piece.
+        """
+        import sys
+        if isinstance(piece, unicode):
+            text = piece
+        else:
+            try:
+                text = self.__decode_bytes( piece, final )
+            except JSONError:
+                raise
+            except Exception, err:
+                # Re-raise as a JSONDecodeError
+                e2 = sys.exc_info()
+                newerr = JSONDecodeError("a Unicode decoding error occurred")
+                # Simulate Python 3's: "raise X from Y" exception chaining
+                newerr.__cause__ = err
+                newerr.__traceback__ = e2[2]
+                raise newerr
+        if self.__at_start and text:
+            self.__at_start = False
+            if text[0] == u'\ufeff':
+                if self.__codec:
+                    self.bom = self.__codec.encode( text[0] )[0]
+                text = text[1:]
+        return text
+
+    def finish(self):
+        """Returns any text which is still waiting to be decoded at
+        the end of the stream.
+        """
+        if self.__pending is None and self.__decoder is None:
+            return u''
+        return self.decode( helpers.make_raw_bytes([]), final=True )
+
+    def __decode_bytes(self, chunk, final=False):
+        """Converts a piece of a byte stream into Unicode text."""
+        if self.__decoder is None:
+            if self.__pending:
+                chunk = self.__pending + chunk
+            encoding = self.encoding
+            if encoding is None or encoding == 'auto':
+                if len(chunk) < 4 and not final:
+                    self.__pending = chunk  # Wait for enough to detect encoding
+                    return u''
+                encoding = helpers.auto_detect_encoding( chunk )
+            self.__pending = None
+            codec = helpers.lookup_codec( encoding )
+            if not codec:
+                raise JSONDecodeError('no codec available for character encoding',encoding)
+            if not codec.incrementaldecoder:
+                raise JSONDecodeError('codec can not decode incrementally',encoding)
+            self.__codec = codec
+            self.__decoder = codec.incrementaldecoder()
+        return self.__decoder.decode( chunk, final )
+
+
+class incremental_decoder(object):
+    """Decodes a stream of JSON values which arrives a piece at a
+    time, such as from a network connection.
+
+    The stream may contain any number of top-level JSON values, one
+    after another and optionally separated by whitespace.  Each piece
+    of the stream is given to the feed() method, which returns a list
+    of any values that have been completed so far.  Only the text of
+    the value currently being read is held onto, so the memory used
+    is bounded by the largest single value rather than by the size of
+    the whole stream.  At the end of the stream call close().
+
+        dec = JSON().incremental_decoder()
+        for chunk in chunks:
+            for value in dec.feed( chunk ):
+                handle( value )
+        for value in dec.close():
+            handle( value )
+
+    Each completed value is decoded with the JSON object's decode()
+    method, so all of its options and hooks apply.  Errors are raised
+    as a JSONDecodeError (warnings are ignored), with their positions
+    given relative to the whole stream.  After an error the decoder
+    carries on with the following value.
+
+    The pieces may be Unicode strings or byte strings.  If they are
+    bytes and no encoding was given, then the Unicode encoding is
+    detected from the first few bytes of the stream.  Any Byte Order
+    Mark at the start of the stream is discarded.
+
+    Usually this object is created with the JSON.incremental_decoder()
+    method rather than directly.
+
+    """
+    def __init__(self, json=None, encoding=None):
+        import re
+        if json is None:
+            json = JSON()
+        self.__json = json
+        self.__stream = _text_stream_decoder( encoding )
+        self.__closed = False
+        self.__ready = []      # Values decoded but not yet returned
+        self.__unscanned = u'' # Text held over to be scanned with the next piece
+
+        self.__pieces = []     # Text of the value currently being read
+        self.__in_value = False
+        self.__depth = 0       # Nesting depth of arrays and objects
+        self.__quote = None    # Quote character, if inside a string
+        self.__comment = None  # Comment opener, if inside a comment
+        self.__position = position_marker()  # Stream position of the text not yet accounted for
+        self.__value_position = None  # Stream position where the current value began
+
+        options = json.options
+        quotes = u'"'
+        if not options.is_forbid_single_quoted_strings:
+            quotes += u"'"
+        self.__quotes = quotes
+        self.__allow_comments = not options.is_forbid_comments
+        if self.__allow_comments:
+            slash = u'/'
+        else:
+            slash = u''
+        # Everything inside an array or object up to the next bracket,
+        # passing over whole strings and comments
+        skip_patterns = [ q + u'[^\\\\' + q + u']*(?:\\\\[\\s\\S][^\\\\' + q + u']*)*' + q
+                          for q in quotes ]
+        if self.__allow_comments:
+            skip_patterns.extend([ u'//[^\r\n\u2028\u2029]*[\r\n\u2028\u2029]', u'/\\*[\\s\\S]*?\\*/' ])
+        ordinary = u'[^][{}' + quotes + slash + u']*'
+        self.__skip_re = re.compile( ordinary + u'(?:(?:' + u'|'.join(skip_patterns) + u')' + ordinary + u')*' )
+        # Characters which end a string (or escape the next one)
+        self.__string_res = dict([ (q, re.compile( u'[\\\\' + q + u']' )) for q in quotes ])
+        # Characters which end a top-level number or identifier
+        self.__scalar_end_re = re.compile( u'[][{},:\\s' + quotes + slash + u']', re.UNICODE )
+        self.__line_end_re = re.compile( u'[\r\n\u2028\u2029]' )
+        self.__ws_re = buffered_stream._run_patterns[ helpers.char_is_unicode_ws ]
+
+    def feed(self, chunk):
+        """Adds the next piece of the stream, and returns a list of
+        all the values which are now complete (possibly an empty list).
+        """
+        if self.__closed:
+            raise JSONDecodeError('Can not feed more input after the decoder is closed')
+        return self.__scan( self.__add_text( self.__stream.decode( chunk ) ) )
+
+    def close(self):
+        """Marks the end of the stream, and returns a list of any
+        values which were still waiting to be completed.
+
+        If the stream ends in the middle of a value, that value will
+        be decoded anyway, usually causing an error to be raised.
+        If an error is raised, calling close() again will return any
+        values which followed the bad one.
+
+        """
+        text = u''
+        if not self.__closed:
+            self.__closed = True
+            text = self.__stream.finish()
+        return self.__scan( self.__add_text( text ), at_end=True )
+
+    def __add_text(self, text):
+        """Returns the text to be scanned next, being any held over
+        from before followed by the given new text.
+        """
+        if self.__unscanned:
+            text = self.__unscanned + text
+            self.__unscanned = u''
+        return text
+
+    def __scan(self, text, at_end=False):
+        """Scans the next piece of text to find the ends of values,
+        returning a list of all the values which were completed.
+
+        Only the text of a value which is still incomplete is kept,
+        as a list of pieces which are joined together once its end
+        is found.  A final character whose meaning depends on what
+        follows it, such as a '/' which may begin a comment, is held
+        over to be scanned along with the next piece.
+
+        """
+        values = self.__ready
+        self.__ready = []
+        n = len(text)
+        i = 0
+        stop = n    # Where scanning of this text ends
+        begin = 0   # Where the current value, or the gap before it, begins
+
+        while i < n:
+            end = None  # Set once the end of a top-level value is found
+            if self.__comment == u'//':
+                m = self.__line_end_re.search( text, i )
+                if not m:
+                    break
+                i = m.end()
+                self.__comment = None
+            elif self.__comment == u'/*':
+                j = text.find( u'*/', i )
+                if j < 0:
+                    if text[-1] == u'*' and n - 1 >= i and not at_end:
+                        stop = n - 1  # The '/' may come next
+                    break
+                i = j + 2
+                self.__comment = None
+            elif self.__quote:
+                m = self.__string_res[self.__quote].search( text, i )
+                if not m:
+                    break
+                if m.group() == u'\\':
+                    i = m.end() + 1
+                    if i > n:
+                        if not at_end:
+                            stop = m.start()  # The escaped character has not arrived yet
+                        break
+                else:
+                    i = m.end()
+                    self.__quote = None
+                    if self.__depth == 0:
+                        end = i
+            elif self.__depth > 0:
+                i = self.__skip_re.match( text, i ).end()
+                if i >= n:
+                    break
+                c = text[i]
+                i += 1
+                if c in u'[{':
+                    self.__depth += 1
+                elif c in u']}':
+                    self.__depth -= 1
+                    if self.__depth == 0:
+                        end = i
+                elif c == u'/':
+                    if i >= n:
+                        if not at_end:
+                            stop = i - 1  # Could be the start of a comment
+                        break
+                    if text[i] in u'/*':
+                        self.__comment = c + text[i]
+                        i += 1
+                else:
+                    self.__quote = c
+            elif self.__in_value:
+                # Inside a top-level number or identifier
+                m = self.__scalar_end_re.search( text, i )
+                if not m:
+                    break
+                i = m.start()
+                if i == begin and not self.__pieces:
+                    i += 1  # Let the decoder complain about a stray character
+                end = i
+            else:
+                # Between top-level values
+                m = self.__ws_re.match( text, i )
+                if m:
+                    i = m.end()
+                    if i >= n:
+                        break
+                c = text[i]
+                if helpers.char_is_unicode_ws( c ):
+                    i += 1
+                elif c == u'/' and self.__allow_comments and text[i+1:i+2] in (u'/', u'*'):
+                    self.__comment = text[i:i+2]
+                    i += 2
+                elif c == u'/' and self.__allow_comments and i + 1 >= n and not at_end:
+                    stop = i  # Could be the start of a comment
+                    break
+                else:
+                    self.__position.advance( text[begin:i] )
+                    self.__value_position = self.__position.copy()
+                    self.__in_value = True
+                    begin = i
+                    if c in u'[{':
+                        self.__depth = 1
+                        i += 1
+                    elif c in self.__quotes:
+                        self.__quote = c
+                        i += 1
+
+            if end is not None:
+                self.__pieces.append( text[begin:end] )
+                begin = end
+                try:
+                    values.append( self.__decode_value() )
+                except JSONError:
+                    # Hold on to the good values for next time, and
+                    # start scanning over again just after this bad value.
+                    self.__ready = values
+                    self.__unscanned = text[end:]
+                    raise
+
+        if self.__in_value:
+            self.__pieces.append( text[begin:stop] )
+            if at_end:
+                values.append( self.__decode_value() )  # Incomplete value
+        else:
+            self.__position.advance( text[begin:stop] )
+        self.__unscanned = text[stop:]
+        return values
+
+    def __decode_value(self):
+        """Decodes the value whose text has just been completed."""
+        text = u''.join( self.__pieces )
+        self.__pieces = []
+        self.__in_value = False
+        self.__depth = 0
+        self.__quote = self.__comment = None
+        self.__position.advance( text )
+        result = self.__json.decode( text, return_errors=True )
+        bad = [err for err in result.errors if err.severity in ('fatal','error')]
+        if bad:
+            raise _relocate_error( bad[0], self.__value_position )
+        return result.object
+
+
+# ----------------------------------------------------------------------
+# Structural index
+# ----------------------------------------------------------------------
+
+class structural_index(object):
+    """An index of the structure of a JSON document, recording the
+    offset of every quotation mark, bracket, colon, and comma which
+    is part of the syntax (that is, not inside a string literal or a
+    comment).  It allows the extent of a value to be found, or the
+    members of an array or object to be counted, without decoding
+    them or re-scanning their text.
+
+    The index is built in a single pass over the text, and held in
+    two arrays of integers:
+
+        * offsets - the character offset of each of those characters,
+                    in ascending order
+
+        * partners - for each entry in offsets, the entry number of
+                     the matching bracket or quotation mark, or -1 if
+                     it is a colon or comma or has no match
+
+    The text must be a Unicode string (or it will be decoded as with
+    the decode() function).  If a JSON object is given then its
+    options determine whether comments and single-quoted strings are
+    recognized; otherwise both are.  The index only looks at the
+    structure, it does not check that the document is valid JSON.
+
+    """
+    def __init__(self, text, json=None):
+        import re
+        from array import array
+        if not isinstance(text, unicode):
+            text = helpers.unicode_decode( text ).string
+        self.text = text
+        if json is None or not json.options.is_forbid_single_quoted_strings:
+            quotes = u'"\''
+        else:
+            quotes = u'"'
+        allow_comments = json is None or not json.options.is_forbid_comments
+        # Each kind of token is told apart by its last matched group
+        token_re = _make_structure_token_pattern( quotes, allow_comments )
+        string_groups = range( 1, len(quotes) + 1 )
+        punct_group, opener_group, closer_group = len(quotes) + 1, len(quotes) + 2, len(quotes) + 3
+        blank_pattern = u'\\s'
+        if allow_comments:
+            blank_pattern += u'|//[^\r\n\u2028\u2029]*|/\\*[\\s\\S]*?\\*/'
+        self.__blank_re = re.compile( u'(?:' + blank_pattern + u')*\\Z', re.UNICODE )
+
+        offsets = array('l')
+        append = offsets.append
+        pairs = []   # Entry numbers of matching brackets and quotes, two by two
+        stack = []   # Entry numbers of the open brackets
+        n = 0        # The number of entries so far
+        for m in token_re.finditer( text ):
+            kind = m.lastindex
+            if kind == punct_group:
+                append( m.start() )
+                n += 1
+            elif kind in string_groups:
+                append( m.start() )
+                append( m.end() - 1 )
+                pairs.append( n )
+                pairs.append( n + 1 )
+                n += 2
+            elif kind == opener_group:
+                append( m.start() )
+                stack.append( n )
+                n += 1
+            elif kind == closer_group:
+                append( m.start() )
+                if stack:
+                    opener = stack.pop()
+                    if text[ offsets[opener] ] + m.group() in (u'[]', u'{}'):
+                        pairs.append( opener )
+                        pairs.append( n )
+                n += 1
+            elif text[ m.start() ] in quotes:
+                append( m.start() )  # An unterminated string
+                n += 1
+
+        partners = array('l', [-1]) * n
+        for i in range( 0, len(pairs), 2 ):
+            partners[ pairs[i] ] = pairs[i+1]
+            partners[ pairs[i+1] ] = pairs[i]
+        self.offsets = offsets
+        self.partners = partners
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def find(self, offset):
+        """Returns the entry number for the structural character at the
+        given offset, or -1 if there is none there.
+
+        """
+        import bisect
+        n = bisect.bisect_left( self.offsets, offset )
+        if n < len(self.offsets) and self.offsets[n] == offset:
+            return n
+        return -1
+
+    def partner(self, offset):
+        """Returns the offset of the bracket or quotation mark which
+        matches the one at the given offset, or -1 if there is none.
+
+        """
+        n = self.find( offset )
+        if n < 0 or self.partners[n] < 0:
+            return -1
+        return self.offsets[ self.partners[n] ]
+
+    def value_end(self, offset):
+        """Returns the offset just past the value which starts at the
+        given offset.  For an unterminated array, object, or string
+        that is the end of the text.
+
+        For a number or other bare word it is where the next
+        structural character, or whitespace, begins.
+
+        """
+        text = self.text
+        c = text[offset:offset+1]
+        if c and c in u'[{"\'':
+            n = self.find( offset )
+            if n >= 0:
+                if self.partners[n] < 0:
+                    return len(text)
+                return self.offsets[ self.partners[n] ] + 1
+        import bisect
+        n = bisect.bisect_right( self.offsets, offset )
+        if n < len(self.offsets):
+            end = self.offsets[n]
+        else:
+            end = len(text)
+        word = text[offset:end].split( None, 1 )
+        if not word:
+            return offset
+        return offset + len(word[0])
+
+    def count_elements(self, offset):
+        """Returns the number of elements in the array, or properties
+        in the object, which starts at the given offset.  Omitted
+        array elements are counted, as is any final element which
+        follows a trailing comma only if it is not empty.
+
+        """
+        n = self.find( offset )
+        if n < 0 or self.text[offset] not in u'[{':
+            raise ValueError("There is no array or object at offset %d" % offset)
+        end = self.partners[n]
+        if end < 0:
+            end = len(self.offsets)
+        offsets, partners, text = self.offsets, self.partners, self.text
+        count = 0
+        last = offsets[n]  # Offset of the opener or the last comma
+        n += 1
+        while n < end:
+            if partners[n] > n:
+                n = partners[n]  # Jump over a nested value or string
+            elif text[ offsets[n] ] == u',':
+                count += 1
+                last = offsets[n]
+            n += 1
+        if end < len(offsets):
+            tail = text[ last + 1 : offsets[end] ]
+        else:
+            tail = text[ last + 1 : ]
+        if not self.__blank_re.match( tail ):
+            count += 1  # Unless it was empty, after a trailing comma
+        return count
+
+# ----------------------------------------------------------------------
+# Lazy decoding
+# ----------------------------------------------------------------------
+
+# Find the abstract container types
+try:
+    from collections.abc import Mapping as _Mapping, Sequence as _Sequence
+except ImportError:
+    from collections import Mapping as _Mapping, Sequence as _Sequence
+
+
+class _lazy_document(object):
+    """The text of a lazily decoded document, which is decoded a piece
+    at a time on behalf of the lazy_array and lazy_object proxies made
+    from it.  See the 'lazy' argument of the JSON.decode() method.
+
+    Values are passed over without being decoded by matching up the
+    brackets, quotation marks, and comments around them.  A value is
+    only decoded, in full and with all of the options and hooks, if
+    and when it is asked for.
+
+    """
+    def __init__(self, json, state):
+        import re
+        self.json = json
+        self.state = state
+        self.text = state.buf.text
+        self.num_checked = len(state.errors)  # Errors which were already reported
+        options = state.options
+        quotes = u'"'
+        if not options.is_forbid_single_quoted_strings:
+            quotes += u"'"
+        self.quotes = quotes
+        if options.is_forbid_comments:
+            slash = u''
+        else:
+            slash = u'/'
+        # A whole string literal, even if unterminated
+        string_patterns = dict([ (q, q + u'(?:[^\\\\' + q + u']+|\\\\[\\s\\S])*' + q + u'?') for q in quotes ])
+        self.string_res = dict([ (q, re.compile( p )) for q, p in string_patterns.items() ])
+        # Everything inside an array or object up to the next bracket
+        # (or comment), passing over any string literals
+        self.filler_re = re.compile( u'(?:[^][{}' + quotes + slash + u']+|'
+                                     + u'|'.join( string_patterns.values() ) + u')*' )
+        # Characters which end a number or identifier
+        self.scalar_end_re = re.compile( u'[][{},:\\s' + quotes + slash + u']', re.UNICODE )
+        self.line_end_re = re.compile( u'[\r\n\u2028\u2029]' )
+
+    def decimal_context(self):
+        if self.state.options.decimal_context:
+            return decimal.localcontext( self.state.options.decimal_context )
+        else:
+            return _dummy_context_manager
+
+    def raise_errors(self):
+        """Raises the first error, if any, that the decoder has found
+        since this was last called.  Warnings are ignored, and so are
+        any further errors, which usually just follow from the first.
+
+        """
+        errors = self.state.errors
+        while self.num_checked < len(errors):
+            err = errors[ self.num_checked ]
+            self.num_checked += 1
+            if err.severity in ('fatal','error'):
+                self.num_checked = len(errors)
+                raise err
+        if self.state.should_stop:
+            # Nothing more can be decoded after a fatal error
+            for err in errors:
+                if err.severity == 'fatal':
+                    raise err
+
+    def skip_value(self, i):
+        """Returns the offset just past the value which starts at the
+        given offset, without decoding the value.
+
+        """
+        text = self.text
+        c = text[i:i+1]
+        if not c:
+            return i
+        elif c in self.quotes:
+            return self.skip_string( i )
+        elif c in u'[{':
+            filler_match = self.filler_re.match
+            depth = 0
+            while True:
+                i = filler_match( text, i ).end()
+                c = text[i:i+1]
+                if not c:
+                    return i  # Unterminated, for the decoder to find
+                elif c in u'[{':
+                    depth += 1
+                    i += 1
+                elif c in u']}':
+                    depth -= 1
+                    i += 1
+                    if depth == 0:
+                        return i
+                else:
+                    i = self.skip_comment( i )
+        else:
+            m = self.scalar_end_re.search( text, i + 1 )
+            if not m:
+                return len(text)
+            return m.start()
+
+    def skip_string(self, i):
+        """Returns the offset just past the string literal which starts
+        at the given offset.
+
+        """
+        return self.string_res[ self.text[i] ].match( self.text, i ).end()
+
+    def skip_comment(self, i):
+        """Returns the offset just past the comment which starts at the
+        given offset; or the next offset if there is no comment there.
+
+        """
+        text = self.text
+        c = text[i+1:i+2]
+        if c == u'/':
+            m = self.line_end_re.search( text, i + 2 )
+            if not m:
+                return len(text)
+            return m.end()
+        elif c == u'*':
+            j = text.find( u'*/', i + 2 )
+            if j < 0:
+                return len(text)
+            return j + 2
+        return i + 1
+
+    def decode_value(self, i, depth):
+        """Decodes the value which starts at the given offset, and
+        which is nested 'depth' levels deep (the top-level value is
+        at depth 1).  Arrays and objects are not decoded but become new
+        lazy proxies, once their depth has been checked.
+
+        """
+        self.raise_errors()
+        c = self.text[i:i+1]
+        state = self.state
+        state.buf.seek( i )
+        if c and c in u'[{':
+            state.cur_depth = depth
+            state.update_depth_stats()
+            self.raise_errors()
+            if c == u'[':
+                return lazy_array( self, i, depth )
+            else:
+                return lazy_object( self, i, depth )
+        with self.decimal_context():
+            value = self.json.decodeobj( state )
+        self.raise_errors()
+        return value
+
+    def scan_members(self, i):
+        """Finds the members of the array or object which starts at the
+        given offset, without decoding their values.
+
+        Returns a list of the offsets of an array's elements, with
+        undefined for an omitted element; or a _member_offsets of an
+        object's properties.  The first error in the syntax of the
+        array or object itself is raised.
+
+        """
+        self.raise_errors()
+        self.state.buf.seek( i )
+        with self.decimal_context():
+            return self.json._scan_composite( self.state, self )
+
+
+class _member_offsets(object):
+    """Takes the place of the dictionary being decoded by
+    JSON._scan_composite(), keeping the offset of each property's value
+    rather than the value itself, and the keys in the order in which
+    they first appear.
+
+    """
+    __slots__ = ['offsets', 'keys']
+
+    def __init__(self):
+        self.offsets = {}
+        self.keys = []
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def __setitem__(self, key, offset):
+        if key not in self.offsets:
+            self.keys.append( key )
+        self.offsets[key] = offset
+
+
+class lazy_array(_Sequence):
+    """A read-only proxy for a JSON array, which decodes its elements
+    only as they are asked for.  This is returned in place of a list
+    by the JSON.decode() method if the 'lazy' argument is True.
+
+    The element positions are found the first time the array is used,
+    and each element is decoded the first time it is retrieved.  Any
+    arrays and objects within it become lazy proxies themselves.
+
+    Syntax errors are raised, as a JSONDecodeError, only when the
+    part of the document containing them is decoded.
+
+    """
+    def __init__(self, document, offset, depth):
+        self.__document = document
+        self.__offset = offset
+        self.__depth = depth
+        self.__offsets = None  # Element offsets, once they are found
+        self.__values = {}     # Elements already decoded, by index
+
+    def __members(self):
+        if self.__offsets is None:
+            self.__offsets = self.__document.scan_members( self.__offset )
+        return self.__offsets
+
+    def __len__(self):
+        return len( self.__members() )
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        offsets = self.__members()
+        if index < 0:
+            index += len(offsets)
+        if not 0 <= index < len(offsets):
+            raise IndexError('list index out of range')
+        try:
+            return self.__values[index]
+        except KeyError:
+            pass
+        if offsets[index] is undefined:
+            value = undefined
+        else:
+            value = self.__document.decode_value( offsets[index], self.__depth + 1 )
+        self.__values[index] = value
+        return value
+
+    def __eq__(self, other):
+        if isinstance(other, (list, lazy_array)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, (list, lazy_array)):
+            return list(self) != list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<%s at offset %d>' % (self.__class__.__name__, self.__offset)
+
+
+class lazy_object(_Mapping):
+    """A read-only proxy for a JSON object, which decodes its property
+    values only as they are asked for.  This is returned in place of a
+    dictionary by the JSON.decode() method if the 'lazy' argument is
+    True.
+
+    The keys are all decoded the first time the object is used, and
+    each value is decoded the first time it is retrieved.  Any arrays
+    and objects within it become lazy proxies themselves.  Iterating
+    gives the keys in the order they appear in the document.
 
-    @property
-    def strictness(self):
-        return self._strictness
+    Syntax errors are raised, as a JSONDecodeError, only when the
+    part of the document containing them is decoded.
 
-    @strictness.setter
-    def strictness(self, strict):
-        """Changes whether the options should be re-configured for strict JSON conformance."""
-        if strict == STRICTNESS_WARN:
-            self._strictness = STRICTNESS_WARN
-            self.set_all_warn()
-        elif strict == STRICTNESS_STRICT or strict is True:
-            self._strictness = STRICTNESS_STRICT
-            self.keep_format = False
-            self.set_all_forbid()
-            self.warn_duplicate_keys()
-            self.warn_zero_byte()
-            self.warn_bom()
-            self.warn_non_portable()
-        elif strict == STRICTNESS_TOLERANT or strict is False:
-            self._strictness = STRICTNESS_TOLERANT
-            self.set_all_allow()
-            self.warn_duplicate_keys()
-            self.warn_zero_byte()
-            self.warn_leading_zeros()
-            self.leading_zero_radix = 8
-            self.warn_bom()
-            self.allow_non_portable()
-        else:
-            raise ValueError("Unknown strictness options %r" % strict)
-        self.allow_any_type_at_start()
+    """
+    def __init__(self, document, offset, depth):
+        self.__document = document
+        self.__offset = offset
+        self.__depth = depth
+        self.__offsets = None  # Value offsets by key, once they are found
+        self.__keys = None     # Keys in document order
+        self.__values = {}     # Values already decoded, by key
+
+    def __members(self):
+        if self.__offsets is None:
+            members = self.__document.scan_members( self.__offset )
+            self.__offsets, self.__keys = members.offsets, members.keys
+        return self.__offsets
+
+    def __len__(self):
+        return len( self.__members() )
+
+    def __iter__(self):
+        self.__members()
+        return iter( self.__keys )
+
+    def __contains__(self, key):
+        return key in self.__members()
+
+    def __getitem__(self, key):
+        offsets = self.__members()
+        try:
+            return self.__values[key]
+        except KeyError:
+            pass
+        value = self.__document.decode_value( offsets[key], self.__depth + 1 )
+        self.__values[key] = value
+        return value
+
+    def __repr__(self):
+        return '<%s at offset %d>' % (self.__class__.__name__, self.__offset)
 
 
 # ----------------------------------------------------------------------
@@ -3378,6 +5812,10 @@ class JSON(object):
     
     """
     _string_quotes = '"\''
+    _iterparse_batch_size = 100  # events to gather between yields
+    _string_span_patterns = { '"': _make_string_span_pattern('"'),
+                              '\'': _make_string_span_pattern('\'') }
+    _strict_number_re = _make_strict_number_pattern()
 
     _escapes_json = { # character escapes in JSON
         '"': '"',
@@ -3422,6 +5860,31 @@ class JSON(object):
                       'encode_value', 'encode_dict', 'encode_dict_key',
                       'encode_sequence', 'encode_bytes', 'encode_default')
 
+    def _hook_property(hookname):
+        # The 'xxx_hook' attributes are views onto the table of set
+        # hooks; assigning to one is the same as calling set_hook().
+        def get_hook(self):
+            return self._active_hooks.get( hookname )
+        def set_hook(self, function):
+            self.set_hook( hookname, function )
+        def del_hook(self):
+            self.set_hook( hookname, None )
+        return property( get_hook, set_hook, del_hook,
+                         doc='The %s hook function, or None if not set.' % hookname )
+
+    decode_number_hook = _hook_property('decode_number')
+    decode_float_hook = _hook_property('decode_float')
+    decode_object_hook = _hook_property('decode_object')
+    decode_array_hook = _hook_property('decode_array')
+    decode_string_hook = _hook_property('decode_string')
+    encode_value_hook = _hook_property('encode_value')
+    encode_dict_hook = _hook_property('encode_dict')
+    encode_dict_key_hook = _hook_property('encode_dict_key')
+    encode_sequence_hook = _hook_property('encode_sequence')
+    encode_bytes_hook = _hook_property('encode_bytes')
+    encode_default_hook = _hook_property('encode_default')
+    del _hook_property
+
     def __init__(self, **kwargs):
         """Creates a JSON encoder/decoder object.
 
@@ -3437,7 +5900,13 @@ class JSON(object):
         import sys, unicodedata, re
 
         kwargs = kwargs.copy()
+        self._string_escapers = {}  # (escape_from, codec name, always_escape) -> _string_escaper
+        self._type_classes = {}  # type -> classification, see _classify_for_encoding()
+        self._type_equivalents = {}  # type -> has json_equivalent(), or None if unknown
+        self._type_cache_token = None
+
         # Initialize hooks
+        self._active_hooks = {}
         for hookname in self.all_hook_names:
             if hookname in kwargs:
                 self.set_hook( hookname, kwargs[hookname] )
@@ -3454,13 +5923,16 @@ class JSON(object):
 
         # The following is a boolean map of the first 256 characters
         # which will quickly tell us which of those characters never
-        # need to be escaped.
+        # need to be escaped.  It is the same for every instance of
+        # a class, so is only made once.
 
-        self._asciiencodable = \
-            [32 <= c < 128 \
-                 and not self._rev_escapes.has_key(chr(c)) \
-                 and not unicodedata.category(unichr(c)) in ['Cc','Cf','Zl','Zp']
-             for c in range(0,256)]
+        cls = self.__class__
+        if '_asciiencodable' not in cls.__dict__:
+            cls._asciiencodable = \
+                [32 <= c < 128 \
+                     and not self._rev_escapes.has_key(chr(c)) \
+                     and not unicodedata.category(unichr(c)) in ['Cc','Cf','Zl','Zp']
+                 for c in range(0,256)]
 
     @property
     def options(self):
@@ -3554,21 +6026,26 @@ class JSON(object):
             Called for any Python type which can not otherwise be converted
             into JSON, even after applying any other encoding hooks.
 
+        The hooks which are set are kept in a table, which is what the
+        encoder and decoder look in.  The 'xxx_hook' attributes read
+        from and write to that same table, so assigning to one (for
+        example, 'decode_array_hook') is the same as calling set_hook().
+
         """
         if hookname in self.all_hook_names:
-            att = hookname + '_hook'
             if function != None and not callable(function):
                 raise ValueError("Hook %r must be None or a callable function" % hookname)
-            setattr( self, att, function )
+            if function is None:
+                self._active_hooks.pop( hookname, None )
+            else:
+                self._active_hooks[ hookname ] = function
         else:
             raise ValueError("Unknown hook name %r" % hookname)
 
 
     def has_hook(self, hook_name):
-        if not hook_name or hook_name not in self.all_hook_names:
-            return False
-        hook = getattr( self, hook_name + '_hook' )
-        return callable(hook)
+        """Determines if a hook function is set for the given hook name."""
+        return hook_name in self._active_hooks
 
 
     def call_hook(self, hook_name, input_object, position=None, *args, **kwargs):
@@ -3579,11 +6056,12 @@ class JSON(object):
 
         """
         import sys
-        if hook_name not in self.all_hook_names:
-            raise AttributeError("No such hook %r" % hook_name)
-        hook = getattr( self, hook_name + '_hook' )
-        if not callable(hook):
-            raise TypeError("Hook is not callable: %r" % (hook,))
+        try:
+            hook = self._active_hooks[ hook_name ]
+        except KeyError:
+            if hook_name not in self.all_hook_names:
+                raise AttributeError("No such hook %r" % hook_name)
+            raise TypeError("Hook is not callable: %r" % (None,))
         try:
             rval = hook( input_object, *args, **kwargs )
         except JSONSkipHook:
@@ -3666,7 +6144,7 @@ class JSON(object):
         kw = buf.pop_identifier()
         if not kw or kw != 'null':
             state.push_error("Expected a 'null' keyword'", kw, position=start_position)
-        else:
+        elif state.stats:
             state.stats.num_nulls += 1
         return None
 
@@ -3690,7 +6168,7 @@ class JSON(object):
         kw = buf.pop_identifier()
         if not kw or kw not in ('true','false'):
             state.push_error("Expected a 'true' or 'false' keyword'", kw, position=start_position)
-        else:
+        elif state.stats:
             state.stats.num_bools += 1
         return (kw == 'true')
 
@@ -3714,17 +6192,31 @@ class JSON(object):
         """
         buf = state.buf
         self.skipws(state)
+        hooks = self._active_hooks
+
+        if not (state.options.keep_format or state.options.float_type == NUMBER_DECIMAL
+                or 'decode_number' in hooks or 'decode_float' in hooks):
+            # Most numbers are written in the strict JSON form, which
+            # can be recognized with a single match and converted
+            # directly.  Anything else (radix prefixes, leading zeros,
+            # signs with spaces, etc.) is left to the general parser.
+            m = self._strict_number_re.match( buf.text, buf.cpos )
+            if m:
+                c = buf.text[m.end():m.end()+1]
+                if not c or c not in '0123456789.+-eExXoObB':
+                    return self.__decode_strict_number( state, m )
+
         start_position = buf.position
 
         # Use external number parser hook if available
-        if self.has_hook('decode_number') or self.has_hook('decode_float'):
+        if 'decode_number' in hooks or 'decode_float' in hooks:
             c = buf.peek()
             if c and c in '-+0123456789.':  # First chars for a number-like value
                 buf.save_position()
                 nbr = buf.pop_while_in( '-+0123456789abcdefABCDEF' 'NaN' 'Infinity.' )
-                if '.' in nbr and self.has_hook('decode_float'):
+                if '.' in nbr and 'decode_float' in hooks:
                     hook_name = 'decode_float'
-                elif self.has_hook('decode_number'):
+                elif 'decode_number' in hooks:
                     hook_name = 'decode_number'
                 else:
                     hook_name = None
@@ -3761,7 +6253,7 @@ class JSON(object):
             c = buf.peek()
 
         if sign_count > 1 or sign_saw_plus:
-            state.push_cond( self.options.all_numeric_signs,
+            state.push_cond( state.options.all_numeric_signs,
                              'Numbers may only have a single "-" as a sign prefix',
                              position=start_position)
         if sign_saw_ws:
@@ -3771,25 +6263,28 @@ class JSON(object):
         if not c:
             state.push_error('Missing numeric value after sign', position=start_position)
             self.recover_parser(state)
-            self.stats.num_undefineds += 1
+            if state.stats:
+                state.stats.num_undefineds += 1
             return undefined
         elif c.isalpha() or c in '_$':
             kw = buf.popwhile( lambda c: c.isalnum() or c in '_$' )
             if kw == 'NaN':
-                state.push_cond( self.options.non_numbers,
+                state.push_cond( state.options.non_numbers,
                                  'NaN literals are not allowed in strict JSON',
                                  position=start_position)
-                state.stats.num_nans += 1
-                return self.options.nan
+                if state.stats:
+                    state.stats.num_nans += 1
+                return state.options.nan
             elif kw == 'Infinity':
-                state.push_cond( self.options.non_numbers,
+                state.push_cond( state.options.non_numbers,
                                  'Infinity literals are not allowed in strict JSON',
                                  position=start_position)
-                state.stats.num_infinities += 1
+                if state.stats:
+                    state.stats.num_infinities += 1
                 if sign < 0:
-                    return self.options.neginf
+                    return state.options.neginf
                 else:
-                    return self.options.inf
+                    return state.options.inf
             else:
                 state.push_error('Unknown numeric value keyword', kw, position=start_position)
                 return undefined
@@ -3799,7 +6294,7 @@ class JSON(object):
             # ----- HEX NUMBERS 0x123
             prefix = buf.popstr(2)
             digits = buf.popwhile( helpers.is_hex_digit )
-            state.push_cond( self.options.hex_numbers,
+            state.push_cond( state.options.hex_numbers,
                              'Hexadecimal literals are not allowed in strict JSON', prefix+digits,
                              position=start_position )
             if len(digits)==0:
@@ -3814,7 +6309,7 @@ class JSON(object):
             # ----- NEW-STYLE OCTAL NUMBERS  0o123
             prefix = buf.popstr(2)
             digits = buf.popwhile( helpers.is_octal_digit )
-            state.push_cond( self.options.octal_numbers,
+            state.push_cond( state.options.octal_numbers,
                              "Octal literals are not allowed in strict JSON", prefix+digits,
                              position=start_position )
             if len(digits)==0:
@@ -3829,7 +6324,7 @@ class JSON(object):
             # ----- NEW-STYLE BINARY NUMBERS  0b1101
             prefix = buf.popstr(2)
             digits = buf.popwhile( helpers.is_binary_digit )
-            state.push_cond( self.options.binary_numbers,
+            state.push_cond( state.options.binary_numbers,
                              "Binary literals are not allowed in strict JSON", prefix+digits,
                              position=start_position )
             if len(digits)==0:
@@ -3843,7 +6338,7 @@ class JSON(object):
         else:
             # ----- DECIMAL OR LEGACY-OCTAL NUMBER.   123, 0123
             # General syntax is:  \d+[\.\d+][e[+-]?\d+]
-            number = buf.popwhile( lambda c: c in '0123456789.+-eE' )
+            number = buf.pop_while_in( '0123456789.+-eE' ) or ''
             imax = len(number)
             if imax == 0:
                 state.push_error('Missing numeric value', position=start_position)
@@ -3900,7 +6395,7 @@ class JSON(object):
                 return undefined
 
             if saw_decimal_point and not fraction_s:
-                state.push_cond( self.options.trailing_decimal_point,
+                state.push_cond( state.options.trailing_decimal_point,
                                  'Bad number, decimal point must be followed by at least one digit',
                                  number, position=start_position)
                 fraction_s = '0'
@@ -3911,34 +6406,34 @@ class JSON(object):
                 return undefined
 
             if not units_s:
-                state.push_cond( self.options.initial_decimal_point,
+                state.push_cond( state.options.initial_decimal_point,
                                  'Bad number, decimal point must be preceded by at least one digit',
                                  number, position=start_position)
                 units = '0'
             elif len(units_s) > 1 and units_s[0] == '0':
                 has_leading_zero = True
-                if self.options.is_forbid_leading_zeros:
-                    state.push_cond( self.options.leading_zeros,
+                if state.options.is_forbid_leading_zeros:
+                    state.push_cond( state.options.leading_zeros,
                                      'Numbers may not have extra leading zeros',
                                      number, position=start_position)
-                elif self.options.is_warn_leading_zeros:
-                    state.push_cond( self.options.leading_zeros,
+                elif state.options.is_warn_leading_zeros:
+                    state.push_cond( state.options.leading_zeros,
                                      'Numbers may not have leading zeros; interpreting as %s' \
-                                         % self.options.leading_zero_radix_as_word,
+                                         % state.options.leading_zero_radix_as_word,
                                      number, position=start_position)
 
             # Estimate number of significant digits
             sigdigits = len( (units_s + fraction_s).replace('0',' ').strip() )
 
             # Handle legacy octal integers.
-            if has_leading_zero and is_integer and self.options.leading_zero_radix == 8:
+            if has_leading_zero and is_integer and state.options.leading_zero_radix == 8:
                 # ----- LEGACY-OCTAL  0123
                 try:
                     ival = helpers.decode_octal( units_s )
                 except ValueError:
                     state.push_error('Bad number, not a valid octal value', number, position=start_position)
                     self.recover_parser(state)
-                    return self.options.nan # undefined
+                    return state.options.nan # undefined
                 state.update_integer_stats( ival, sign=sign, position=start_position )
                 n = state.options.make_int( ival, sign, number_format=NUMBER_FORMAT_LEGACYOCTAL )
                 return n
@@ -3978,6 +6473,51 @@ class JSON(object):
                     state.update_float_stats( n, sign=sign, position=start_position )
             return n
 
+    def __decode_strict_number(self, state, m):
+        """Converts a number matched by the strict number pattern,
+        giving the same result and statistics as decode_number() would,
+        and advances past it.
+
+        """
+        buf = state.buf
+        start_cpos = buf.cpos
+        buf.seek( m.end() )
+        minus, units_s, fraction_s, exponent_s = m.groups()
+        if minus:
+            sign = -1
+        else:
+            sign = +1
+        exponent = int( exponent_s or 0 )
+
+        # The source position is only needed if a warning may be
+        # reported, which happens just once for each kind of number.
+        check = state.check_non_portable
+        position = None
+
+        if not fraction_s and exponent >= 0:
+            # ----- A DECIMAL INTEGER
+            ival = int( units_s )
+            if exponent != 0:
+                ival *= 10**exponent
+            if check and ((sign < 0 and ival == 0 and not state._have_warned_negzero_int)
+                          or (ival > decode_statistics.double_int_max and not state._have_warned_long_int)):
+                position = buf.position_at( start_cpos )
+            state.update_integer_stats( ival, sign=sign, position=position )
+            return state.options.make_int( ival, sign )
+
+        # ----- A FLOATING-POINT NUMBER
+        number = m.group()[len(minus):]
+        sigdigits = len( (units_s + (fraction_s or '')).replace('0',' ').strip() )
+        if exponent < float_minexp or exponent > float_maxexp or sigdigits > float_sigdigits:
+            n = state.options.make_decimal( number, sign )
+        else:
+            n = state.options.make_float( number, sign )
+        if check and ((helpers.is_negzero(n) and not state._have_warned_negzero_float)
+                      or (decimal and isinstance(n, decimal.Decimal) and not state._have_warned_decimal)):
+            position = buf.position_at( start_cpos )
+        state.update_float_stats( n, sign=sign, position=position )
+        return n
+
 
     def encode_number(self, n, state):
         """Encodes a Python numeric type into a JSON numeric literal.
@@ -4056,7 +6596,7 @@ class JSON(object):
         if quote == '"':
             pass
         elif quote == "'":
-            state.push_cond( self.options.single_quoted_strings,
+            state.push_cond( state.options.single_quoted_strings,
                              'String literals must use double quotation marks in strict JSON' )
         else:
             state.push_error('String literal must be properly quoted')
@@ -4065,11 +6605,12 @@ class JSON(object):
         string_position = buf.position
         buf.skip()
 
-        if self.options.is_forbid_js_string_escapes:
+        if state.options.is_forbid_js_string_escapes:
             escapes = self._escapes_json
         else:
             escapes = self._escapes_js
-        ccallowed = not self.options.is_forbid_control_char_in_string
+        ccallowed = not state.options.is_forbid_control_char_in_string
+        span_pattern = self._string_span_patterns[quote]
         chunks = []
         _append = chunks.append
 
@@ -4121,11 +6662,11 @@ class JSON(object):
                 break
             elif c == '\\':
                 # Escaped character
-                escape_position = buf.position
+                escape_cpos = buf.cpos
                 buf.skip() # skip over backslash
                 c = buf.peek()
                 if not c:
-                    state.push_error('Escape in string literal is incomplete', position=escape_position,
+                    state.push_error('Escape in string literal is incomplete', position=buf.position_at(escape_cpos),
                                      outer_position=string_position, context='String')
                     should_stop = state.should_stop
                     break
@@ -4139,14 +6680,14 @@ class JSON(object):
                     digits = buf.popwhile( helpers.is_octal_digit, maxchars=maxdigits )
                     n = helpers.decode_octal(digits)
                     if n == 0:
-                        state.push_cond( self.options.zero_byte,
+                        state.push_cond( state.options.zero_byte,
                                          'Zero-byte character (U+0000) in string may not be universally safe',
-                                         "\\"+digits, position=escape_position, outer_position=string_position,
+                                         "\\"+digits, position=buf.position_at(escape_cpos), outer_position=string_position,
                                          context='String')
                     else: # n != 0
-                        state.push_cond( self.options.octal_numbers,
+                        state.push_cond( state.options.octal_numbers,
                                          "JSON does not allow octal character escapes other than \"\\0\"",
-                                         "\\"+digits, position=escape_position, outer_position=string_position,
+                                         "\\"+digits, position=buf.position_at(escape_cpos), outer_position=string_position,
                                          context='String')
                     should_stop = state.should_stop
                     if n < 128:
@@ -4166,16 +6707,16 @@ class JSON(object):
                             esc_opener += '{'
                             esc_closer = '}'
                             maxdigits = None
-                            state.push_cond( self.options.extended_unicode_escapes,
+                            state.push_cond( state.options.extended_unicode_escapes,
                                              "JSON strings do not allow \\u{...} escapes",
-                                             position=escape_position, outer_position=string_position,
+                                             position=buf.position_at(escape_cpos), outer_position=string_position,
                                              context='String')
                         else:
                             maxdigits = 4
                     else: # c== 'x'
-                        state.push_cond( self.options.js_string_escapes,
+                        state.push_cond( state.options.js_string_escapes,
                                          "JSON strings may not use the \\x hex-escape",
-                                         position=escape_position, outer_position=string_position,
+                                         position=buf.position_at(escape_cpos), outer_position=string_position,
                                          context='String')
                         should_stop = state.should_stop
                         maxdigits = 2
@@ -4185,7 +6726,7 @@ class JSON(object):
                     if esc_closer:
                         if buf.peek() != esc_closer:
                             state.push_error( "Unicode escape sequence is missing closing \'%s\'" % esc_closer, esc_opener+digits,
-                                              position=escape_position, outer_position=string_position,
+                                              position=buf.position_at(escape_cpos), outer_position=string_position,
                                               context='String')
                             should_stop = state.should_stop
                         else:
@@ -4195,20 +6736,20 @@ class JSON(object):
 
                     if not digits:
                         state.push_error('numeric character escape sequence is truncated', esc_sequence,
-                                         position=escape_position, outer_position=string_position,
+                                         position=buf.position_at(escape_cpos), outer_position=string_position,
                                          context='String')
                         should_stop = state.should_stop
                         codepoint = 0xfffd # replacement char
                     else:
                         if maxdigits and len(digits) != maxdigits:
                             state.push_error('escape sequence has too few hexadecimal digits', esc_sequence,
-                                             position=escape_position, outer_position=string_position,
+                                             position=buf.position_at(escape_cpos), outer_position=string_position,
                                              context='String')
                         codepoint = helpers.decode_hex( digits )
 
                     if codepoint > 0x10FFFF:
                         state.push_error( 'Unicode codepoint is beyond U+10FFFF', esc_opener+digits+esc_closer,
-                                          position=escape_position, outer_position=string_position,
+                                          position=buf.position_at(escape_cpos), outer_position=string_position,
                                           context='String')
                         codepoint = 0xfffd # replacement char
 
@@ -4229,17 +6770,17 @@ class JSON(object):
                     elif codepoint < 128:
                         # ASCII chars always go in as a str
                         if codepoint==0:
-                            state.push_cond( self.options.zero_byte,
+                            state.push_cond( state.options.zero_byte,
                                              'Zero-byte character (U+0000) in string may not be universally safe',
-                                             position=escape_position, outer_position=string_position,
+                                             position=buf.position_at(escape_cpos), outer_position=string_position,
                                              context='String')
                             should_stop = state.should_stop
                         _append( chr(codepoint) )
                     elif 0xd800 <= codepoint <= 0xdbff: # high surrogate
                         high_surrogate = unichr(codepoint)  # remember until we get to the low surrogate
-                        highsur_position = escape_position.copy()
+                        highsur_position = buf.position_at(escape_cpos)
                     elif 0xdc00 <= codepoint <= 0xdfff: # low surrogate
-                        state.push_error('Low unicode surrogate must be proceeded by a high surrogate', position=escape_position,
+                        state.push_error('Low unicode surrogate must be proceeded by a high surrogate', position=buf.position_at(escape_cpos),
                                          outer_position=string_position,
                                          context='String')
                         should_stop = state.should_stop
@@ -4249,16 +6790,16 @@ class JSON(object):
                         _append( helpers.safe_unichr(codepoint) )
                 else:
                     # Unknown escape sequence
-                    state.push_cond( self.options.nonescape_characters,
+                    state.push_cond( state.options.nonescape_characters,
                                      'String escape code is not allowed in strict JSON',
-                                     '\\'+c, position=escape_position, outer_position=string_position,
+                                     '\\'+c, position=buf.position_at(escape_cpos), outer_position=string_position,
                                      context='String')
                     should_stop = state.should_stop
                     _append( c )
                     buf.skip()
             elif ord(c) <= 0x1f: # A control character
                 if ord(c) == 0:
-                    state.push_cond( self.options.zero_byte,
+                    state.push_cond( state.options.zero_byte,
                                      'Zero-byte character (U+0000) in string may not be universally safe',
                                      position=buf.position, outer_position=string_position,
                                      context='String')
@@ -4287,14 +6828,10 @@ class JSON(object):
                 high_surrogate = buf.pop()  # remember until we get to the low surrogate
                 highsur_position = buf.position.copy()
             else: # A normal character; not an escape sequence or end-quote.
-                # Find a whole sequence of "safe" characters so we can append them
-                # all at once rather than one a time, for speed.
-                chunk = buf.popwhile( lambda c: c not in helpers.unsafe_string_chars and c != quote )
-                if not chunk:
-                    _append( c )
-                    buf.skip()
-                else:
-                    _append( chunk )
+                # Find the whole run of such characters with a single
+                # search, and append them all at once rather than one
+                # at a time, for speed.
+                _append( buf.popmatch( span_pattern ) )
 
         # Check proper string termination
         if high_surrogate:
@@ -4318,7 +6855,7 @@ class JSON(object):
         state.update_string_stats( s, position=string_position )
 
         # Call string hook
-        if self.has_hook('decode_string'):
+        if 'decode_string' in self._active_hooks:
             try:
                 s = self.call_hook( 'decode_string', s, position=string_position )
             except JSONSkipHook:
@@ -4337,7 +6874,7 @@ class JSON(object):
         # convert Python2 'str' types to unicode strings first.
         import unicodedata, sys
         import UserString
-        py2strenc = self.options.py2str_encoding
+        py2strenc = state.options.py2str_encoding
         if isinstance(s, UserString.UserString):
             def tochar(c):
                 c2 = c.data
@@ -4353,6 +6890,19 @@ class JSON(object):
             # and use an explicit if test inside the loop.
             tochar = None
 
+            # Most strings can be escaped all at once
+            escaper = state.string_escaper
+            if escaper is None:
+                escaper = self._string_escaper_for( state )
+                if escaper is None:
+                    escaper = False
+                state.string_escaper = escaper
+            if escaper is not False and isinstance(s, unicode):
+                literal = escaper.escape( s )
+                if literal is not None:
+                    state.append( literal )
+                    return
+
         chunks = []
         chunks.append('"')
         revesc = self._rev_escapes
@@ -4461,6 +7011,35 @@ class JSON(object):
         state.append( ''.join( chunks ) )
 
 
+    def _string_escaper_for(self, state):
+        """Returns the _string_escaper to use for the encoding state, or
+        None if strings must be escaped a character at a time because
+        of a user-supplied escape_unicode test.
+
+        """
+        encunicode = state.escape_unicode_test
+        escape_test = None
+        if encunicode is False:
+            escape_from = None
+        elif encunicode is True:
+            escape_from = 0
+        elif encunicode is _escape_non_ascii:
+            escape_from = 0x80
+        elif encunicode is _escape_non_latin1:
+            escape_from = 0x100
+        elif isinstance(encunicode, _escape_unencodable):
+            escape_from = None
+            escape_test = encunicode
+        else:
+            return None
+        always_escape = frozenset( state.options.always_escape_chars or () )
+        key = (escape_from, escape_test and escape_test.codec_name, always_escape)
+        try:
+            escaper = self._string_escapers[ key ]
+        except KeyError:
+            escaper = self._string_escapers[ key ] = _string_escaper( self, always_escape, escape_from, escape_test )
+        return escaper
+
     def decode_identifier(self, state, identifier_as_string=False):
         """Decodes an identifier/keyword.
 
@@ -4476,24 +7055,28 @@ class JSON(object):
             state.push_error("Expected an identifier", position=start_position)
         elif kw == 'null':
             obj = None
-            state.stats.num_nulls += 1
+            if state.stats:
+                state.stats.num_nulls += 1
         elif kw == 'true':
             obj = True
-            state.stats.num_bools += 1
+            if state.stats:
+                state.stats.num_bools += 1
         elif kw == 'false':
             obj = False
-            state.stats.num_bools += 1
+            if state.stats:
+                state.stats.num_bools += 1
         elif kw == 'undefined':
-            state.push_cond( self.options.undefined_values,
+            state.push_cond( state.options.undefined_values,
                              "Strict JSON does not allow the 'undefined' keyword",
                              kw, position=start_position)
             obj = undefined
-            state.stats.num_undefineds += 1
+            if state.stats:
+                state.stats.num_undefineds += 1
         elif kw == 'NaN' or kw == 'Infinity':
-            state.push_cond( self.options.non_numbers,
+            state.push_cond( state.options.non_numbers,
                              "%s literals are not allowed in strict JSON" % kw,
                              kw, position=start_position)
-            if self.has_hook('decode_float'):
+            if 'decode_float' in self._active_hooks:
                 try:
                     val = self.call_hook( 'decode_float', kw, position=start_position )
                 except JSONSkipHook:
@@ -4503,7 +7086,7 @@ class JSON(object):
                     return undefined
                 else:
                     return val
-            elif self.has_hook('decode_number'):
+            elif 'decode_number' in self._active_hooks:
                 try:
                     val = self.call_hook( 'decode_number', kw, position=start_position )
                 except JSONSkipHook:
@@ -4514,10 +7097,12 @@ class JSON(object):
                 else:
                     return val
             if kw == 'NaN':
-                state.stats.num_nans += 1
+                if state.stats:
+                    state.stats.num_nans += 1
                 obj = state.options.nan
             else:
-                state.stats.num_infinities += 1
+                if state.stats:
+                    state.stats.num_infinities += 1
                 obj = state.options.inf
         else:
             # Convert unknown identifiers into strings
@@ -4525,15 +7110,17 @@ class JSON(object):
                 if kw in helpers.javascript_reserved_words:
                     state.push_warning( "Identifier is a JavaScript reserved word",
                                         kw, position=start_position)
-                state.push_cond( self.options.identifier_keys,
+                state.push_cond( state.options.identifier_keys,
                                  "JSON does not allow identifiers to be used as strings",
                                  kw, position=start_position)
-                state.stats.num_identifiers += 1
+                if state.stats:
+                    state.stats.num_identifiers += 1
                 obj = self.decode_javascript_identifier( kw )
             else:
                 state.push_error("Unknown identifier", kw, position=start_position)
                 obj = undefined
-                state.stats.num_identifiers += 1
+                if state.stats:
+                    state.stats.num_identifiers += 1
         return obj
 
 
@@ -4545,17 +7132,18 @@ class JSON(object):
 
         """
         buf = state.buf
-        uniws = self.options.unicode_whitespace
+        uniws = state.options.unicode_whitespace
         s = buf.peekstr(2)
         if s != '//' and s != '/*':
             return None
-        state.push_cond( self.options.comments, 'Comments are not allowed in strict JSON' )
+        state.push_cond( state.options.comments, 'Comments are not allowed in strict JSON' )
         start_position = buf.position
         buf.skip(2)
         multiline = (s == '/*')
         saw_close = False
         while not buf.at_end:
             if multiline:
+                buf.skipuntil( lambda c: c == '*' or c == '/' )
                 if buf.peekstr(2) == '*/':
                     buf.skip(2)
                     saw_close = True
@@ -4565,6 +7153,7 @@ class JSON(object):
                                      outer_position=start_position,
                                      context='Comment')
             else:
+                buf.skipuntil( helpers.char_is_unicode_eol )
                 if buf.at_eol( uniws ):
                     buf.skip_to_next_line( uniws )
                     saw_close = True
@@ -4574,13 +7163,14 @@ class JSON(object):
         if not saw_close and multiline:
             state.push_error('Comment was never terminated', outer_position=start_position,
                              context='Comment')
-        state.stats.num_comments += 1
+        if state.stats:
+            state.stats.num_comments += 1
 
 
     def skipws_nocomments(self, state):
         """Skips whitespace (will not allow comments).
         """
-        return state.buf.skipws( not self.options.is_forbid_unicode_whitespace )
+        return state.buf.skipws( not state.options.is_forbid_unicode_whitespace )
 
 
     def skipws(self, state):
@@ -4595,23 +7185,60 @@ class JSON(object):
 
         """
         buf = state.buf
-        uniws = not self.options.unicode_whitespace
-        while not buf.at_end:
+        uniws = not state.options.unicode_whitespace
+        while True:
+            buf.skipws( uniws )
             c = buf.peekstr(2)
             if c == '/*' or c == '//':
                 cmt = self.skip_comment( state )
-            elif buf.at_ws( uniws ):
-                buf.skipws( uniws )
             else:
                 break
 
     def decode_composite(self, state):
         """Intermediate-level JSON decoder for composite literal types (array and object).
 
+        Any arrays and objects nested within it are decoded here too,
+        without recursion, by keeping a stack of those which are open.
+        So how deeply they may be nested is limited only by the
+        max_depth option, and not by Python's recursion limit.
+
+        """
+        frame = self.__open_composite(state)
+        if frame is None:
+            return None
+        depth = state.cur_depth
+        saved_select = state.select, state.select_pointer
+        stack = [frame]
+        val = None
+        try:
+            while True:
+                frame = stack[-1]
+                child = self.__continue_composite(state, frame, val)
+                if child is not None:
+                    # A nested array or object has been opened
+                    stack.append( child )
+                    val = None
+                    continue
+                stack.pop()
+                val = frame.obj
+                if not stack:
+                    return val
+                state.cur_depth -= 1
+        finally:
+            state.cur_depth = depth
+            state.select, state.select_pointer = saved_select
+
+    def __open_composite(self, state, scanner=None):
+        """Starts decoding an array or object, returning a new
+        _composite_frame for it; or None if it can not be decoded.
+        The 'scanner' is given by _scan_composite().
+
         """
         if state.should_stop:
             return None
         buf = state.buf
+        select = state.select  # Only decoding some paths?
+        state.select = None
         self.skipws(state)
         opener = buf.peek()
         if opener not in '{[':
@@ -4620,85 +7247,137 @@ class JSON(object):
         start_position = buf.position
         buf.skip()
         if opener == '[':
-            isdict = False
-            closer = ']'
-            obj = []
+            frame = _composite_frame( False, [], start_position, select )
+        elif state.options.sort_keys == SORT_PRESERVE and _OrderedDict:
+            frame = _composite_frame( True, _OrderedDict(), start_position, select )
         else:
-            isdict = True
-            closer = '}'
-            if state.options.sort_keys == SORT_PRESERVE and _OrderedDict:
-                obj = _OrderedDict()
-            else:
-                obj = {}
-        num_items = 0
+            frame = _composite_frame( True, {}, start_position, select )
+        if scanner is not None:
+            frame.streaming = True
+            frame.scanner = scanner
+            if frame.isdict:
+                frame.obj = _member_offsets()
+        elif state.events is not None:
+            frame.streaming = True
+            frame.obj = _event_sink( state )
         self.skipws(state)
 
-        c = buf.peek()
-        if c == closer:
+        if buf.peek() == frame.closer:
             # empty composite
             buf.skip()
-            done = True
+            frame.done = True
+        return frame
+
+    def __continue_composite(self, state, frame, val):
+        """Carries on decoding the array or object of the given frame,
+        until either it is complete or a nested array or object is
+        opened.  The 'val' is the value of the nested one which was
+        last opened, if the frame is awaiting it.
+
+        Returns the frame of a newly opened array or object; or None
+        once complete, leaving the final value in frame.obj.  A frame
+        which is streaming returns itself after each of its members,
+        so that JSON.iterparse() can pass on their events.
+
+        """
+        buf = state.buf
+        isdict = frame.isdict
+        closer = frame.closer
+        obj = frame.obj
+        select = frame.select
+        start_position = frame.start_position
+        if isdict:
+            cdesc = 'Object'
         else:
-            saw_value = False   # set to false at beginning and after commas
-            done = False
-            while not done and not buf.at_end and not state.should_stop:
+            cdesc = 'Array'
+
+        resume = frame.resume  # None, or what a nested value was for
+        frame.resume = None
+        if frame.selecting is not None:
+            val = self.__end_selected(state, frame, val)
+
+        while True:
+            if resume is None:
+                if frame.done or buf.at_end or state.should_stop:
+                    break
                 self.skipws(state)
                 c = buf.peek()
                 if c == '':
                     break # will report error futher down because done==False
                 elif c == ',':
-                    if not saw_value:
+                    if not frame.saw_value:
                         # no preceeding value, an elided (omitted) element
                         if isdict:
                             state.push_error('Can not omit elements of an object (dictionary)',
                                              outer_position=start_position,
                                              context='Object')
                         else:
-                            state.push_cond( self.options.omitted_array_elements,
+                            state.push_cond( state.options.omitted_array_elements,
                                              'Can not omit elements of an array (list)',
                                              outer_position=start_position,
                                              context='Array')
+                            if select is not None:
+                                index = unicode(len(obj))
+                                self.__select_from_value( undefined, [path[1:] for path in select if path[0] in (index, u'*')],
+                                                          state.select_pointer + (index,), state.selected )
                             obj.append( undefined )
                             if state.stats:
                                 state.stats.num_undefineds += 1
                     buf.skip() # skip over comma
-                    saw_value = False
+                    frame.saw_value = False
+                    if frame.streaming:
+                        return frame  # pause after each element
                     continue
                 elif c == closer:
-                    if not saw_value:
+                    if not frame.saw_value:
                         if isdict:
-                            state.push_cond( self.options.trailing_comma,
+                            state.push_cond( state.options.trailing_comma,
                                              'Strict JSON does not allow a final comma in an object (dictionary) literal',
                                              outer_position=start_position,
                                              context='Object')
                         else:
-                            state.push_cond( self.options.trailing_comma,
+                            state.push_cond( state.options.trailing_comma,
                                              'Strict JSON does not allow a final comma in an array (list) literal',
                                              outer_position=start_position,
                                              context='Array')
                     buf.skip() # skip over closer
-                    done = True
+                    frame.done = True
                     break
                 elif c in ']}':
-                    if isdict:
-                        cdesc='Object'
-                    else:
-                        cdesc='Array'
                     state.push_error("Expected a '%c' but saw '%c'" % (closer,c),
                                      outer_position=start_position, context=cdesc)
-                    done = True
+                    frame.done = True
                     break
 
                 if state.should_stop:
                     break
 
                 # Decode the item/value
-                value_position = buf.position
+                frame.value_position = buf.position
 
                 if isdict:
-                    val = self.decodeobj(state, identifier_as_string=True)
+                    if c in '{[' and frame.scanner is not None:
+                        # Not a valid key, so not worth decoding
+                        buf.seek( frame.scanner.skip_value( buf.cpos ) )
+                        child, val = None, None
+                    elif c in '{[':
+                        child, val = self.__begin_value(state, identifier_as_string=True)
+                    else:
+                        child, val = None, self.__decode_object_key(state)
+                elif frame.scanner is not None:
+                    child, val = None, self.__skip_member(state, frame.scanner)
+                elif select is None:
+                    child, val = self.__begin_value(state)
                 else:
-                    val = self.decodeobj(state, identifier_as_string=False)
+                    child, val = self.__begin_selected(state, frame, len(obj))
+                if child is not None:
+                    frame.resume = 'item'
+                    return child
+                resume = 'item'
+
+            if resume == 'item':
+                resume = None
+                value_position = frame.value_position
 
                 if val is syntax_error:
                     recover_c = self.recover_parser(state)
@@ -4708,76 +7387,96 @@ class JSON(object):
                 if state.should_stop:
                     break
 
-                if saw_value:
+                if frame.saw_value:
                     # Two values without a separating comma
-                    if isdict:
-                        cdesc='Object'
-                    else:
-                        cdesc='Array'
                     state.push_error('Values must be separated by a comma',
                                      position=value_position, outer_position=start_position,
                                      context=cdesc)
 
-                saw_value = True
+                frame.saw_value = True
                 self.skipws(state)
 
                 if state.should_stop:
                     break
 
-                if isdict:
-                    skip_item = False
-                    key = val  # Ref 11.1.5
-                    key_position = value_position
-                    if not helpers.isstringtype(key):
-                        if helpers.isnumbertype(key):
-                            state.push_cond( self.options.nonstring_keys,
-                                             'JSON only permits string literals as object properties (keys)',
-                                             position=key_position, outer_position=start_position,
-                                             context='Object')
-                        else:
-                            state.push_error('Object properties (keys) must be string literals, numbers, or identifiers',
-                                             position=key_position, outer_position=start_position,
-                                             context='Object')
-                            skip_item = True
-                    c = buf.peek()
-                    if c != ':':
-                        state.push_error('Missing value for object property, expected ":"',
-                                         position=value_position, outer_position=start_position,
-                                         context='Object')
-                    buf.skip() # skip over colon
-                    self.skipws(state)
-
-                    rval = self.decodeobj(state)
-                    self.skipws(state)
-                    if not skip_item:
-                        if key in obj:
-                            state.push_cond( self.options.duplicate_keys,
-                                             'Object contains duplicate key',
-                                             key, position=key_position, outer_position=start_position,
-                                             context='Object')
-                        if key == '':
-                            state.push_cond( self.options.non_portable,
-                                             'Using an empty string "" as an object key may not be portable',
-                                             position=key_position, outer_position=start_position,
-                                             context='Object')
-                        obj[ key ] = rval
-                        num_items += 1
-                else: # islist
+                if not isdict:
                     obj.append( val )
-                    num_items += 1
-            # end while
+                    frame.num_items += 1
+                    if frame.streaming:
+                        return frame  # pause after each element
+                    continue
+
+                skip_item = False
+                key = val  # Ref 11.1.5
+                key_position = value_position
+                if not helpers.isstringtype(key):
+                    if helpers.isnumbertype(key):
+                        state.push_cond( state.options.nonstring_keys,
+                                         'JSON only permits string literals as object properties (keys)',
+                                         position=key_position, outer_position=start_position,
+                                         context='Object')
+                    else:
+                        state.push_error('Object properties (keys) must be string literals, numbers, or identifiers',
+                                         position=key_position, outer_position=start_position,
+                                         context='Object')
+                        skip_item = True
+                c = buf.peek()
+                if c != ':':
+                    state.push_error('Missing value for object property, expected ":"',
+                                     position=value_position, outer_position=start_position,
+                                     context='Object')
+                buf.skip() # skip over colon
+                self.skipws(state)
+
+                frame.key = key
+                frame.skip_item = skip_item
+                if frame.streaming and frame.scanner is None:
+                    obj.start_property( key )
+                if frame.scanner is not None:
+                    child, val = None, self.__skip_member(state, frame.scanner)
+                elif select is None:
+                    child, val = self.__begin_value(state)
+                else:
+                    child, val = self.__begin_selected(state, frame, key,
+                                                       replaces=(not skip_item and key in obj))
+                if child is not None:
+                    frame.resume = 'value'
+                    return child
+
+            # The value of an object property has been decoded
+            resume = None
+            rval = val
+            key = frame.key
+            key_position = frame.value_position
+            self.skipws(state)
+            if not frame.skip_item:
+                if key in obj:
+                    state.push_cond( state.options.duplicate_keys,
+                                     'Object contains duplicate key',
+                                     key, position=key_position, outer_position=start_position,
+                                     context='Object')
+                if key == '':
+                    state.push_cond( state.options.non_portable,
+                                     'Using an empty string "" as an object key may not be portable',
+                                     position=key_position, outer_position=start_position,
+                                     context='Object')
+                obj[ key ] = rval
+                frame.num_items += 1
+            if frame.streaming:
+                return frame  # pause after each property
+        # end while
 
         if state.stats:
             if isdict:
-                state.stats.max_items_in_object = max(state.stats.max_items_in_object, num_items)
+                state.stats.max_items_in_object = max(state.stats.max_items_in_object, frame.num_items)
             else:
-                state.stats.max_items_in_array = max(state.stats.max_items_in_array, num_items)
+                state.stats.max_items_in_array = max(state.stats.max_items_in_array, frame.num_items)
 
         if state.should_stop:
-            return obj
+            return None
 
         # Make sure composite value is properly terminated
-        if not done:
+        if not frame.done:
             if isdict:
                 state.push_error('Object literal (dictionary) is not terminated',
                                  outer_position=start_position, context='Object')
@@ -4787,26 +7486,88 @@ class JSON(object):
 
         # Update stats and run hooks
         if isdict:
-            state.stats.num_objects += 1
-            if self.has_hook('decode_object'):
+            if state.stats:
+                state.stats.num_objects += 1
+            if 'decode_object' in self._active_hooks and select is None and not frame.streaming:
                 try:
-                    obj = self.call_hook( 'decode_object', obj, position=start_position )
+                    frame.obj = self.call_hook( 'decode_object', obj, position=start_position )
                 except JSONSkipHook:
                     pass
                 except JSONError, err:
                     state.push_exception(err)
-                    obj = undefined
+                    frame.obj = undefined
         else:
-            state.stats.num_arrays += 1
-            if self.has_hook('decode_array'):
+            if state.stats:
+                state.stats.num_arrays += 1
+            if 'decode_array' in self._active_hooks and select is None and not frame.streaming:
                 try:
-                    obj = self.call_hook( 'decode_array', obj, position=start_position )
+                    frame.obj = self.call_hook( 'decode_array', obj, position=start_position )
                 except JSONSkipHook:
                     pass
                 except JSONError, err:
                     state.push_exception(err)
-                    obj = undefined
-        return obj
+                    frame.obj = undefined
+        return None
+
+    def _scan_composite(self, state, scanner):
+        """Finds the members of the array or object at the current
+        position, for _lazy_document.scan_members().  Its syntax is
+        checked exactly as decode_composite() would check it, but the
+        value of each member is passed over rather than decoded.
+
+        The 'scanner' is the _lazy_document, whose skip_value() method
+        passes over the values, and whose raise_errors() method is
+        called after each member; so the first error is raised as
+        soon as it is found.
+
+        Returns a list of the offsets of an array's elements, with
+        undefined for any which are omitted; or a _member_offsets of
+        an object's properties.
+
+        """
+        frame = self.__open_composite(state, scanner)
+        scanner.raise_errors()
+        if frame is None:
+            return []  # Stopped by an earlier fatal error
+        while self.__continue_composite(state, frame, None) is not None:
+            scanner.raise_errors()
+        scanner.raise_errors()
+        return frame.obj
+
+    def __skip_member(self, state, scanner):
+        """Passes over the value of a member of an array or object for
+        _scan_composite(), returning the offset at which it starts.
+
+        """
+        buf = state.buf
+        self.skipws(state)
+        if buf.at_end or buf.peek() in ',:]}':
+            return self.__begin_value(state)[1]  # A missing value, to report the error
+        offset = buf.cpos
+        buf.seek( scanner.skip_value( offset ) )
+        return offset
+
+    def __begin_value(self, state, identifier_as_string=False):
+        """Starts decoding a value inside an array or object, just as
+        decodeobj() would.  Returns a tuple (frame, value), with either
+        the frame of a nested array or object which has been opened,
+        or else None and the decoded value.
+
+        """
+        buf = state.buf
+        self.skipws(state)
+        if buf.at_end:
+            state.push_error('Unexpected end of input')
+
+        c = buf.peek()
+        if c in '{[':
+            state.cur_depth += 1
+            state.update_depth_stats()
+            frame = self.__open_composite(state)
+            if frame is None:
+                state.cur_depth -= 1
+            return frame, None
+        return None, self.__decode_scalar(state, c, identifier_as_string)
 
 
     def decode_javascript_identifier(self, name):
@@ -4820,6 +7581,124 @@ class JSON(object):
         return name
 
 
+    def __decode_object_key(self, state):
+        """Decodes an object key, looking string literals up in the
+        state's key cache first so that the keys which are repeated
+        through a document are only decoded once, and share a single
+        string object.
+
+        """
+        key_cache = state.key_cache
+        if key_cache is None:
+            return self.decodeobj(state, identifier_as_string=True)
+        buf = state.buf
+        self.skipws(state)
+        m = _fast_decoder._clean_string_re.match( buf.text, buf.cpos )
+        if not m:
+            return self.decodeobj(state, identifier_as_string=True)
+        literal = m.group()
+        key = key_cache.get( literal )
+        if key is not None:
+            if state.stats:
+                state.stats.num_key_cache_hits += 1
+            # The checks may not have been made when the key was cached
+            state.update_string_stats( key, position=buf.position )
+            buf.seek( m.end() )
+            return key
+        if state.stats:
+            state.stats.num_key_cache_misses += 1
+        num_messages = state.num_messages
+        key = self.decodeobj(state, identifier_as_string=True)
+        if state.num_messages == num_messages and helpers.isstringtype(key):
+            key_cache[literal] = key
+        return key
+
+    def __begin_selected(self, state, frame, key, replaces=False):
+        """Starts decoding a member of an array or object when only the
+        paths in frame.select are wanted, otherwise like __begin_value().
+        The key is the object key or array index of the member, and
+        'replaces' is True for a duplicate key whose earlier value is
+        being replaced.
+
+        A member which is not on any of those paths is only checked,
+        and one which is at the end of a path is decoded in full and
+        recorded in state.selected.  The value returned is None, or
+        syntax_error, as from __end_selected().
+
+        """
+        if not helpers.isstringtype(key):
+            key = unicode(key)
+        subselect = [path[1:] for path in frame.select if path[0] == key or path[0] == u'*']
+        if not subselect:
+            # Check the value without building it if the fast decoder can
+            validator = state.select_validator
+            if validator:
+                buf = state.buf
+                try:
+                    buf.seek( validator.skip( buf.text, buf.cpos, state.cur_depth ) )
+                    return None, None
+                except _fast_decoder_fallback:
+                    pass
+            frame.selecting = ('skip',)
+        else:
+            pointer = state.select_pointer + (key,)
+            if replaces:
+                # Forget what was selected within the earlier value
+                prefix = helpers.make_json_pointer( pointer )
+                for ptr in list(state.selected.keys()):
+                    if ptr == prefix or ptr.startswith( prefix + u'/' ):
+                        del state.selected[ptr]
+            if () in subselect:
+                frame.selecting = ('whole', subselect, pointer)
+            else:
+                frame.selecting = ('within', state.select, state.select_pointer)
+                state.select, state.select_pointer = subselect, pointer
+        child, val = self.__begin_value(state)
+        if child is not None:
+            return child, None
+        return None, self.__end_selected(state, frame, val)
+
+    def __end_selected(self, state, frame, val):
+        """Finishes the member begun by __begin_selected(), once its
+        value has been decoded.  Returns None, or syntax_error.
+
+        """
+        selecting = frame.selecting
+        frame.selecting = None
+        if selecting[0] == 'whole':
+            if not state.should_stop and val is not syntax_error:
+                self.__select_from_value( val, selecting[1], selecting[2], state.selected )
+        elif selecting[0] == 'within':
+            state.select, state.select_pointer = selecting[1], selecting[2]
+        if val is syntax_error:
+            return syntax_error
+        return None
+
+    @staticmethod
+    def __select_from_value( value, paths, pointer, selected ):
+        """Finds the selected paths within an already decoded value,
+        adding what they refer to into the 'selected' dictionary.
+        """
+        for path in paths:
+            found = [ (pointer, value) ]
+            for token in path:
+                subfound = []
+                for ptr, val in found:
+                    if isinstance(val, (list, tuple)):
+                        members = enumerate(val)
+                    elif isinstance(val, dict):
+                        members = val.items()
+                    else:
+                        continue
+                    for k, v in members:
+                        if not helpers.isstringtype(k):
+                            k = unicode(k)
+                        if token == u'*' or token == k:
+                            subfound.append( (ptr + (k,), v) )
+                found = subfound
+            for ptr, val in found:
+                selected[ helpers.make_json_pointer(ptr) ] = val
+
     def decodeobj(self, state, identifier_as_string=False, at_document_start=False):
         """Intermediate-level JSON decoder.
 
@@ -4846,48 +7725,424 @@ class JSON(object):
                 state.cur_depth -= 1
         else:
             if at_document_start:
-                state.push_cond( self.options.any_type_at_start,
+                state.push_cond( state.options.any_type_at_start,
                                  'JSON document must start with an object or array type only' )
-            if c in self._string_quotes:
-                obj = self.decode_string(state)
-            elif c.isdigit() or c in '.+-':
-                obj = self.decode_number(state)
-            elif c.isalpha() or c in'_$':
-                obj = self.decode_identifier(state, identifier_as_string=identifier_as_string)
-            else:
-                state.push_error('Can not decode value starting with character %r' % c)
-                buf.skip()
-                self.recover_parser(state)
-                obj = syntax_error
+            obj = self.__decode_scalar(state, c, identifier_as_string)
         return obj
 
+    def __decode_scalar(self, state, c, identifier_as_string=False):
+        """Decodes a value other than an array or object, which starts
+        with the character c.
+
+        """
+        if c in self._string_quotes:
+            return self.decode_string(state)
+        elif c.isdigit() or c in '.+-':
+            return self.decode_number(state)
+        elif c.isalpha() or c in'_$':
+            return self.decode_identifier(state, identifier_as_string=identifier_as_string)
+        else:
+            state.push_error('Can not decode value starting with character %r' % c)
+            state.buf.skip()
+            self.recover_parser(state)
+            return syntax_error
+
+
+    def incremental_decoder(self, encoding=None):
+        """Returns an incremental_decoder object, which decodes a
+        stream of JSON values given to it a piece at a time.
+
+        See the incremental_decoder class for details.
+
+        """
+        return incremental_decoder( self, encoding=encoding )
+
+    def iterparse(self, txt, encoding=None):
+        """Decodes a JSON document as a stream of parsing events,
+        without building any Python lists or dictionaries.
+
+        This is a generator which yields 3-tuples (event, path, value),
+        where the event is one of:
+
+            * 'start_map', 'end_map'     -- an object begins or ends
+            * 'start_array', 'end_array' -- an array begins or ends
+            * 'map_key' -- an object property; the value is the key
+            * 'scalar'  -- any other value: string, number, etc.
+
+        The path is a tuple of the keys and array indexes leading
+        from the top of the document down to the current value.  For
+        the 'map_key' event it is the path of the enclosing object.
+        The value is None for the start and end events.
+
+        The input may be a string or a file-like object.  A file is
+        read a piece at a time, and the text is thrown away once it
+        has been parsed; so the memory used depends on the longest
+        string or number in the document, how deeply it nests, and
+        how many keys its objects have, rather than on its whole
+        size.  The same syntax rules,
+        options, and string and number hooks apply as with decode(),
+        as the same decoder is used; but the 'decode_array' and
+        'decode_object' hooks are never called since no such objects
+        are built.
+
+        The first error found is raised as a JSONDecodeError, with
+        its position, after all the events preceeding it have been
+        yielded.  Warnings are ignored.
+
+        """
+        state = decode_state( options=self.options.freeze(), collect_stats=False, collect_warnings=False )
+        if hasattr(txt, 'read'):
+            state.set_input( u'' )
+            reader = _lookahead_reader( state, txt, encoding=encoding )
+        else:
+            state.set_input( txt, encoding=encoding )
+            reader = None
+
+        num_checked = [0]
+        def raise_errors( upto=None ):
+            errors = state.errors
+            if upto is None:
+                upto = len(errors)
+            while num_checked[0] < upto:
+                err = errors[ num_checked[0] ]
+                num_checked[0] += 1
+                if err.severity in ('fatal','error'):
+                    raise err
+
+        def fill():
+            if reader:
+                reader.fill()
+            raise_errors()
+
+        raise_errors()
+        fill()
+        self.__sanity_check_start( state )
+        raise_errors()
+        if state.options.decimal_context:
+            dec_ctx = lambda: decimal.localcontext( state.options.decimal_context )
+        else:
+            dec_ctx = lambda: _dummy_context_manager
+
+        buf = state.buf
+        self.skipws(state)
+        if buf.at_end:
+            state.push_error('No value to decode')
+            raise_errors()
+
+        if buf.peek() not in '{[':
+            with dec_ctx():
+                val = self.decodeobj(state, at_document_start=True)
+            raise_errors()
+            yield ('scalar', (), val)
+        else:
+            # The arrays and objects are decoded just as decode() does,
+            # except that their frames are streaming: each one pauses
+            # after every member, and rather than being built up the
+            # list or dictionary is replaced by an _event_sink.
+            state.events = events = []  # not yet yielded
+            def start( frame, path ):
+                sink = frame.obj
+                sink.path = path
+                if frame.isdict:
+                    event = 'start_map'
+                else:
+                    event = 'start_array'
+                events.append( (sink.num_errors_at_start, (event, path, None)) )
+
+            state.cur_depth += 1
+            state.update_depth_stats()
+            raise_errors()
+            frame = self.__open_composite(state)
+            if frame is None:
+                raise_errors()  # it could not even be started
+            start( frame, () )
+            stack = [frame]
+            val = None
+            while True:
+                # Take steps until there are a few events to pass on
+                with dec_ctx():
+                    while stack and len(events) < self._iterparse_batch_size and not state.has_errors:
+                        if reader:
+                            reader.fill()
+                        frame = stack[-1]
+                        child = self.__continue_composite(state, frame, val)
+                        val = None
+                        if child is frame:
+                            continue  # paused after a member
+                        elif child is not None:
+                            # A nested array or object has been opened
+                            sink = frame.obj
+                            if frame.isdict:
+                                start( child, sink.path + (frame.key,) )
+                            else:
+                                start( child, sink.path + (len(sink),) )
+                            stack.append( child )
+                            continue
+
+                        # The array or object is complete
+                        stack.pop()
+                        state.cur_depth -= 1
+                        sink = frame.obj
+                        if frame.isdict:
+                            sink.add_event( 'end_map', sink.path )
+                        else:
+                            sink.add_event( 'end_array', sink.path )
+                        val = sink
+
+                for num_errors, event in events:
+                    raise_errors( num_errors )
+                    yield event
+                del events[:]
+                raise_errors()
+                if not stack:
+                    break
+            fill()
+
+        # Make sure there's nothing at the end
+        self.skipws(state)
+        if not buf.at_end:
+            state.push_error('Unexpected text after end of JSON value')
+        raise_errors()
+
+    def prepare(self):
+        """Returns a json_session, which can decode and encode many
+        documents with the options and hooks this object has now.
+
+        Later changes to this object's options or hooks do not affect
+        the session.  The session does the setup work which decode()
+        and encode() would do on every call just once, so it is the
+        faster choice when handling lots of small documents.
+
+        """
+        json = self.__class__( json_options=self.options.copy() )
+        for hook_name, function in self._active_hooks.items():
+            json.set_hook( hook_name, function )
+        return json_session( json )
 
-    def decode(self, txt, encoding=None, return_errors=False, return_stats=False):
+    def decode(self, txt, encoding=None, return_errors=False, return_stats=False, lazy=False, select=None):
         """Decodes a JSON-encoded string into a Python object.
 
         The 'return_errors' parameter controls what happens if the
         input JSON has errors in it.
 
-            * False: the first error will be raised as a Python
-              exception. If there are no errors then the corresponding
-              Python object will be returned.
+            * False: the first error will be raised as a Python
+              exception. If there are no errors then the corresponding
+              Python object will be returned.
+
+            * True: the return value is always a 2-tuple: (object, error_list)
+
+        If 'lazy' is True then arrays and objects are returned as
+        read-only lazy_array and lazy_object proxies, which only
+        decode the parts of the document that are actually used.  Any
+        errors within them are raised when they are used, rather than
+        being returned here; that includes going deeper than the
+        max_depth option allows, after which the document can not be
+        used any further.  The 'decode_array' and 'decode_object'
+        hooks are not called, and return_stats can not be used.
+
+        If 'select' is given it is a list of JSON Pointers (RFC 6901),
+        such as ["/items/*/id", "/meta"], where a "*" token matches any
+        object key or array index.  Only the values they refer to are
+        decoded, and they are returned as a dictionary which maps the
+        JSON Pointer of each value that was found to the value.  The
+        rest of the document is still checked for errors, but the
+        fast decoder is used to skip over it without building any
+        objects whenever it can be.  Hooks are only called for the
+        selected values.
+
+        If the options do not allow any non-standard syntax, no hooks
+        are set, and statistics were not asked for, then a faster
+        decoder which only understands strict JSON is tried first.
+        Should it run into any problem the full decoder is used
+        instead, so the results are the same either way.
+
+        """
+        state = decode_state( options=self.options.freeze(), collect_stats=return_stats,
+                              collect_warnings=return_errors )
+
+        # Prepare the input
+        state.set_input( txt, encoding=encoding )
+
+        # Do the decoding
+        if lazy and return_stats:
+            raise ValueError("Statistics can not be gathered when decoding lazily")
+        if select is not None:
+            if lazy:
+                raise ValueError("Selected paths can not be decoded lazily")
+            if helpers.isstringtype(select):
+                select = [select]
+            select = [helpers.split_json_pointer(pointer) for pointer in select]
+        self._decode_input( state, return_errors=return_errors, return_stats=return_stats, lazy=lazy,
+                            select=select )
+
+        if return_stats and state.buf:
+            state.stats.num_excess_whitespace = state.buf.num_ws_skipped
+            state.stats.total_chars = state.buf.position.char_position
+
+        # Handle the errors
+        result_type = _json_results
+
+        if return_errors:
+            if return_stats:
+                return result_type(state.obj, state.errors, state.stats)
+            else:
+                return result_type(state.obj, state.errors, None)
+        else:
+            # Don't cause warnings to raise an error
+            errors = [err for err in state.errors if err.severity in ('fatal','error')]
+            if errors:
+                raise errors[0]
+            if return_stats:
+                return result_type(state.obj, None, state.stats)
+            else:
+                return state.obj
+
+    def decode_lines(self, source, encoding=None, return_errors=False):
+        """Decodes newline-delimited JSON (also called JSON Lines or
+        NDJSON), where each line of the input is a separate JSON value.
+
+        This is a generator which yields the Python object for each
+        line in turn; blank lines are skipped.  The source may be a
+        string, or a file-like object which is then read a piece at a
+        time.  Bytes are decoded with the given encoding, or it is
+        auto-detected if None; a file is decoded as one stream, before
+        it is split into lines, so any encoding may be used.
+
+        The 'return_errors' parameter works as with decode(): if False
+        the first error is raised as an exception, if True a 2-tuple
+        (object, error_list) is yielded for each line instead.  Either
+        way the error positions, and so their line numbers, are those
+        within the entire input rather than the single line.
+
+        """
+        result_type = _json_results
+        state = decode_state( options=self.options.freeze(), collect_stats=False,
+                              collect_warnings=return_errors )
+        fast_decoder = self._get_fast_decoder( state.options, collect_warnings=return_errors ) or False
+        key_cache = self._get_key_cache()  # Shared by all the lines
+
+        bom = None
+        stream = None
+        if hasattr(source, 'read'):
+            stream = _text_stream_decoder( encoding )
+            lines = self.__read_lines( source, stream )
+        else:
+            try:
+                decoded = helpers.unicode_decode( source, encoding )
+            except JSONError:
+                raise
+            except Exception, err:
+                newerr = JSONDecodeError("a Unicode decoding error occurred", position=0, severity='fatal')
+                newerr.__cause__ = err
+                raise newerr
+            lines = self.__split_lines( decoded.string )
+            bom = decoded.bom
+
+        line_num = 1
+        offset = 0
+        for line in lines:
+            if stream is not None and line_num == 1:
+                bom = stream.bom
+            state.set_input( line )
+            state.key_cache = key_cache
+            if bom:
+                state.push_cond( state.options.bom,
+                                 "JSON document was prefixed by a BOM (Byte Order Mark)",
+                                 bom )
+                bom = None
+            if state.buf:
+                length = len(state.buf.text) + 1
+                is_blank = not state.buf.text.strip()
+                if not is_blank:
+                    self._decode_input( state, return_errors=return_errors, fast_decoder=fast_decoder )
+            else:
+                length = len(line) + 1
+                is_blank = False
+
+            if state.errors:
+                start = position_marker( offset, line_num, 0 )
+                for err in state.errors:
+                    _relocate_error( err, start )
+                    if not return_errors and err.severity in ('fatal','error'):
+                        raise err
+            if not is_blank:
+                if return_errors:
+                    yield result_type(state.obj, state.errors, None)
+                else:
+                    yield state.obj
+            line_num += 1
+            offset += length
+
+    @staticmethod
+    def __split_lines( text ):
+        """Generates the lines in the text, without the newlines."""
+        start, end = 0, len(text)
+        while start < end:
+            i = text.find( u'\n', start )
+            if i < 0:
+                i = end
+            yield text[start:i]
+            start = i + 1
+
+    @staticmethod
+    def __read_lines( source, stream ):
+        """Generates the lines read from a file, without the newlines.
+        The file is read a piece at a time, which the given
+        _text_stream_decoder turns into text.
+        """
+        pending = []  # pieces of a line whose end has not been read yet
+        while True:
+            piece = source.read( 0x10000 )
+            if piece:
+                text = stream.decode( piece )
+            else:
+                text = stream.finish()
+            start = 0
+            while True:
+                i = text.find( u'\n', start )
+                if i < 0:
+                    break
+                if pending:
+                    pending.append( text[start:i] )
+                    yield u''.join( pending )
+                    pending = []
+                else:
+                    yield text[start:i]
+                start = i + 1
+            if start < len(text):
+                pending.append( text[start:] )
+            if not piece:
+                break
+        if pending:
+            yield u''.join( pending )
+
+    def _decode_input(self, state, return_errors=False, return_stats=False, fast_decoder=None, lazy=False,
+                      select=None):
+        """Decodes the input text which has already been given to the
+        decode state, leaving the result and any errors in the state.
 
-            * True: the return value is always a 2-tuple: (object, error_list)
+        See _try_fast_decode() for the 'fast_decoder' argument, and
+        _do_select_decode() for 'select'.
 
         """
         import sys
-        state = decode_state( options=self.options )
-
-        # Prepare the input
-        state.set_input( txt, encoding=encoding )
-
-        # Do the decoding
+        if state.key_cache is None:
+            state.key_cache = self._get_key_cache()
         if not state.has_errors:
             self.__sanity_check_start( state )
 
         if not state.has_errors:
             try:
-                self._do_decode( state )    # DECODE!
+                if lazy:
+                    self._do_lazy_decode( state )
+                elif select is not None:
+                    if not return_stats:
+                        state.select_validator = self._get_fast_decoder( state.options,
+                                                                         collect_warnings=return_errors )
+                    self._do_select_decode( state, select )
+                elif return_stats or not self._try_fast_decode( state, collect_warnings=return_errors,
+                                                                decoder=fast_decoder ):
+                    self._do_decode( state )    # DECODE!
             except JSONException, err:
                 state.push_exception( err )
             except Exception, err:   # Mainly here to catch maximum recursion depth exceeded
@@ -4897,28 +8152,7 @@ class JSON(object):
                 newerr.__cause__ = err
                 newerr.__traceback__ = e2[2]
                 state.push_exception( newerr )
-
-        if return_stats and state.buf:
-            state.stats.num_excess_whitespace = state.buf.num_ws_skipped
-            state.stats.total_chars = state.buf.position.char_position
-
-        # Handle the errors
-        result_type = _namedtuple('json_results',['object','errors','stats'])
-
-        if return_errors:
-            if return_stats:
-                return result_type(state.obj, state.errors, state.stats)
-            else:
-                return result_type(state.obj, state.errors, None)
-        else:
-            # Don't cause warnings to raise an error
-            errors = [err for err in state.errors if err.severity in ('fatal','error')]
-            if errors:
-                raise errors[0]
-            if return_stats:
-                return result_type(state.obj, None, state.stats)
-            else:
-                return state.obj
+        state.note_suppressed_warnings()
 
     def __sanity_check_start(self, state):
         """Check that the document seems sane by looking at the first couple characters.
@@ -4962,6 +8196,69 @@ class JSON(object):
                         state.push_fatal( 'The input is gibberish, is the Unicode encoding correct?' )
         return is_sane
 
+    def _get_key_cache(self):
+        """Returns the object key cache to decode a document with,
+        according to the key_cache_size option, or None.  Keys are not
+        cached when there is a 'decode_string' hook.
+
+        """
+        size = self.options.key_cache_size
+        if size == 0 or 'decode_string' in self._active_hooks:
+            return None
+        elif size is None:
+            return {}
+        cache = getattr( self, '_key_cache', None )
+        if cache is None or cache.maxsize != size:
+            cache = self._key_cache = _lru_cache( size )
+        return cache
+
+    def _get_fast_decoder(self, options, collect_warnings=True, decoder_class=None):
+        """Returns a _fast_decoder for the given json_options, or None
+        if the fast decoder can not be used with them or with the hooks
+        that are set.  A subclass of _fast_decoder may be asked for.
+
+        """
+        for hook_name in self._active_hooks:
+            if hook_name.startswith('decode_'):
+                return None
+        if decoder_class is None:
+            decoder_class = _fast_decoder
+        if not decoder_class.can_decode_with( options ):
+            return None
+        return decoder_class( options, collect_warnings )
+
+    def _try_fast_decode(self, state, collect_warnings=True, decoder=None):
+        """Attempts to decode the input document with the fast strict
+        JSON decoder, see the _fast_decoder class.
+
+        A decoder previously obtained from _get_fast_decoder() may be
+        passed in, or False if it was unavailable.
+
+        Returns True if that succeeded, or False if the full decoder
+        must be used instead; in which case the state is unchanged.
+
+        """
+        if decoder is None:
+            decoder = self._get_fast_decoder( state.options, collect_warnings )
+        if not decoder:
+            return False
+
+        text = state.buf.text
+        if state.options.decimal_context:
+            dec_ctx = decimal.localcontext( state.options.decimal_context )
+        else:
+            dec_ctx = _dummy_context_manager
+        decoder.key_cache = state.key_cache
+        try:
+            with dec_ctx:
+                obj, end = decoder.decode( text, state.buf.cpos )
+        except _fast_decoder_fallback:
+            return False
+        if end < len(text):
+            return False
+        state.obj = obj
+        return True
+
     def _do_decode(self, state):
         """This is the internal function that does the JSON decoding.
 
@@ -4987,7 +8284,141 @@ class JSON(object):
                 if not buf.at_end:
                     state.push_error('Unexpected text after end of JSON value')
 
+    def _do_lazy_decode(self, state):
+        """Decodes the document lazily, see the 'lazy' argument of the
+        decode() method.  Only the extent of the top-level value is
+        checked now, by skipping over it.
+
+        """
+        buf = state.buf
+        self.skipws(state)
+        if buf.at_end:
+            state.push_error('No value to decode')
+        elif buf.peek() not in '[{':
+            self._do_decode( state )  # Nothing to be lazy about
+        else:
+            document = _lazy_document( self, state )
+            start = buf.cpos
+            buf.seek( document.skip_value( start ) )
+            self.skipws(state)
+            if not buf.at_end:
+                state.push_error('Unexpected text after end of JSON value')
+            try:
+                state.obj = document.decode_value( start, 1 )
+            except JSONDecodeError:
+                pass  # It is in state.errors, to be reported from there
+            document.num_checked = len(state.errors)
+
+    def _do_select_decode(self, state, select):
+        """Decodes only the values at the selected paths, given as a
+        list of tuples of JSON Pointer tokens, see the 'select' argument
+        of the decode() method.  The result is a dictionary.
+
+        """
+        if _OrderedDict:
+            state.selected = _OrderedDict()
+        else:
+            state.selected = {}
+        if () in select:
+            # The whole document is wanted anyway
+            self._do_decode( state )
+            if not state.should_stop:
+                self.__select_from_value( state.obj, select, (), state.selected )
+        else:
+            state.select = select
+            try:
+                self._do_decode( state )
+            finally:
+                state.select = None
+                state.obj = state.selected
+            return
+        state.obj = state.selected
+
     def _classify_for_encoding( self, obj ):
+        """Tells which kind of JSON value the object is to be encoded
+        as, such as 'string', 'number', 'dict' or 'sequence'.
+
+        The classification is remembered for each type, so that for
+        most objects it takes a single dictionary lookup.  Only those
+        types whose objects may be classified differently, such as
+        namedtuples or objects which might have their own keys()
+        method, are looked at again each time.
+
+        """
+        try:
+            c = self._type_classes[ type(obj) ]
+        except KeyError:
+            return self._classify_type( obj )
+        if c is None:
+            c = self._classify_object( obj )
+        elif c.__class__ is tuple:
+            # Objects of this type act like dictionaries only if they
+            # have the methods themselves.
+            if hasattr(obj,'iterkeys') or (hasattr(obj,'__getitem__') and hasattr(obj,'keys')):
+                c = 'dict'
+            else:
+                c = c[0]
+        return c
+
+    def _classify_type( self, obj ):
+        """Classifies the object, and remembers as much of that as holds
+        for every object of its type.
+
+        """
+        c = self._classify_object( obj )
+        cls = type(obj)
+        if cls is _old_style_instance or obj is undefined:
+            return c  # The type says nothing
+        if isinstance(obj, tuple) and hasattr(obj, '_asdict'):
+            kept = None  # Namedtuples are classified with the options
+        elif c in ('null','bool','number','string') \
+                or isinstance(obj, (dict,list,tuple,set,frozenset)):
+            kept = c
+        elif hasattr(cls,'iterkeys') or (hasattr(cls,'__getitem__') and hasattr(cls,'keys')):
+            kept = c
+        elif hasattr(obj,'__dict__') or hasattr(cls,'__getattr__'):
+            if c == 'dict':
+                return c  # Only this object is known to act like one
+            kept = (c,)  # Others could still act like dictionaries
+        else:
+            kept = c
+        self._type_classes[ cls ] = kept
+        return c
+
+    def _has_json_equivalent( self, obj ):
+        """Does the object have a json_equivalent() method?  Like the
+        classifications, this is remembered for each type.
+
+        """
+        try:
+            has = self._type_equivalents[ type(obj) ]
+        except KeyError:
+            cls = type(obj)
+            if hasattr(cls, 'json_equivalent'):
+                has = True
+            elif cls is _old_style_instance or hasattr(obj,'__dict__') or hasattr(cls,'__getattr__'):
+                has = None  # Each object may or may not have one
+            else:
+                has = False
+            self._type_equivalents[ cls ] = has
+        if has is None:
+            has = hasattr(obj, 'json_equivalent')
+        return has
+
+    def _check_type_caches( self ):
+        """Forgets what was remembered about types if any class has since
+        been registered with an abstract base class, which could change
+        what isinstance() says.
+
+        """
+        token = _abc_cache_token()
+        if token != self._type_cache_token:
+            self._type_cache_token = token
+            self._type_classes.clear()
+            self._type_equivalents.clear()
+
+    def _classify_object( self, obj ):
+        """Classifies the object by itself, see _classify_for_encoding()."""
         import datetime
         c = 'other'
         if obj is None:
@@ -5053,15 +8484,19 @@ class JSON(object):
         can be encoded.
 
         """
-        import sys, codecs
+        cdk, escape_unicode_test = self._prepare_encoding( encoding )
+        return self._encode_with_codec( obj, cdk, escape_unicode_test )
 
-        # Make a fresh encoding state
-        state = encode_state( self.options )
+    def _prepare_encoding(self, encoding):
+        """Finds the codec to use for the given output encoding, and
+        the function which tells which characters must be \u-escaped.
 
-        # Find the codec to use. CodecInfo will be in 'cdk' and name in 'encoding'.
-        #
-        # Also set the state's 'escape_unicode_test' property which is used to
-        # determine what characters to \u-escape.
+        Returns a tuple (codec_info, escape_unicode_test); the codec is
+        None if the encoding is None, meaning a Unicode string is to be
+        produced.  The escape test is False if no characters need it.
+
+        """
+        import codecs
         if encoding is None:
             cdk = None
         elif isinstance(encoding, codecs.CodecInfo):
@@ -5074,30 +8509,22 @@ class JSON(object):
 
         if self.options.escape_unicode and callable(self.options.escape_unicode):
             # User-supplied repertoire test function
-            state.escape_unicode_test = self.options.escape_unicode
+            escape_unicode_test = self.options.escape_unicode
         else:
             if self.options.escape_unicode==True or not cdk or cdk.name.lower() == 'ascii':
                 # ASCII, ISO8859-1, or and Unknown codec -- \u escape anything not ASCII
-                state.escape_unicode_test = lambda c: ord(c) >= 0x80
+                escape_unicode_test = _escape_non_ascii
             elif cdk.name == 'iso8859-1':
-                state.escape_unicode_test = lambda c: ord(c) >= 0x100
+                escape_unicode_test = _escape_non_latin1
             elif cdk and cdk.name.lower().startswith('utf'):
                 # All UTF-x encodings can do the whole Unicode repertoire, so
                 # do nothing special.
-                state.escape_unicode_test = False
+                escape_unicode_test = False
             else:
                 # An unusual codec.  We need to test every character
                 # to see if it is in the codec's repertoire to determine
                 # if we should \u escape that character.
-                enc_func = cdk.encode
-                def escape_unicode_hardway( c ):
-                    try:
-                        enc_func( c )
-                    except UnicodeEncodeError:
-                        return True
-                    else:
-                        return False
-                state.escape_unicode_test = escape_unicode_hardway
+                escape_unicode_test = _escape_unencodable( cdk )
 
         # Make sure the encoding is not degenerate: it can encode the minimal
         # number of characters needed by the JSON syntax rules.
@@ -5107,34 +8534,127 @@ class JSON(object):
             except UnicodeError, err:
                 raise JSONEncodeError("Output encoding %s is not sufficient to encode JSON" % cdk.name)
 
+        return (cdk, escape_unicode_test)
+
+    def _encode_with_codec(self, obj, cdk, escape_unicode_test):
+        """Encodes the Python object, given what _prepare_encoding()
+        returned for the output encoding.
+
+        """
+        # Make a fresh encoding state
+        self._check_type_caches()
+        state = encode_state( self.options.freeze() )
+        state.escape_unicode_test = escape_unicode_test
+
         # Do the JSON encoding!
         self._do_encode( obj, state )
-        if not self.options.encode_compactly:
+        if not state.options.encode_compactly:
             state.append('\n')
         unitxt = state.combine()
 
         # Do the final Unicode encoding
-        if encoding is None:
+        if cdk is None:
             output = unitxt
         else:
             try:
                 output, nchars = cdk.encode( unitxt )
             except UnicodeEncodeError, err:
-                # Re-raise as a JSONDecodeError
-                e2 = sys.exc_info()
-                newerr = JSONEncodeError("a Unicode encoding error occurred")
-                # Simulate Python 3's: "raise X from Y" exception chaining
-                newerr.__cause__ = err
-                newerr.__traceback__ = e2[2]
-                raise newerr
+                raise self._encoding_error( err )
         return output
 
+    @staticmethod
+    def _encoding_error( err ):
+        """Makes a JSONEncodeError to re-raise the UnicodeEncodeError
+        which is currently being handled.
+
+        """
+        import sys
+        e2 = sys.exc_info()
+        newerr = JSONEncodeError("a Unicode encoding error occurred")
+        # Simulate Python 3's: "raise X from Y" exception chaining
+        newerr.__cause__ = err
+        newerr.__traceback__ = e2[2]
+        return newerr
+
+    def iterencode(self, obj, encoding=None, chunk_size=1000 ):
+        """Encodes the Python object into JSON a piece at a time; a
+        generator.
+
+        The pieces are Unicode strings if the encoding is None,
+        otherwise they are byte strings in that encoding, all as for
+        the encode() method.  Joined together they give the same
+        result as encode() would.
+
+        Only about 'chunk_size' strings of output are collected before
+        a piece is yielded, and generators and other iterators are
+        only consumed as they are encoded, so the whole document is
+        never held in memory.  Note though that each member of an
+        array or object is written out whole, and that the members of
+        a dictionary are all looked at first so they can be sorted.
+
+        """
+        cdk, escape_unicode_test = self._prepare_encoding( encoding )
+        if cdk is None:
+            encoder = None
+        else:
+            encoder = helpers.incremental_encoder_for( cdk )
+
+        self._check_type_caches()
+        state = encode_state( self.options.freeze() )
+        state.escape_unicode_test = escape_unicode_test
+        state.flush_chunks = max( 1, chunk_size )
+
+        self._do_encode( obj, state )
+        writer = state.run_pending()
+        last = False
+        while not last:
+            try:
+                writer.next()
+            except StopIteration:
+                last = True
+                if not state.options.encode_compactly:
+                    state.append('\n')
+            unitxt = state.combine()
+            if encoder is None:
+                if unitxt:
+                    yield unitxt
+            else:
+                try:
+                    output = encoder.encode( unitxt, last )
+                except UnicodeEncodeError, err:
+                    raise self._encoding_error( err )
+                if output:
+                    yield output
+
+    def encode_to_stream(self, obj, fp, encoding='utf-8', flush_size=65536 ):
+        """Encodes the Python object into JSON, writing it to the
+        file-like object 'fp' as it goes.
+
+        The encoding is as for the encode() method; if it is None
+        then Unicode strings are written, as for a text file.  Output
+        is written in pieces of about 'flush_size' characters or
+        bytes.  See the iterencode() method.
+
+        """
+        pieces = []
+        size = 0
+        for piece in self.iterencode( obj, encoding=encoding ):
+            pieces.append( piece )
+            size += len(piece)
+            if size >= flush_size:
+                fp.write( piece[:0].join(pieces) )
+                pieces = []
+                size = 0
+        if pieces:
+            fp.write( pieces[0][:0].join(pieces) )
+
 
     def _do_encode(self, obj, state):
         """Internal encode function."""
         obj_classification = self._classify_for_encoding( obj )
+        hooks = self._active_hooks
 
-        if self.has_hook('encode_value'):
+        if 'encode_value' in hooks:
             orig_obj = obj
             try:
                 obj = self.call_hook( 'encode_value', obj )
@@ -5149,7 +8669,7 @@ class JSON(object):
                     self._do_encode( obj, state )
                     return
 
-        if hasattr(obj, 'json_equivalent'):
+        if self._has_json_equivalent( obj ):
             success = self.encode_equivalent( obj, state )
             if success:
                 return
@@ -5157,7 +8677,7 @@ class JSON(object):
         if obj_classification == 'null':
             self.encode_null( state )
         elif obj_classification == 'undefined':
-            if not self.options.is_forbid_undefined_values:
+            if not state.options.is_forbid_undefined_values:
                 self.encode_undefined( state )
             else:
                 raise JSONEncodeError('strict JSON does not permit "undefined" values')
@@ -5193,7 +8713,7 @@ class JSON(object):
 
     def encode_enum(self, val, state):
         """Encode a Python Enum value into JSON."""
-        eas = self.options.encode_enum_as
+        eas = state.options.encode_enum_as
         if eas == 'qname':
             self.encode_string( str(obj), state )
         elif eas == 'value':
@@ -5202,13 +8722,13 @@ class JSON(object):
             self.encode_string( obj.name, state )
 
     def encode_date(self, dt, state):
-        fmt = self.options.date_format
+        fmt = state.options.date_format
         if not fmt or fmt == 'iso':
             fmt = '%Y-%m-%d'
         self.encode_string( dt.strftime(fmt), state )
 
     def encode_datetime(self, dt, state):
-        fmt = self.options.datetime_format
+        fmt = state.options.datetime_format
         is_iso = not fmt or fmt == 'iso'
         if is_iso:
             if dt.microsecond == 0:
@@ -5221,7 +8741,7 @@ class JSON(object):
         self.encode_string( s, state )
 
     def encode_time(self, t, state):
-        fmt = self.options.datetime_format
+        fmt = state.options.datetime_format
         is_iso = not fmt or fmt == 'iso'
         if is_iso:
             if dt.microsecond == 0:
@@ -5234,7 +8754,7 @@ class JSON(object):
         self.encode_string( s, state )
 
     def encode_timedelta(self, td, state):
-        fmt = self.options.timedelta_format
+        fmt = state.options.timedelta_format
         if not fmt or fmt == 'iso':
             s = helpers.format_timedelta_iso( td )
         elif fmt == 'hms':
@@ -5254,6 +8774,7 @@ class JSON(object):
 
         """
         import sys
+        hooks = self._active_hooks
         if not obj_classification:
             obj_classification = self._classify_for_encoding(obj)
 
@@ -5276,7 +8797,7 @@ class JSON(object):
         elif obj_classification == 'bytes':
             hook_name = 'encode_bytes'
 
-        if self.has_hook(hook_name):
+        if hook_name in hooks:
             try:
                 new_obj = self.call_hook( hook_name, obj )
             except JSONSkipHook:
@@ -5311,17 +8832,21 @@ class JSON(object):
 
         # Convert each member to JSON
         if it is not None:
+            if not hasattr(it, '__iter__'):
+                # Only has a next() method; make it usable in for loops
+                it = iter( it.next, object() )
+
             # Try to get length, but don't fail if we can't
             try:
                 numitems = len(obj)
             except TypeError:
-                numitems = 0
+                numitems = None
 
             # Output the opening bracket or brace
-            compactly = self.options.encode_compactly
+            compactly = state.options.encode_compactly
             if not compactly:
-                indent0 = self.options.indentation_for_level( state.nest_level )
-                indent  = self.options.indentation_for_level( state.nest_level+1 )
+                indent0 = state.options.indentation_for_level( state.nest_level )
+                indent  = state.options.indentation_for_level( state.nest_level+1 )
 
             spaces_after_opener = ''
             if isdict:
@@ -5336,67 +8861,48 @@ class JSON(object):
                 closer = ']'
             if not compactly:
                 #opener = opener + ' '
-                spaces_after_opener = self.options.spaces_to_next_indent_level(subtract=len(opener))
+                spaces_after_opener = state.options.spaces_to_next_indent_level(subtract=len(opener))
 
             state.append( opener )
             state.append( spaces_after_opener )
 
-            # Now iterate through all the items and collect their representations
-            parts = []  # Collects each of the members
-            part_keys = [] # For dictionary key sorting, tuples (key,index)
-
-            try: # while not StopIteration
-                part_idx = 0
-                while True:
-                    obj2 = it.next()
-                    part_idx += 1   # Note, will start counting at 1
+            if isdict:
+                # Collect all the members first, so they can be put in
+                # order by their keys before any of them is encoded.
+                items = []
+                for obj2 in it:
                     if obj2 is obj:
                         raise JSONEncodeError('trying to encode an infinite sequence',obj)
-                    if isdict:
-                        obj3 = obj[obj2]
-                        # Dictionary key is in obj2 and value in obj3.
-
-                        # Let any hooks transform the key.
-                        if self.has_hook('encode_value'):
-                            try:
-                                newobj = self.call_hook( 'encode_value', obj2 )
-                            except JSONSkipHook:
-                                pass
-                            else:
-                                obj2 = newobj
-                        if self.has_hook('encode_dict_key'):
-                            try:
-                                newkey = self.call_hook( 'encode_dict_key', obj2 )
-                            except JSONSkipHook:
-                                pass
-                            else:
-                                obj2 = newkey
+                    obj3 = obj[obj2]
+                    # Dictionary key is in obj2 and value in obj3.
 
-                        # Check JSON restrictions on key types
-                        if not helpers.isstringtype(obj2):
-                            if helpers.isnumbertype(obj2):
-                                if not self.options.is_allow_nonstring_keys:
-                                    raise JSONEncodeError('object properties (dictionary keys) must be strings in strict JSON',obj2)
-                            else:
-                                raise JSONEncodeError('object properties (dictionary keys) can only be strings or numbers in ECMAScript',obj2)
-                        part_keys.append( (obj2, part_idx-1) )
+                    # Let any hooks transform the key.
+                    if 'encode_value' in hooks:
+                        try:
+                            newobj = self.call_hook( 'encode_value', obj2 )
+                        except JSONSkipHook:
+                            pass
+                        else:
+                            obj2 = newobj
+                    if 'encode_dict_key' in hooks:
+                        try:
+                            newkey = self.call_hook( 'encode_dict_key', obj2 )
+                        except JSONSkipHook:
+                            pass
+                        else:
+                            obj2 = newkey
 
-                    # Encode this item in the sequence and put into item_chunks
-                    substate = state.make_substate()
-                    self._do_encode( obj2, substate )
-                    if isdict:
-                        substate.append( dictcolon )
-                        substate2 = substate.make_substate()
-                        self._do_encode( obj3, substate2 )
-                        substate.join_substate( substate2 )
-                    parts.append( substate )
-                # Next item iteration
-            except StopIteration:
-                pass
+                    # Check JSON restrictions on key types
+                    if not helpers.isstringtype(obj2):
+                        if helpers.isnumbertype(obj2):
+                            if not state.options.is_allow_nonstring_keys:
+                                raise JSONEncodeError('object properties (dictionary keys) must be strings in strict JSON',obj2)
+                        else:
+                            raise JSONEncodeError('object properties (dictionary keys) can only be strings or numbers in ECMAScript',obj2)
+                    items.append( (obj2, obj3) )
 
-            # Sort dictionary keys
-            if isdict:
-                srt = self.options.sort_keys
+                # Sort dictionary keys
+                srt = state.options.sort_keys
                 if srt == SORT_PRESERVE:
                     if _OrderedDict and isinstance(obj,_OrderedDict):
                         srt = SORT_NONE   # Will keep order
@@ -5404,39 +8910,90 @@ class JSON(object):
                         srt = SORT_SMART
 
                 if not srt or srt in (SORT_NONE, SORT_PRESERVE):
-                    srt = None
+                    pass
                 elif callable(srt):
-                    part_keys.sort( key=(lambda t: (srt(t[0]),t[0])) )
+                    items.sort( key=(lambda t: (srt(t[0]),t[0])) )
                 elif srt == SORT_SMART:
-                    part_keys.sort( key=(lambda t: (smart_sort_transform(t[0]),t[0])) )
+                    items.sort( key=(lambda t: (smart_sort_transform(t[0]),t[0])) )
                 elif srt == SORT_ALPHA_CI:
-                    part_keys.sort( key=(lambda t: (unicode(t[0]).upper(),t[0])) )
+                    items.sort( key=(lambda t: (unicode(t[0]).upper(),t[0])) )
                 elif srt or srt == SORT_ALPHA:
-                    part_keys.sort( key=(lambda t: unicode(t[0])) )
-                # Now make parts match the new sort order
-                if srt is not None:
-                    parts = [parts[pk[1]] for pk in part_keys]
+                    items.sort( key=(lambda t: unicode(t[0])) )
+                numparts = len(items)
+            elif compactly:
+                items = it
+            else:
+                # The layout depends on the number of members, so look
+                # just far enough ahead to know whether it is too many
+                # for one line.
+                import itertools
+                head = list( itertools.islice( it, state.options.max_items_per_line + 1 ) )
+                numparts = len(head)
+                items = itertools.chain( head, it )
 
             if compactly:
                 sep = ','
-            elif len(parts) <= self.options.max_items_per_line:
+            elif numparts <= state.options.max_items_per_line:
                 sep = ', '
             else:
                 #state.append(spaces_after_opener)
                 state.append('\n' + indent)
                 sep = ',\n' + indent
 
-            for pnum, substate in enumerate(parts):
-                if pnum > 0:
-                    state.append( sep )
-                state.join_substate( substate )
-
-            if not compactly:
-                if numitems > self.options.max_items_per_line:
-                    state.append('\n' + indent0)
+            if compactly:
+                closing = closer
+            else:
+                if numitems is None:
+                    numitems = numparts  # as far as we looked ahead
+                if numitems > state.options.max_items_per_line:
+                    closing = '\n' + indent0 + closer
                 else:
-                    state.append(' ')
-            state.append(closer)  # final '}' or ']'
+                    closing = ' ' + closer
+
+            flush_chunks = state.flush_chunks
+            def write_members():
+                # Writes out each member, one level deeper, and then the
+                # closing bracket.  When streaming this yields now and then
+                # so the output can be taken, and it runs the writing of
+                # nested arrays and objects in turn.
+                state.nest_level += 1
+                first = True
+                for obj2 in items:
+                    if first:
+                        first = False
+                    else:
+                        state.append( sep )
+                    if isdict:
+                        obj2, obj3 = obj2
+                        self._do_encode( obj2, state )
+                        if state.pending is not None:
+                            for _ in state.run_pending():
+                                yield
+                        state.append( dictcolon )
+                        # Values have always been indented one more level
+                        state.nest_level += 1
+                        self._do_encode( obj3, state )
+                        if state.pending is not None:
+                            for _ in state.run_pending():
+                                yield
+                        state.nest_level -= 1
+                    else:
+                        if obj2 is obj:
+                            raise JSONEncodeError('trying to encode an infinite sequence',obj)
+                        self._do_encode( obj2, state )
+                        if state.pending is not None:
+                            for _ in state.run_pending():
+                                yield
+                    if flush_chunks and len(state.chunks) >= flush_chunks:
+                        yield
+                state.nest_level -= 1
+                state.append( closing )  # final '}' or ']'
+
+            if flush_chunks:
+                state.pending = write_members()
+            else:
+                for _ in write_members():
+                    pass
         else: # Can't create an iterator for the object
             self.try_encode_default( obj, state )
 
@@ -5469,7 +9026,7 @@ class JSON(object):
 
     def try_encode_default( self, obj, state ):
         orig_obj = obj
-        if self.has_hook('encode_default'):
+        if 'encode_default' in self._active_hooks:
             try:
                 obj = self.call_hook( 'encode_default', obj )
             except JSONSkipHook:
@@ -5483,8 +9040,143 @@ class JSON(object):
         raise JSONEncodeError('can not encode object into a JSON representation',obj)
 
 
+class json_session(object):
+    """Decodes and encodes many documents with the same JSON object.
+    Usually obtained with the JSON.prepare() method.
+
+    The decode_state, fast decoder, and output codec are made on first
+    use and then kept for the following calls, so a session must not
+    be used by more than one thread at a time.  They are made afresh
+    if the JSON object's options are changed.
+
+    The caches of the JSON object itself (the object key cache, the
+    string escapers, and the remembered classifications of types) are
+    not guarded by locks either; they are shared with every other user
+    of the same JSON object.
+
+    """
+    def __init__(self, json):
+        self.json = json
+        self.__frozen_options = None
+        self.__decoders = {}  # return_errors -> (decode_state, fast decoder or False)
+        self.__encoders = {}  # encoding -> (codec, escape_unicode_test)
+
+    def __check_options(self):
+        """Forgets everything made for the previous options, if they
+        have been changed since.
+
+        """
+        frozen = self.json.options.freeze()
+        if frozen is not self.__frozen_options:
+            self.__frozen_options = frozen
+            self.__decoders.clear()
+            self.__encoders.clear()
+
+    @property
+    def options(self):
+        """The json_options used by this session."""
+        return self.json.options
+
+    def decode(self, txt, encoding=None, return_errors=False):
+        """Decodes a JSON document, like the JSON.decode() method does
+        but without the 'return_stats', 'lazy', or 'select' arguments.
+
+        """
+        return_errors = bool(return_errors)
+        self.__check_options()
+        try:
+            state, fast_decoder = self.__decoders[ return_errors ]
+        except KeyError:
+            json = self.json
+            state = decode_state( options=self.__frozen_options, collect_stats=False,
+                                  collect_warnings=return_errors )
+            fast_decoder = json._get_fast_decoder( state.options, collect_warnings=return_errors ) or False
+            self.__decoders[ return_errors ] = (state, fast_decoder)
+
+        state.set_input( txt, encoding=encoding )
+        self.json._decode_input( state, return_errors=return_errors, fast_decoder=fast_decoder )
+        obj, errors = state.obj, state.errors
+        state.buf = state.obj = None  # Don't hold on to the document
+
+        if return_errors:
+            return _json_results( obj, errors, None )
+        for err in errors:
+            if err.severity in ('fatal','error'):
+                raise err
+        return obj
+
+    def encode(self, obj, encoding=None):
+        """Encodes a Python object, like the JSON.encode() method."""
+        self.__check_options()
+        try:
+            cdk, escape_unicode_test = self.__encoders[ encoding ]
+        except (KeyError, TypeError):
+            cdk, escape_unicode_test = self.json._prepare_encoding( encoding )
+            if helpers.isstringtype(encoding) or encoding is None:
+                self.__encoders[ encoding ] = (cdk, escape_unicode_test)
+        return self.json._encode_with_codec( obj, cdk, escape_unicode_test )
+
+
 # ------------------------------
 
+# The JSON objects made by the module-level functions, see _json_for()
+_json_instances = _lru_cache( 32 )
+
+def _options_key( options ):
+    """Returns a hashable key for the values of a json_options object,
+    taken from its freeze() snapshot, so that two json_options with
+    the same values have the same key.
+
+    The decimal_context is matched by identity, as decimal.Context
+    objects are not hashable; a JSON object made with a copy of the
+    options keeps that same context alive, so its id can not be reused.
+
+    """
+    frozen = options.freeze()
+    key = [ options.__class__, frozen.strictness, id(frozen.decimal_context) ]
+    for name in frozen.all_behaviors:
+        key.append( getattr(frozen, name) )
+    for name in options._plain_attrs:
+        if name != 'decimal_context':
+            key.append( getattr(frozen, name) )
+    return tuple(key)
+
+def _json_for( kwargs ):
+    """Returns a JSON object made with the given keyword arguments.
+
+    As making one takes longer than encoding or decoding a small
+    document, the module-level functions keep those they make for
+    reuse, when all of the argument values are hashable.  A
+    'json_options' argument is matched by the values of its options
+    rather than by identity, and the JSON object which is kept is
+    given its own copy of them; so changing the options afterwards
+    does not change the kept object.
+
+    The JSON objects which are kept are shared by every thread.  The
+    caches within them, such as the object key cache (see the
+    key_cache_size option), the string escapers, and the remembered
+    classifications of types, are not guarded by locks.
+
+    """
+    try:
+        key = []
+        for kw, val in kwargs.items():
+            if kw == 'json_options':
+                key.append( (kw, type(val), _options_key(val)) )
+            else:
+                key.append( (kw, type(val), val) )
+        key = tuple(sorted( key ))
+        j = _json_instances.get( key )
+    except TypeError:
+        return JSON( **kwargs )  # Unhashable arguments
+    if j is None:
+        if 'json_options' in kwargs:
+            kwargs = kwargs.copy()
+            kwargs['json_options'] = kwargs['json_options'].copy()
+        j = _json_instances[ key ] = JSON( **kwargs )
+    return j
+
+
 def encode( obj, encoding=None, **kwargs ):
     r"""Encodes a Python object into a JSON-encoded string.
 
@@ -5553,7 +9245,7 @@ def encode( obj, encoding=None, **kwargs ):
 
     """
     # Do the JSON encoding
-    j = JSON( **kwargs )
+    j = _json_for( kwargs )
     output = j.encode( obj, encoding )
     return output
 
@@ -5600,6 +9292,22 @@ def decode( txt, encoding=None, **kwargs ):
         tuple returned.  If return_errors is also set then a 3-tuple
         is returned, otherwise a 2-tuple is returned.
 
+    * 'lazy'    (Boolean, default False)
+
+        If True then any arrays and objects are returned as read-only
+        lazy_array and lazy_object proxies, which only decode the
+        parts of the document that are actually used.  See the
+        JSON.decode() method.
+
+    * 'select'    (list of strings, default None)
+
+        A list of JSON Pointers, such as ["/items/*/id", "/meta"], in
+        which "*" matches any key or index.  Only the values they
+        refer to are decoded, and a dictionary mapping the JSON
+        Pointer of each value found to that value is returned.  The
+        rest of the document is checked but not built.  See the
+        JSON.decode() method.
+
     * 'write_errors'    (Boolean OR File-like object, default False)
 
         Controls what to do with errors.
@@ -5668,6 +9376,8 @@ def decode( txt, encoding=None, **kwargs ):
     write_errors = False
     filename_for_errors = None
     write_stats = False
+    lazy = False
+    select = None
 
     kwargs = kwargs.copy()
 
@@ -5688,17 +9398,25 @@ def decode( txt, encoding=None, **kwargs ):
         elif kw == "write_stats":
             write_stats = val
             todel.append(kw)
+        elif kw == "lazy":
+            lazy = bool(val)
+            todel.append(kw)
+        elif kw == "select":
+            select = val
+            todel.append(kw)
     # next keyword argument
     for kw in todel:
         del kwargs[kw]
 
-    j = JSON( **kwargs )
+    j = _json_for( kwargs )
 
     # Now do the actual JSON decoding
     result = j.decode( txt,
                        encoding=encoding,
                        return_errors=(return_errors or write_errors),
-                       return_stats=(return_stats or write_stats) )
+                       return_stats=(return_stats or write_stats),
+                       lazy=lazy,
+                       select=select )
 
     if write_errors:
         import sys
@@ -5719,20 +9437,87 @@ def decode( txt, encoding=None, **kwargs ):
 
 
 
-def encode_to_file( filename, obj, encoding='utf-8', overwrite=False, **kwargs ):
+def iterparse( source, encoding=None, **kwargs ):
+    """Decodes JSON as a stream of (event, path, value) parsing events,
+    without building the whole Python object.
+
+    The source may be a string or a file-like object.  The other
+    arguments are the same as for the decode() function, except that
+    the return_errors and return_stats arguments are not supported.
+
+    See the JSON.iterparse() method for a description of the events.
+
+        for event, path, value in demjson.iterparse( fp ):
+            if event == 'scalar' and path[-1:] == ('id',):
+                ids.append( value )
+
+    """
+    j = _json_for( kwargs )
+    return j.iterparse( source, encoding=encoding )
+
+
+def decode_lines( source, encoding=None, **kwargs ):
+    """Decodes newline-delimited JSON (JSON Lines or NDJSON), yielding
+    the Python object for each line of the source in turn.
+
+    The source may be a string or a file-like object.  The other
+    arguments are the same as for the decode() function, including
+    'return_errors', except that the return_stats, write_errors, and
+    write_stats arguments are not supported.
+
+    See the JSON.decode_lines() method for more details.
+
+    """
+    return_errors = bool( kwargs.pop('return_errors', False) )
+    j = _json_for( kwargs )
+    return j.decode_lines( source, encoding=encoding, return_errors=return_errors )
+
+
+def encode_to_stream( obj, fp, encoding='utf-8', flush_size=65536, **kwargs ):
+    """Encodes a Python object into JSON and writes it to the file-like
+    object 'fp' a piece at a time, without building the whole
+    document in memory first.
+
+    If encoding is None then Unicode strings are written, for a file
+    opened in text mode.  See the encode() function for a description
+    of other possible options, and the JSON.encode_to_stream() method
+    for more details.
+
+    """
+    j = _json_for( kwargs )
+    j.encode_to_stream( obj, fp, encoding=encoding, flush_size=flush_size )
+
+
+def encode_to_file( filename, obj, encoding='utf-8', overwrite=False,
+                    fsync=False, flush_size=65536, compress=False, **kwargs ):
     """Encodes a Python object into JSON and writes into the given file.
 
     If no encoding is given, then UTF-8 will be used.
 
     See the encode() function for a description of other possible options.
 
+    The JSON is streamed into a temporary file in the same directory
+    (see the encode_to_stream() function), which is then renamed to
+    the given file name.  So the file is never seen half-written,
+    and if anything goes wrong any existing file is left as it was.
+
     If the file already exists and the 'overwrite' option is not set
-    to True, then the existing file will not be overwritten.  (Note,
-    there is a subtle race condition in the check so there are
-    possible conditions in which a file may be overwritten)
+    to True, then the existing file will not be overwritten; an
+    IOError with errno EEXIST is raised instead.  The check is made
+    when the finished file is put in place, by linking it to the new
+    name, so it can not be raced.
+
+    If the file name is a symbolic link, the file it points to is the
+    one which is written, just as if the file had been opened and
+    written directly; the link itself is left in place.
+
+    If 'fsync' is True then the file's data, and the directory entry,
+    are flushed to disk before returning.  The 'flush_size' is about
+    how many bytes are written at a time.  If 'compress' is True then
+    the file is written gzip-compressed.
 
     """
-    import os, errno
+    import os, errno, stat, binascii
     if not encoding:
         encoding = 'utf-8'
 
@@ -5740,24 +9525,159 @@ def encode_to_file( filename, obj, encoding='utf-8', overwrite=False, **kwargs )
         raise TypeError("Expected a file name")
 
     if not overwrite and os.path.exists(filename):
+        # Fail early; it is checked again at the end
         raise IOError(errno.EEXIST, "File exists: %r" % filename)
 
-    jsondata = encode( obj, encoding=encoding, **kwargs )
+    j = _json_for( kwargs )
+    # Write through any symbolic link, rather than renaming over it
+    target = os.path.realpath( filename )
+    dirname, basename = os.path.split( target )
 
+    # The temporary file is created the same way open() would create
+    # a new file, so that it gets the same permissions (after the umask).
+    flags = os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        tmpname = os.path.join( dirname, '.%s.%s.tmp' % (basename, binascii.hexlify(os.urandom(6)).decode('ascii')) )
+        try:
+            fd = os.open( tmpname, flags, 0666 )
+        except OSError, err:
+            if err.errno != errno.EEXIST:
+                raise
+        else:
+            break
     try:
-        fp = open(filename, 'wb')
-    except Exception:
-        raise
-    else:
+        # If a file is being replaced, keep its permissions
         try:
-            fp.write( jsondata )
+            mode = stat.S_IMODE( os.stat(target).st_mode )
+        except OSError:
+            pass
+        else:
+            if hasattr(os, 'fchmod'):
+                os.fchmod( fd, mode )
+            else:
+                os.chmod( tmpname, mode )
+
+        fp = os.fdopen( fd, 'wb' )
+        fd = None
+        try:
+            if compress:
+                import gzip
+                gz = gzip.GzipFile( filename=basename, mode='wb', fileobj=fp )
+                try:
+                    j.encode_to_stream( obj, gz, encoding=encoding, flush_size=flush_size )
+                finally:
+                    gz.close()
+            else:
+                j.encode_to_stream( obj, fp, encoding=encoding, flush_size=flush_size )
+            fp.flush()
+            if fsync:
+                os.fsync( fp.fileno() )
         finally:
             fp.close()
 
+        if overwrite:
+            replace = getattr( os, 'replace', None )  # Python 3.3+
+            if replace is None and os.name == 'nt' and os.path.exists(target):
+                os.remove( target )   # os.rename() will not replace it
+            (replace or os.rename)( tmpname, target )
+        else:
+            # A hard link can not replace an existing file, which makes
+            # the no-overwrite check and the rename a single step.
+            try:
+                os.link( tmpname, target )
+            except (AttributeError, OSError), err:
+                if isinstance(err, OSError) and err.errno == errno.EEXIST:
+                    raise IOError(errno.EEXIST, "File exists: %r" % filename)
+                # No hard links here; claim the name, then rename over it
+                try:
+                    os.close( os.open( target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0666 ) )
+                except OSError, err:
+                    if err.errno == errno.EEXIST:
+                        raise IOError(errno.EEXIST, "File exists: %r" % filename)
+                    raise
+                if os.name == 'nt':
+                    os.remove( target )
+                os.rename( tmpname, target )
+            else:
+                os.remove( tmpname )
+        tmpname = None
+
+        if fsync and hasattr(os, 'O_DIRECTORY'):
+            dirfd = os.open( dirname, os.O_RDONLY | os.O_DIRECTORY )
+            try:
+                os.fsync( dirfd )
+            finally:
+                os.close( dirfd )
+    finally:
+        if fd is not None:
+            os.close( fd )
+        if tmpname is not None:
+            try:
+                os.remove( tmpname )
+            except OSError:
+                pass
+
+
+def _decode_mapped_file( fp, encoding=None, **kwargs ):
+    """Tries to decode the open file using the _fast_utf8_decoder,
+    straight from a memory-map of the file.  Takes the same arguments
+    as the decode() function.
+
+    Returns a 2-tuple (success, result).  If success is False then the
+    file must be decoded the usual way instead.
+
+    """
+    import os, mmap
+    if encoding is not None and encoding != 'auto':
+        cdk = helpers.lookup_codec( encoding )
+        if not cdk or cdk.name != 'utf-8':
+            return False, None
+
+    kwargs = kwargs.copy()
+    return_errors = bool( kwargs.pop('return_errors', False) )
+    write_errors = kwargs.pop('write_errors', False)
+    kwargs.pop('filename_for_errors', None)
+    if kwargs.pop('return_stats', False) or kwargs.pop('write_stats', False):
+        return False, None
+
+    if os.fstat( fp.fileno() ).st_size == 0:
+        return False, None  # Can not map an empty file
+    j = _json_for( kwargs )
+    decoder = j._get_fast_decoder( j.options.freeze(), collect_warnings=(return_errors or write_errors),
+                                   decoder_class=_fast_utf8_decoder )
+    if not decoder:
+        return False, None
+
+    if j.options.decimal_context:
+        dec_ctx = decimal.localcontext( j.options.decimal_context )
+    else:
+        dec_ctx = _dummy_context_manager
+    mapped = mmap.mmap( fp.fileno(), 0, access=mmap.ACCESS_READ )
+    try:
+        with dec_ctx:
+            obj, end = decoder.decode( mapped, 0 )
+        if end < len(mapped):
+            return False, None
+    except _fast_decoder_fallback:
+        return False, None
+    finally:
+        mapped.close()
+
+    if return_errors:
+        obj = _namedtuple('json_results',['object','errors','stats'])( obj, [], None )
+    return True, obj
 
-def decode_file( filename, encoding=None, **kwargs ):
+
+def decode_file( filename, encoding=None, mmap=False, **kwargs ):
     """Decodes JSON found in the given file.
 
+    If 'mmap' is True, then the file is memory-mapped and, provided it
+    is strict JSON encoded in UTF-8, is decoded directly from the
+    mapping.  This avoids holding both the file's bytes and its
+    Unicode text in memory at once.  If the file can not be decoded
+    that way, because of its encoding, the options or hooks, or any
+    errors or warnings, it is read and decoded the usual way.
+
     See the decode() function for a description of other possible options.
 
     """
@@ -5768,6 +9688,10 @@ def decode_file( filename, encoding=None, **kwargs ):
             raise
         else:
             try:
+                if mmap:
+                    success, result = _decode_mapped_file( fp, encoding=encoding, **kwargs )
+                    if success:
+                        return result
                 jsondata = fp.read()
             finally:
                 fp.close()
@@ -5813,6 +9737,10 @@ STRICTNESS OPTIONS (WARNINGS AND ERRORS):
  --warn=...         |-- These options let you pick specific behaviors.
  --forbid=...     -/      Use --help-behaviors for more
 
+ --max-errors=nnn    Stop checking a file after this many errors
+ --max-warnings=nnn  Show at most this many different warnings for
+                     a file; repeats of a warning are only counted
+
 STATISTICS OPTIONS:
 
  --stats       Show statistics about JSON document
@@ -6087,6 +10015,7 @@ MORE INFORMATION:
                                          'indent-limit=',
                                          'indent-tab-width=',
                                          'max-items-per-line=',
+                                         'max-errors=', 'max-warnings=',
                                          'allow=', 'warn=', 'forbid=', 'deny=',
                                          'help', 'help-behaviors',
                                          'version','copyright'] )
@@ -6220,6 +10149,12 @@ the options --allow, --warn, or --forbid ; for example:
                 except ValueError:
                     self.stderr.write("Max items per line must be a number\n")
                     return 1
+            elif opt in ('--max-errors', '--max-warnings'):
+                try:
+                    kwoptions[ opt[2:].replace('-','_') ] = int(val)
+                except ValueError:
+                    self.stderr.write("%s must be a number\n" % opt)
+                    return 1
             elif opt == '--sort':
                 val = val.lower()
                 if val == 'alpha':
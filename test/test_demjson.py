@@ -267,6 +267,21 @@ class DemjsonTest(unittest.TestCase):
         self.assertAlmostEqual(demjson.decode('-1.23456e+078'), -1.23456e78)
         self.assertAlmostEqual(demjson.decode('-1.23456e-078'), -1.23456e-78)
 
+    def testDecodeNumberMixedForms(self):
+        """Numbers in the strict form and the other forms give the same
+        values, statistics and warnings when mixed in one document."""
+        r = demjson.decode('[12, -0, 0x1F, 1.5e3, 010, -7, 9007199254740993, 2.5]',
+                           allow_hex_numbers=True, allow_leading_zeros=True,
+                           return_stats=True, return_errors=True)
+        self.assertEqual(r.object, [12, 0, 31, 1500.0, 8, -7, 9007199254740993, 2.5])
+        self.assertTrue(isinstance(r.object[3], float))
+        self.assertEqual(r.stats.num_ints, 6)
+        self.assertEqual(r.stats.num_floats, 2)
+        self.assertEqual(r.stats.num_negative_zero_ints, 1)
+        self.assertEqual(r.stats.num_ints_53bit, 1)
+        self.assertEqual([err.position.char_position for err in r.errors], [5, 31])
+        self.assertEqual(demjson.decode('[1.0, 0o17]', keep_format=True)[1].json_format(), '0o17')
+
     def testDecodeStrictNumber(self):
         """Make sure that strict mode is picky about numbers."""
         for badnum in ['+1', '.5', '1.', '01', '0x1', '1e']:
@@ -553,6 +568,17 @@ class DemjsonTest(unittest.TestCase):
         self.assertEqual(demjson.decode(r'"\n\t\\\"\b\r\f"'), '\n\t\\"\b\r\f')
         self.assertEqual(demjson.decode(r'"\abc def"'), 'abc def')
 
+    def testDecodeStringSpans(self):
+        text = 'abc def ' * 1000
+        self.assertEqual(demjson.decode('"%s"' % text), text)
+        self.assertEqual(demjson.decode(u'"a\u00ad\x7fb\'c\u2028d"'), u'a\u00ad\x7fb\'c\u2028d')
+        self.assertEqual(demjson.decode(u'\'a"b\\\'c\''), u'a"b\'c')
+        self.assertEqual(demjson.decode(u'"%s\\n%s"' % (text, text)), text + '\n' + text)
+        r = demjson.decode('"%s\x01%s\\u12"' % (text, text), return_errors=True, strict=True)
+        self.assertEqual([err.position.char_position for err in r.errors],
+                         [1 + len(text), 2 + 2*len(text)])
+        self.assertEqual(r.errors[1].outer_position.char_position, 0)
+
     def testEncodeString(self):
         self.assertEqual(demjson.encode(''), r'""')
         self.assertEqual(demjson.encode('a'), r'"a"')
@@ -977,6 +1003,618 @@ class DemjsonTest(unittest.TestCase):
                           {55:'fiftyfive'}, strict=True)
         self.assertEqual(demjson.encode({55:55}, strict=False), '{55:55}')
 
+    def testDecodeStrictFastPath(self):
+        # The fast strict-JSON decoder must give exactly the same
+        # results as the full decoder (which is always used when
+        # statistics are asked for).
+        docs = ['[]', '{}', ' [1, -2, 3.5, -0.0, 1e3, 1E-3, 0.30000000000000004]',
+                '{"a": {"b": [true, false, null]}, "": "x"}',
+                '{"a": 1, "a": 2}', '"\\u00e9\\ud834\\udd1e\\n\\/"', '"\\u0000"',
+                '12345678901234567890', '[1, 2,]', '{"a" 1}', '[01]', '"\\x41"', '//c\n[1]']
+        for doc in docs:
+            for kwargs in [{}, {'strict':True}, {'sort_keys':demjson.SORT_PRESERVE}, {'int_as_float':True}]:
+                fast = demjson.decode(doc, return_errors=True, **kwargs)
+                full = demjson.decode(doc, return_errors=True, return_stats=True, **kwargs)
+                self.assertEqual(repr(fast.object), repr(full.object))
+                self.assertEqual([e.pretty_description() for e in fast.errors],
+                                 [e.pretty_description() for e in full.errors])
+        self.assertTrue(demjson._fast_decoder.can_decode_with(demjson.json_options(strict=True)))
+        self.assertFalse(demjson._fast_decoder.can_decode_with(demjson.json_options(strict=False)))
+        # A number which ends the text is decoded without falling back
+        fd = demjson._fast_decoder(demjson.json_options(strict=True).freeze())
+        self.assertEqual(fd.decode(u'123'), (123, 3))
+        self.assertEqual(fd.decode(u'-1.5 '), (-1.5, 5))
+        self.assertRaises(demjson._fast_decoder_fallback, fd.decode, u'1.5.')
+
+    def testIncrementalDecoder(self):
+        stream = '[1, 2]  {"a": "x\\"}y"}\n"str" 12 true\r\n[3,\n4] 5'
+        dec = demjson.JSON().incremental_decoder()
+        values = []
+        for c in stream:
+            values.extend( dec.feed(c) )
+        values.extend( dec.close() )
+        self.assertEqual(values, [[1, 2], {'a': 'x"}y'}, 'str', 12, True, [3, 4], 5])
+
+        dec = demjson.JSON(strict=False).incremental_decoder()
+        self.assertEqual(dec.feed('[1,/*]*/2] // [\n {a:1'), [[1, 2]])
+        self.assertEqual(dec.feed('}'), [{'a': 1}])
+        self.assertEqual(dec.close(), [])
+
+    def testIncrementalDecoderBytes(self):
+        data = u'\ufeff[1]\n{"b":[2,x]}\n [3]\n'.encode('utf-16le')
+        dec = demjson.JSON().incremental_decoder()
+        values = []
+        for i in range(0, len(data), 3):
+            try:
+                values.extend( dec.feed(data[i:i+3]) )
+            except demjson.JSONDecodeError as err:
+                self.assertEqual((err.position.line, err.position.column), (2, 8))
+        values.extend( dec.close() )
+        self.assertEqual(values, [[1], [3]])
+        dec = demjson.JSON().incremental_decoder()
+        self.assertEqual(dec.feed(rawbytes([ord('[')])), [])
+        self.assertRaises(demjson.JSONDecodeError, dec.close)
+
+    def testIncrementalDecoderSplitTokens(self):
+        dec = demjson.JSON(strict=False).incremental_decoder()
+        self.assertEqual(dec.feed('[1,/'), [])
+        self.assertEqual(dec.feed('* ] *'), [])
+        self.assertEqual(dec.feed('/2, "a\\'), [])
+        self.assertEqual(dec.feed('"]"] "b\\'), [[1, 2, 'a"]']])
+        self.assertEqual(dec.feed('\\" /'), ['b\\'])
+        self.assertEqual(dec.feed('/ 3\n4'), [])
+        self.assertEqual(dec.close(), [4])
+        big = '[' + ','.join(['"%d"' % i for i in range(2000)]) + ']'
+        dec = demjson.JSON().incremental_decoder()
+        values = []
+        for i in range(0, len(big), 7):
+            values.extend( dec.feed(big[i:i+7]) )
+        self.assertEqual(values, [[str(i) for i in range(2000)]])
+
+    def testIterparse(self):
+        events = list(demjson.iterparse('{"a": [1, {"b": null}, []], "c": "x"}'))
+        self.assertEqual(events, [
+            ('start_map', (), None),
+            ('map_key', (), 'a'),
+            ('start_array', ('a',), None),
+            ('scalar', ('a', 0), 1),
+            ('start_map', ('a', 1), None),
+            ('map_key', ('a', 1), 'b'),
+            ('scalar', ('a', 1, 'b'), None),
+            ('end_map', ('a', 1), None),
+            ('start_array', ('a', 2), None),
+            ('end_array', ('a', 2), None),
+            ('end_array', ('a',), None),
+            ('map_key', (), 'c'),
+            ('scalar', ('c',), 'x'),
+            ('end_map', (), None) ])
+        events = list(demjson.iterparse('[1,,{a:2}] // done', strict=False))
+        self.assertEqual([(e,p) for e,p,v in events if e == 'scalar'], [('scalar',(0,)), ('scalar',(1,)), ('scalar',(2,'a'))])
+        self.assertTrue(events[2][2] is demjson.undefined)
+
+    def testIterparseFileInPieces(self):
+        import io
+        doc = '[\n' + ',\n'.join(['{"n": %d, "s": "%s"}' % (i, 'x' * 50) for i in range(2000)]) + '\n]'
+        fp = io.BytesIO(doc.encode('utf-16'))
+        events = demjson.iterparse(fp)
+        self.assertEqual(next(events), ('start_array', (), None))
+        self.assertTrue(fp.tell() < len(doc) // 2)
+        events = list(events)
+        self.assertEqual(len(events), 2000 * 6 + 1)
+        self.assertEqual(events[-7:-1], [('start_map', (1999,), None),
+                                         ('map_key', (1999,), 'n'), ('scalar', (1999, 'n'), 1999),
+                                         ('map_key', (1999,), 's'), ('scalar', (1999, 's'), 'x' * 50),
+                                         ('end_map', (1999,), None)])
+        bad = doc.replace('"n": 1321,', '"n": 1321')
+        try:
+            for event in demjson.iterparse(io.BytesIO(bad.encode('ascii'))):
+                pass
+        except demjson.JSONDecodeError as err:
+            self.assertEqual(err.message, 'Values must be separated by a comma')
+            self.assertEqual((err.position.line, err.position.column, err.position.char_position),
+                             (1323, 11, bad.index('"s"', bad.index('1321'))))
+        else:
+            self.fail('Expected a JSONDecodeError')
+
+    def testIterparseErrors(self):
+        events = []
+        try:
+            for event in demjson.iterparse('[1, 2,\n  3 4]', strict=True):
+                events.append(event)
+        except demjson.JSONDecodeError as err:
+            self.assertEqual(err.message, 'Values must be separated by a comma')
+            self.assertEqual((err.position.line, err.position.column), (2, 4))
+        else:
+            self.fail('Expected a JSONDecodeError')
+        self.assertEqual(events[-1], ('scalar', (2,), 3))
+        self.assertRaises(demjson.JSONDecodeError, list, demjson.iterparse('[1,]', strict=True))
+        self.assertRaises(demjson.JSONDecodeError, list, demjson.iterparse('{"a":1} 2'))
+
+    def testDecodeLines(self):
+        self.assertEqual(list(demjson.decode_lines('{"a":1}\n\n[2]\r\n 3\n')), [{'a': 1}, [2], 3])
+        self.assertEqual(list(demjson.decode_lines(b'[1]\n"x"\n')), [[1], 'x'])
+        results = list(demjson.decode_lines('1\n[2,]\n"ok"', strict=True, return_errors=True))
+        self.assertEqual([r.object for r in results], [1, [2], 'ok'])
+        self.assertEqual([len(r.errors) for r in results], [0, 1, 0])
+        self.assertEqual((results[1].errors[0].position.line, results[1].errors[0].position.column), (2, 3))
+
+    def testDecodeLinesFromFile(self):
+        import io
+        fp = io.BytesIO(b'[1]\n{"b": [2\n[3]\n')
+        try:
+            values = []
+            for value in demjson.decode_lines(fp):
+                values.append(value)
+        except demjson.JSONDecodeError as err:
+            self.assertEqual(err.position.line, 2)
+        else:
+            self.fail('Expected a JSONDecodeError')
+        self.assertEqual(values, [[1]])
+
+    def testDecodeLinesEncodedFile(self):
+        import io
+        long_line = u'["' + u'x' * 70000 + u'"]'
+        data = (u'\ufeff{"a": "\u00e9"}\n' + long_line + u'\r\n\n3').encode('utf-16le')
+        values = list(demjson.decode_lines(io.BytesIO(data)))
+        self.assertEqual(values, [{'a': u'\u00e9'}, [u'x' * 70000], 3])
+        data = u'[1]\n[2,]\n'.encode('utf-32')
+        results = list(demjson.decode_lines(io.BytesIO(data), strict=True, return_errors=True))
+        self.assertEqual([r.object for r in results], [[1], [2]])
+        self.assertEqual((results[1].errors[0].position.line, results[1].errors[0].position.column), (2, 3))
+
+    def testDecodeFileMapped(self):
+        import os, tempfile
+        fd, filename = tempfile.mkstemp(suffix='.json')
+        try:
+            for data, expected in [
+                    (b'{"a": [1, -2.5e3, "x\\u00e9\xc3\xa9"], "b": null}\n', {'a': [1, -2500.0, u'x\u00e9\u00e9'], 'b': None}),
+                    (b'\xef\xbb\xbf[1, 2]', [1, 2]),
+                    (b'[\x00"\x00x\x00"\x00]\x00', [u'x']),
+                    (b'[]', []),
+                    (b'[1, 2,]', [1, 2])]:
+                os.write(fd, data)
+                os.ftruncate(fd, len(data))
+                os.lseek(fd, 0, 0)
+                self.assertEqual(demjson.decode_file(filename, mmap=True), expected)
+                self.assertEqual(demjson.decode_file(filename, mmap=True, return_errors=True).object, expected)
+            self.assertRaises(demjson.JSONDecodeError, demjson.decode_file, filename, mmap=True, strict=True)
+        finally:
+            os.close(fd)
+            os.remove(filename)
+
+    def testDecodeLazy(self):
+        d = demjson.decode('{"a": [1, {"b": "x\\"]"}, [2, 3]], "c": 5, "e": {}}', lazy=True)
+        self.assertTrue(isinstance(d, demjson.lazy_object))
+        self.assertEqual(list(d), ['a', 'c', 'e'])
+        self.assertEqual(d['c'], 5)
+        self.assertTrue('a' in d)
+        self.assertFalse('z' in d)
+        self.assertRaises(KeyError, lambda: d['z'])
+        a = d['a']
+        self.assertTrue(isinstance(a, demjson.lazy_array))
+        self.assertEqual(len(a), 3)
+        self.assertEqual(a[1]['b'], 'x"]')
+        self.assertEqual(a[-1], [2, 3])
+        self.assertEqual(a[0:2:2], [1])
+        self.assertEqual(dict(d['e']), {})
+        self.assertEqual(d, {'a': [1, {'b': 'x"]'}, [2, 3]], 'c': 5, 'e': {}})
+        d = demjson.decode('[1, /* ] */ [2,,3]]', lazy=True, strict=False)
+        self.assertEqual(d[1][1], demjson.undefined)
+        self.assertEqual(demjson.decode(' "s" ', lazy=True), 's')
+
+    def testDecodeLazyErrors(self):
+        d = demjson.decode('{"a": [1 2], "b": 2}', lazy=True)
+        self.assertEqual(d['b'], 2)
+        try:
+            d['a'][0]
+        except demjson.JSONDecodeError as err:
+            self.assertEqual(err.message, 'Values must be separated by a comma')
+            self.assertEqual(err.position.char_position, 9)
+        else:
+            self.fail('Expected a JSONDecodeError')
+        self.assertRaises(demjson.JSONDecodeError, demjson.decode, '[1] 2', lazy=True)
+        self.assertRaises(demjson.JSONDecodeError, lambda: len(demjson.decode('[1, 2', lazy=True)))
+        self.assertRaises(ValueError, demjson.decode, '[1]', lazy=True, return_stats=True)
+        # The options are those in effect when decode() was called
+        j = demjson.JSON(strict=False)
+        d = j.decode('[[1,,2], {a: 1}]', lazy=True)
+        j.options.strictness = True
+        self.assertEqual(d[0][1], demjson.undefined)
+        self.assertEqual(dict(d[1]), {'a': 1})
+
+    def testStructuralIndex(self):
+        text = '{"a": [1, 2, {"b": "x,]"}], "c": [], "d": [1,,2,]}'
+        ix = demjson.structural_index(text)
+        self.assertEqual(ix.count_elements(0), 3)
+        self.assertEqual(ix.value_end(0), len(text))
+        i = text.index('[')
+        self.assertEqual(ix.count_elements(i), 3)
+        self.assertEqual(text[i:ix.value_end(i)], '[1, 2, {"b": "x,]"}]')
+        self.assertEqual(ix.partner(i), text.index(']', text.index('}')))
+        self.assertEqual(ix.count_elements(text.index('[]')), 0)
+        self.assertEqual(ix.count_elements(text.index('[1,,')), 3)
+        self.assertEqual(ix.value_end(text.index('"x')), text.index('"}') + 1)
+        self.assertEqual(ix.value_end(text.index('2,')), text.index('2,') + 1)
+        self.assertEqual(ix.find(2), -1)
+        self.assertRaises(ValueError, ix.count_elements, 1)
+        self.assertRaises(ValueError, ix.count_elements, 2)
+        self.assertEqual(list(ix.offsets)[:4], [0, 1, 3, 4])
+        ix = demjson.structural_index('[1, /* ] */ 2, "/*"]')
+        self.assertEqual(ix.count_elements(0), 3)
+        ix = demjson.structural_index('[1, /* ] */ 2]', demjson.JSON(strict=True))
+        self.assertEqual(ix.value_end(0), 8)  # Comments are not recognized
+
+    def testDecodeSelect(self):
+        doc = '{"items": [{"id": 1, "tags": ["a"]}, {"id": 2}, 3], "meta": {"n": 2}, "x/y": 0}'
+        for strict in (False, True):
+            d = demjson.decode(doc, select=['/items/*/id', '/meta'], strict=strict)
+            self.assertEqual(dict(d), {'/items/0/id': 1, '/items/1/id': 2, '/meta': {'n': 2}})
+        d = demjson.decode(doc, select=['/x~1y', '/items/0', '/items/0/tags/0', '/nothing'])
+        self.assertEqual(dict(d), {'/x~1y': 0, '/items/0': {'id': 1, 'tags': ['a']}, '/items/0/tags/0': 'a'})
+        self.assertEqual(dict(demjson.decode('[1, 2]', select=['', '/1'])), {'': [1, 2], '/1': 2})
+        self.assertEqual(dict(demjson.decode('{"a": 1, "a": 2}', select='/a')), {'/a': 2})
+        self.assertRaises(ValueError, demjson.decode, '[]', select=['items'])
+        self.assertRaises(ValueError, demjson.decode, '[]', select=['/0'], lazy=True)
+
+    def testDecodeSelectErrors(self):
+        # The parts which are not selected are still checked
+        self.assertRaises(demjson.JSONDecodeError, demjson.decode, '{"a": [1, 2,], "b": 1}',
+                          select=['/b'], strict=True)
+        self.assertRaises(demjson.JSONDecodeError, demjson.decode, '{"a": [0x10], "b": 1}',
+                          select=['/b'], strict=True)
+        r = demjson.decode('{"a": {"c": 1, "c": 2}, "b": 1}', select=['/b'], return_errors=True)
+        self.assertEqual(dict(r.object), {'/b': 1})
+        self.assertEqual([(err.severity, err.position.char_position) for err in r.errors], [('warning', 15)])
+        r = demjson.decode('{"a": [0x10, 1], "b": 1}', select=['/b'], return_errors=True)
+        self.assertEqual(dict(r.object), {'/b': 1})
+        self.assertEqual(r.errors[0].message, 'Hexadecimal literals are not allowed in strict JSON')
+
+    def testDecodeKeyCache(self):
+        doc = '[{"name": 1, "v\\u00e9": 2}, {"name": 3, "v\\u00e9": 4}]'
+        for kwargs in ({}, {'strict': True}, {'allow_comments': True}):
+            a, b = demjson.decode(doc, **kwargs)
+            self.assertEqual(b, {'name': 3, u'v\u00e9': 4})
+            for k in a:
+                self.assertTrue(k is [k2 for k2 in b if k2 == k][0])
+        j = demjson.JSON(key_cache_size=10)
+        a = j.decode(doc)[0]
+        b = j.decode(doc)[1]
+        self.assertTrue([k for k in a if k == 'name'][0] is [k for k in b if k == 'name'][0])
+        a, b = demjson.decode(doc, key_cache_size=0)
+        self.assertEqual(a, {'name': 1, u'v\u00e9': 2})
+        # Keys still cause the same warnings when they come from the cache
+        r = demjson.decode('[{"":1},{"":2}]', return_errors=True)
+        self.assertEqual([err.position.char_position for err in r.errors], [2, 9])
+        # Also when the key was cached by a decode which made no checks
+        doc = u'{"\U0001F600": 1}'
+        j = demjson.JSON(key_cache_size=100, allow_comments=True)
+        j.decode(doc)
+        errors = j.decode(u'/**/' + doc, return_errors=True).errors
+        self.assertEqual(len(errors), 1)
+        self.assertTrue('non-BMP' in errors[0].message)
+
+    def testDecodeDeepNesting(self):
+        """Nesting deeper than Python's recursion limit."""
+        import sys
+        n = sys.getrecursionlimit() * 3
+        r = demjson.decode('[' * n + ']' * n, return_stats=True)
+        self.assertEqual(r.stats.max_depth, n)
+        self.assertEqual(r.stats.num_arrays, n)
+        inner = r.object
+        for i in range(n - 1):
+            inner = inner[0]
+        self.assertEqual(inner, [])
+        r = demjson.decode('{"a":' * n + '[1,]' + '}' * (n - 1), return_errors=True)
+        self.assertEqual([err.message for err in r.errors],
+                         ['Arrays or objects nested deeper than 64 levels may not be portable',
+                          'Strict JSON does not allow a final comma in an array (list) literal',
+                          'Object literal (dictionary) is not terminated'])
+        self.assertEqual(r.errors[2].outer_position.char_position, 0)
+
+    def testDecodeMaxDepth(self):
+        self.assertEqual(demjson.decode('[[{"a":[]}]]', max_depth=4), [[{'a': []}]])
+        for doc in ['[[{"a":[]}]]', '[[{"a":[1,2]}]]']:
+            for kwargs in [{}, {'return_stats': True}, {'select': '/0/0/a'}]:
+                try:
+                    demjson.decode(doc, max_depth=3, **kwargs)
+                except demjson.JSONDecodeError as err:
+                    self.assertEqual(err.severity, 'fatal')
+                    self.assertEqual(err.position.char_position, 7)
+                else:
+                    self.fail('Expected max_depth to be exceeded')
+        self.assertRaises(demjson.JSONDecodeError, list,
+                          demjson.JSON(max_depth=1).iterparse('[[]]'))
+        # Lazily decoded proxies are checked as they are made
+        d = demjson.decode('[[{"a":[]}], 2, 3]', max_depth=3, lazy=True)
+        self.assertEqual(d[1], 2)
+        for i in range(2):
+            try:
+                d[0][0]['a']
+            except demjson.JSONDecodeError as err:
+                self.assertEqual(err.severity, 'fatal')
+                self.assertEqual(err.position.char_position, 7)
+            else:
+                self.fail('Expected max_depth to be exceeded')
+        self.assertEqual(d[1], 2)  # Already decoded
+        self.assertRaises(demjson.JSONDecodeError, lambda: d[2])
+        self.assertEqual(demjson.decode('[[{"a":[]}]]', max_depth=4, lazy=True)[0][0]['a'], [])
+        self.assertRaises(demjson.JSONDecodeError, demjson.decode, '[1]', max_depth=0, lazy=True)
+
+    def testDecodeNonPortableWithoutStats(self):
+        """The non-portable warnings do not depend on gathering statistics."""
+        doc = '[-0, 9007199254740993, -0.0, 0.30000000000000004441, -0, 1.23456789012345678901, /*c*/ "%s"]' % ('x' * 20)
+        j = demjson.JSON()
+        j.options.warn_string_length = 10
+        r1 = j.decode(doc, return_errors=True)
+        r2 = j.decode(doc, return_errors=True, return_stats=True)
+        self.assertEqual(r1.stats, None)
+        self.assertEqual(r2.stats.num_negative_zero_ints, 2)
+        self.assertEqual([err.message for err in r1.errors],
+                         ['Negative zero (-0) integers are usually not portable',
+                          'Integers larger than 53-bits are not portable',
+                          'Negative zero (-0.0) numbers may not be portable',
+                          'Floats larger or more precise than an IEEE "double" may not be portable',
+                          'Comments are not allowed in strict JSON',
+                          'Strings longer than 10 may not be portable'])
+        self.assertEqual([err.pretty_description() for err in r1.errors],
+                         [err.pretty_description() for err in r2.errors])
+        self.assertRaises(demjson.JSONDecodeError, demjson.decode, doc, allow_non_portable=False)
+
+    def testUtf32CodecLargeText(self):
+        """The utf32 codec agrees with Python's own on large texts."""
+        text = u''.join([u'abc \u00e9\u4e2d', demjson.helpers.safe_unichr(0x1F600), u' "x": 12,']) * 20000
+        for enc, be in (('utf-32be', True), ('utf-32le', False)):
+            cdk = demjson.utf32.lookup(enc)
+            data = text.encode(enc)
+            self.assertEqual(cdk.encode(text), (data, len(text)))
+            self.assertEqual(cdk.decode(data), (text, len(data)))
+        data, n = demjson.utf32.encode(text, endianness='B')
+        self.assertEqual(data[:4], demjson.utf32.BOM_UTF32_BE)
+        self.assertEqual(demjson.utf32.decode(data), (text, len(data)))
+        # Surrogates and code points beyond U+10FFFF are still refused
+        bad = text[:1000] + u'\udc00' + text[1000:]
+        self.assertRaises(UnicodeEncodeError, demjson.utf32.utf32le_encode, bad)
+        self.assertEqual(demjson.utf32.utf32le_encode(bad, errors='replace')[0],
+                         bad.replace(u'\udc00', u'\ufffd').encode('utf-32le'))
+        for word in (rawbytes([0, 0, 0xD8, 0]), rawbytes([0, 0, 0x11, 0]), rawbytes([0, 0, 0, 1])):
+            data = text[:1000].encode('utf-32le') + word
+            try:
+                demjson.utf32.utf32le_decode(data)
+            except UnicodeDecodeError as err:
+                self.assertEqual((err.start, err.end), (len(data) - 4, len(data)))
+            else:
+                self.fail('Expected UnicodeDecodeError')
+
+    def testDecodeMaxErrorsAndWarnings(self):
+        """The max_errors and max_warnings options bound the error list."""
+        doc = "[1, 'a', 'b', 'c', /*x*/ 0x10, 'd', 0x11, 'e', 0x12]"
+        r = demjson.decode(doc, return_errors=True, max_warnings=2)
+        self.assertEqual([(err.severity, err.message) for err in r.errors],
+                         [('warning', 'String literals must use double quotation marks in strict JSON (repeated 4 more times)'),
+                          ('warning', 'Comments are not allowed in strict JSON'),
+                          ('info', '7 more warnings were suppressed (the maximum is 2)')])
+        self.assertEqual(r.object, [1, 'a', 'b', 'c', 16, 'd', 17, 'e', 18])
+        r = demjson.decode(doc, return_errors=True, strict=True, max_errors=2)
+        self.assertEqual([err.severity for err in r.errors], ['error', 'error', 'fatal'])
+        self.assertEqual(r.errors[-1].message, 'Aborting, there are more than 2 errors')
+        self.assertEqual(r.errors[-1].position.char_position, 14)
+        self.assertEqual(len(demjson.decode(doc, return_errors=True, strict=True).errors), 9)
+
+    def testSession(self):
+        """A prepared session decodes and encodes like its JSON object did."""
+        j = demjson.JSON(strict=True, decode_array=tuple)
+        session = j.prepare()
+        j.clear_all_hooks()
+        j.options.strictness = demjson.STRICTNESS_TOLERANT
+        for i in range(3):
+            self.assertEqual(session.decode('{"a":[1,2.5,"x"]}'), {'a': (1, 2.5, 'x')})
+            self.assertEqual(session.decode(rawbytes([0x5b, 0x31, 0x5d]), encoding='ascii'), (1,))
+            self.assertRaises(demjson.JSONDecodeError, session.decode, "['x']")
+            r = session.decode("[1, 'x']", return_errors=True)
+            self.assertEqual(len(r.errors), 1)
+            self.assertEqual(session.encode({'a': [1, u'\u00e9']}), '{"a":[1,"\\u00e9"]}')
+            self.assertEqual(session.encode(u'\u00e9', encoding='ascii'),
+                             rawbytes([ord(c) for c in '"\\u00e9"']))
+        self.assertEqual(j.decode("['x']"), ['x'])
+        # The module-level functions reuse their JSON objects
+        self.assertTrue(demjson._json_for({'strict': True}) is demjson._json_for({'strict': True}))
+        self.assertFalse(demjson._json_for({'compactly': True}) is demjson._json_for({'compactly': 1}))
+        # Equal json_options share a JSON object, which has its own copy of them
+        opts1 = demjson.json_options(strict=True)
+        opts2 = demjson.json_options(strict=True)
+        j1 = demjson._json_for({'json_options': opts1})
+        self.assertTrue(j1 is demjson._json_for({'json_options': opts2}))
+        self.assertFalse(j1.options is opts1)
+        opts1.allow_comments()
+        self.assertFalse(j1 is demjson._json_for({'json_options': opts1}))
+        self.assertRaises(demjson.JSONDecodeError, demjson.decode, '[1]//c', json_options=opts2)
+        self.assertEqual(demjson.decode('[1]//c', json_options=opts1), [1])
+
+    def testFrozenOptions(self):
+        """A frozen snapshot of the options is kept until they change."""
+        opts = demjson.json_options(sort_keys='preserve', html_safe=True)
+        frozen = opts.freeze()
+        self.assertTrue(opts.freeze() is frozen)
+        self.assertEqual(frozen.sort_keys, demjson.SORT_PRESERVE)
+        self.assertTrue(frozen.is_warn_comments)
+        self.assertEqual(frozen.comments, demjson.WARN)
+        self.assertEqual(frozen.always_escape_chars, frozenset(u'<>/&'))
+        self.assertEqual(frozen.get_behavior('comments'), demjson.WARN)
+        self.assertRaises(AttributeError, setattr, frozen, 'comments', demjson.ALLOW)
+        opts.forbid_comments()
+        self.assertFalse(opts.freeze() is frozen)
+        self.assertTrue(opts.freeze().is_forbid_comments)
+        self.assertTrue(frozen.is_warn_comments)
+        self.assertTrue(frozen.copy().is_warn_comments)
+        # Changed options take effect on the next call, also for sessions
+        j = demjson.JSON()
+        session = j.prepare()
+        self.assertEqual(j.decode('[1 /*x*/]'), [1])
+        self.assertEqual(session.decode('[1 /*x*/]'), [1])
+        j.options.forbid_comments()
+        session.options.forbid_comments()
+        self.assertRaises(demjson.JSONDecodeError, j.decode, '[1 /*x*/]')
+        self.assertRaises(demjson.JSONDecodeError, session.decode, '[1 /*x*/]')
+
+    def testEncodeNestedLayout(self):
+        """Nested and iterator members are written in order with the right layout."""
+        obj = 'x'
+        for i in range(200):
+            obj = [obj, {'k': i}]
+        self.assertEqual(demjson.encode(obj, compactly=True),
+                         '[' * 200 + '"x"' + ''.join(',{"k":%d}]' % i for i in range(200)))
+        data = {'b': [1, 2, 3], 'a': {'c': (4, 5)}}
+        for maxitems in (1, 2, 3):
+            expected = demjson.encode(data, compactly=False, max_items_per_line=maxitems)
+            self.assertEqual(demjson.encode({'b': iter([1, 2, 3]), 'a': {'c': (x for x in (4, 5))}},
+                                            compactly=False, max_items_per_line=maxitems),
+                             expected)
+        self.assertEqual(demjson.encode(data, compactly=False, max_items_per_line=2),
+                         '{ "a" : { "c" : [ 4, 5 ] }, "b" : [ \n      1,\n      2,\n      3\n    ] }\n')
+
+    def testIterencodeAndStream(self):
+        """Encoding a piece at a time gives the same output as encode()."""
+        import io
+        doc = {'rows': [{'id': i, 'name': u'r\u00e9%d' % i, 'tags': ['a', 'b']} for i in range(50)],
+               'more': [[1, 2], [3, [4, 5]]]}
+        j = demjson.JSON(compactly=False)
+        for encoding in (None, 'utf-8', 'utf-16', 'ascii'):
+            pieces = list(j.iterencode(doc, encoding=encoding, chunk_size=10))
+            self.assertTrue(len(pieces) > 10)
+            self.assertEqual(pieces[0][:0].join(pieces), j.encode(doc, encoding=encoding))
+        # Generators are consumed only as they are written out
+        consumed = []
+        def rows():
+            for i in range(100):
+                consumed.append(i)
+                yield [i]
+        pieces = demjson.JSON().iterencode(rows(), chunk_size=5)
+        first = pieces.next()
+        self.assertTrue(first.startswith(u'[[0'))
+        self.assertTrue(len(consumed) < 5)
+        self.assertEqual(first + u''.join(pieces), demjson.encode([[i] for i in range(100)]))
+        fp = io.BytesIO()
+        demjson.encode_to_stream(doc, fp, encoding='utf-16', flush_size=100, compactly=False)
+        self.assertEqual(fp.getvalue(), j.encode(doc, encoding='utf-16'))
+
+    def testEncodeToFileAtomic(self):
+        import os, errno, gzip, shutil, tempfile
+        dirname = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dirname, 'out.json')
+            demjson.encode_to_file(filename, {'a': [1, 2]}, fsync=True)
+            self.assertEqual(demjson.decode_file(filename), {'a': [1, 2]})
+            try:
+                demjson.encode_to_file(filename, [3])
+            except IOError as err:
+                self.assertEqual(err.errno, errno.EEXIST)
+            else:
+                self.fail('Expected an IOError')
+            # A failed encoding leaves the old file alone
+            self.assertRaises(demjson.JSONEncodeError, demjson.encode_to_file,
+                              filename, [1, object()], overwrite=True)
+            self.assertEqual(demjson.decode_file(filename), {'a': [1, 2]})
+            demjson.encode_to_file(filename, (x for x in range(1000)), overwrite=True,
+                                   flush_size=100, compress=True)
+            fp = gzip.open(filename, 'rb')
+            try:
+                self.assertEqual(demjson.decode(fp.read()), list(range(1000)))
+            finally:
+                fp.close()
+            self.assertEqual(os.listdir(dirname), ['out.json'])
+            if hasattr(os, 'symlink') and hasattr(os, 'umask'):
+                # A new file gets the usual permissions, and a replaced
+                # file keeps its own
+                umask = os.umask(0o022)
+                try:
+                    newname = os.path.join(dirname, 'new.json')
+                    demjson.encode_to_file(newname, [1])
+                    self.assertEqual(os.stat(newname).st_mode & 0o777, 0o644)
+                finally:
+                    os.umask(umask)
+                os.chmod(newname, 0o600)
+                demjson.encode_to_file(newname, [2], overwrite=True)
+                self.assertEqual(os.stat(newname).st_mode & 0o777, 0o600)
+                # Writing to a symbolic link writes the file it points to
+                linkname = os.path.join(dirname, 'link.json')
+                os.symlink(newname, linkname)
+                demjson.encode_to_file(linkname, [3], overwrite=True)
+                self.assertTrue(os.path.islink(linkname))
+                self.assertEqual(demjson.decode_file(newname), [3])
+                self.assertEqual(sorted(os.listdir(dirname)), ['link.json', 'new.json', 'out.json'])
+        finally:
+            shutil.rmtree(dirname)
+
+    def testEncodeStringEscapes(self):
+        s = u'a"\\/<&>\x00\x7f\u00e9\u0100\u2028\u200b\u4e2d\U0001F600'
+        self.assertEqual(demjson.encode(s),
+                         u'"a\\"\\\\/<&>\\u0000\\u007f\\u00e9\\u0100\\u2028\\u200b\\u4e2d\\ud83d\\ude00"')
+        self.assertEqual(demjson.encode(s, encoding='utf-8').decode('utf-8'),
+                         u'"a\\"\\\\/<&>\\u0000\\u007f\u00e9\u0100\\u2028\\u200b\u4e2d\U0001F600"')
+        self.assertEqual(demjson.encode(s, encoding='latin-1').decode('latin-1'),
+                         u'"a\\"\\\\/<&>\\u0000\\u007f\u00e9\\u0100\\u2028\\u200b\\u4e2d\\ud83d\\ude00"')
+        self.assertEqual(demjson.encode(s, encoding='ascii', html_safe=True),
+                         b'"a\\"\\\\\\/\\u003c\\u0026\\u003e\\u0000\\u007f\\u00e9\\u0100\\u2028\\u200b\\u4e2d\\ud83d\\ude00"')
+        # User-supplied escape tests still see every character
+        self.assertEqual(demjson.encode(s, encoding='utf-8', escape_unicode=lambda c: c == u'\u4e2d').decode('utf-8'),
+                         u'"a\\"\\\\/<&>\\u0000\\u007f\u00e9\u0100\\u2028\\u200b\\u4e2d\U0001F600"')
+        # Surrogates are still refused
+        if sys.maxunicode > 0xFFFF:
+            self.assertRaises(demjson.JSONEncodeError, demjson.encode, u'x\ud800y')
+
+    def testEncodeStringEscaperTable(self):
+        """The string escaper's table stays bounded, and other codecs use it too."""
+        s = u'a\u00e9\u20ac\u0152\u4e2d\u2028"'
+        self.assertEqual(demjson.encode(s, encoding='cp1252').decode('cp1252'),
+                         u'"a\u00e9\u20ac\u0152\\u4e2d\\u2028\\""')
+        self.assertEqual(demjson.encode(s, encoding='cp1252', always_escape_chars=u'\u20ac').decode('cp1252'),
+                         u'"a\u00e9\\u20ac\u0152\\u4e2d\\u2028\\""')
+        j = demjson.JSON()
+        j.encode(s, encoding='cp1252')
+        self.assertEqual(len(j._string_escapers), 1)
+        text = u''.join([unichr(i) for i in range(0x4e00, 0x9fa0)])
+        self.assertEqual(j.encode([text, text], encoding='utf-8').decode('utf-8'),
+                         u'["%s","%s"]' % (text, text))
+        for escaper in j._string_escapers.values():
+            self.assertTrue(len(escaper) <= escaper.max_table_size)
+        if not is_python3:
+            # As before, strings which are entirely escaped give byte strings
+            self.assertEqual(type(demjson.encode({u'\u00e9': [u'\u4e2d' * 3]})), str)
+            self.assertEqual(type(demjson.encode([u'', u'\n'])), str)
+            self.assertEqual(type(demjson.encode(u'a\u00e9')), unicode)
+
+    def testEncodeTypeClassificationCache(self):
+        """Remembered type classifications still honor each object."""
+        class bag(object):
+            pass
+        plain = bag()
+        dictlike = bag()
+        dictlike.keys = lambda: ['a']
+        dictlike.__getitem__ = lambda key: 1
+        equiv = bag()
+        equiv.json_equivalent = lambda: [2]
+        j = demjson.JSON(compactly=True)
+        self.assertEqual(j.encode([1, u'x', None]), '[1,"x",null]')
+        self.assertEqual(j._classify_for_encoding(dictlike), 'dict')
+        self.assertEqual(j._classify_for_encoding(plain), 'other')
+        self.assertEqual(j._classify_for_encoding(dictlike), 'dict')
+        self.assertRaises(demjson.JSONEncodeError, j.encode, plain)
+        self.assertEqual(j.encode([equiv, equiv]), '[[2],[2]]')
+        self.assertRaises(demjson.JSONEncodeError, j.encode, [equiv, plain])
+        # Namedtuples are classified by the current options
+        Point = collections.namedtuple('Point', ['x', 'y'])
+        self.assertEqual(j.encode(Point(1, 2)), '{"x":1,"y":2}')
+        j.options.encode_namedtuple_as_object = lambda nt: nt.x > 1
+        self.assertEqual(j.encode([Point(1, 2), Point(3, 4)]), '[[1,2],{"x":3,"y":4}]')
+        # Registering with an abstract base class forgets them
+        self.assertTrue(j._type_classes)
+        import abc
+        class base(object):
+            __metaclass__ = abc.ABCMeta
+        base.register(bag)
+        j.encode(1)
+        self.assertEqual(list(j._type_classes.keys()), [int])
+
     def testDecodeWhitespace(self):
         self.assertEqual(demjson.decode(' []'), [])
         self.assertEqual(demjson.decode('[] '), [])
@@ -1018,6 +1656,50 @@ class DemjsonTest(unittest.TestCase):
         self.assertRaises(demjson.JSONDecodeError, demjson.decode, \
                           '/*hi/*x*/42', allow_comments=True)
 
+    def testBufferedStreamScanning(self):
+        buf = demjson.buffered_stream(u'  \t\u3000 abc_$1 0x1Fg 123e+5,')
+        self.assertEqual(buf.skipws(), 5)
+        self.assertEqual(buf.pop_identifier(), u'abc_$1')
+        self.assertEqual(buf.skipwhile(demjson.helpers.char_is_json_ws), 1)
+        self.assertEqual(buf.popstr(2), u'0x')
+        self.assertEqual(buf.popwhile(demjson.helpers.is_hex_digit, maxchars=1), u'1')
+        self.assertEqual(buf.popwhile(demjson.helpers.is_hex_digit), u'F')
+        self.assertEqual(buf.popuntil(lambda c: c.isdigit()), u'g ')
+        self.assertEqual(buf.pop_while_in(set('0123456789eE+-')), u'123e+5')
+        self.assertEqual(buf.pop_while_in('0123456789'), None)
+        self.assertEqual(buf.cpos, 24)
+        self.assertEqual(buf.pop(), u',')
+        self.assertTrue(buf.at_end)
+
+    def testPositionTracking(self):
+        buf = demjson.buffered_stream(u'ab\r\ncd\n\n  e f\rgh\r\n')
+        buf.skipuntil(lambda c: c == 'e')
+        self.assertEqual((buf.position.line, buf.position.column, buf.cpos), (4, 2, 10))
+        buf.skip_to_next_line()
+        self.assertEqual((buf.position.line, buf.position.column, buf.cpos), (5, 0, 14))
+        buf.popstr(3)
+        self.assertEqual((buf.position.line, buf.position.column, buf.cpos), (6, 0, 17))
+        buf.pop()
+        self.assertEqual((buf.position.line, buf.position.column, buf.cpos), (6, 0, 18))
+        pos = demjson.position_marker()
+        pos.advance(u'a\r')
+        pos.advance(u'\nb')
+        self.assertEqual((pos.line, pos.column, pos.char_position), (2, 1, 4))
+
+    def testLazyPositions(self):
+        idx = demjson.line_index(u'ab\r\ncd\ne f')
+        self.assertEqual(idx.line_and_column(0), (1, 0))
+        self.assertEqual(idx.line_and_column(3), (2, 0))
+        self.assertEqual(idx.line_and_column(5), (2, 1))
+        self.assertEqual(idx.line_and_column(7), (3, 0))
+        self.assertEqual(idx.line_and_column(9), (3, 2))
+        pos = demjson.position_marker(4, line_index=idx)
+        self.assertEqual((pos.line, pos.column), (2, 0))
+        pos.advance(u'cd\n')
+        self.assertEqual((pos.line, pos.column, pos.char_position), (3, 0, 7))
+        r = demjson.decode(u'[1,\r\n 2,\r\n  bogus]', return_errors=True)
+        self.assertEqual((r.errors[0].position.line, r.errors[0].position.column), (3, 2))
+
     def testNamedTuples(self):
         import collections
         point = collections.namedtuple('point',['x','y'])
@@ -1105,6 +1787,56 @@ class DemjsonTest(unittest.TestCase):
                          {'one':['two','three',{'four':5}]} )
 
 
+    def testSetAndClearHooks(self):
+        """Hooks take effect, and stop, as they are set and cleared."""
+        j = demjson.JSON(decode_array=tuple)
+        self.assertTrue(j.has_hook('decode_array'))
+        self.assertFalse(j.has_hook('decode_object'))
+        self.assertFalse(j.has_hook(None))
+        self.assertEqual(j.decode('[1,[2]]'), (1, (2,)))
+        j.set_hook('decode_object', lambda d: sorted(d.items()))
+        j.set_hook('encode_value', lambda v: v * 2 if isinstance(v, int) else v)
+        self.assertEqual(j.decode('{"a":[1]}'), [('a', (1,))])
+        self.assertEqual(j.encode([1, 2]), '[2,4]')
+        j.clear_hook('decode_array')
+        self.assertEqual(j.decode('{"a":[1]}'), [('a', [1])])
+        j.clear_all_hooks()
+        self.assertEqual(j.decode('{"a":[1]}'), {'a': [1]})
+        self.assertEqual(j.encode([1, 2]), '[1,2]')
+        self.assertRaises(ValueError, j.set_hook, 'decode_nothing', tuple)
+        self.assertRaises(ValueError, j.set_hook, 'decode_array', 42)
+        self.assertRaises(AttributeError, j.call_hook, 'decode_nothing', [])
+        self.assertRaises(TypeError, j.call_hook, 'decode_array', [])
+        # Errors inside hooks are still wrapped
+        j.set_hook('decode_string', lambda s: 1 // 0)
+        j.set_hook('encode_dict', lambda d: 1 // 0)
+        self.assertRaises(demjson.JSONDecodeHookError, j.decode, '["a"]')
+        self.assertRaises(demjson.JSONEncodeHookError, j.encode, {'a': 1})
+
+    def testHookAttributes(self):
+        """The xxx_hook attributes read and set the same hooks as set_hook()."""
+        j = demjson.JSON()
+        self.assertEqual(j.decode_array_hook, None)
+        j.decode_array_hook = tuple
+        self.assertTrue(j.has_hook('decode_array'))
+        self.assertEqual(j.decode('[1,[2]]'), (1, (2,)))
+        j.set_hook('decode_object', sorted)
+        self.assertTrue(j.decode_object_hook is sorted)
+        j.clear_hook('decode_array')
+        self.assertEqual(j.decode_array_hook, None)
+        self.assertEqual(j.decode('[1,[2]]'), [1, [2]])
+        j.encode_value_hook = lambda v: v * 2 if isinstance(v, int) else v
+        self.assertEqual(j.encode([1, 2]), '[2,4]')
+        del j.encode_value_hook
+        self.assertEqual(j.encode([1, 2]), '[1,2]')
+        try:
+            j.decode_string_hook = 42
+        except ValueError:
+            pass
+        else:
+            self.fail("Expected ValueError when setting a hook to a non-callable")
+        self.assertFalse(j.has_hook('decode_string'))
+
     def testEncodeDictKey(self):
         d1 = {42: "forty-two", "a":"Alpha"}
         d2 = {complex(0,42): "imaginary-forty-two", "a":"Alpha"}
@@ -1449,6 +2181,13 @@ class DemjsonTest(unittest.TestCase):
         self.assertEqual( self.decode_stats( u'"\U0010ffff"' ).min_codepoint, (0x10ffff if is_wide_python else 0xdbff) )
         self.assertEqual( self.decode_stats( u'"\U0010ffff"' ).max_codepoint, (0x10ffff if is_wide_python else 0xdfff) )
 
+    def testStatsKeyCache(self):
+        doc = '[{"a":1,"b\\n":2},{"a":3,"b\\n":4},{a:5}]'
+        self.assertEqual( self.decode_stats( doc ).num_key_cache_hits, 2 )
+        self.assertEqual( self.decode_stats( doc ).num_key_cache_misses, 2 )
+        self.assertEqual( self.decode_stats( doc ).num_strings, 4 )
+        self.assertEqual( self.decode_stats( doc, key_cache_size=0 ).num_key_cache_hits, 0 )
+
     def testStatsComments(self):
         self.assertEqual( self.decode_stats( 'true' ).num_comments, 0 )
         self.assertEqual( self.decode_stats( '/**/true' ).num_comments, 1 )